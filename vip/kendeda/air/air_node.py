@@ -22,6 +22,7 @@ try:
 	from sgp30 import sgp 
 	# import backend.dbutil as influx
 	import backend.influx_cloud as influx
+	import backend.raw_archive as raw_archive
 except ImportError:
 	print("[air_node] ImportError caught")
 	# sys.path.append(os.path.join(os.environ['HOME'], 'air'))
@@ -35,6 +36,7 @@ except ImportError:
 	from sgp30 import sgp 
 	# import backend.dbutil as influx
 	import backend.influx_cloud as influx
+	import backend.raw_archive as raw_archive
 	
 
 #------------------------------------------------------------------------------
@@ -88,6 +90,8 @@ else:
 sgp_sensor = None
 try:
 	sgp_sensor = sgp.SGP30(i2c)
+	if util.SGP_SERVICE:
+		sgp_sensor.start_service(util.SGP_BASELINE_FILE) 	## Measures at 1 Hz from here on, restoring any checkpointed baselines
 	if bme_sensor is not None:
 		sgp_sensor.set_iaq_humidity(bme_sensor.get_absolute_humidity())
 	print(f"[{__file__}] SGP30 enabled.")
@@ -353,6 +357,9 @@ def Full_Test_OPC_USB():
 				ox_ppm = ox_sensor.ppm
 
 			pm = opc_n2.pm()
+			if pm is None: 		## OPC-N2 still warming up (or faulted); no PM reading yet
+				time.sleep(util.MEASUREMENT_INTERVAL)
+				continue
 			pm1 = pm['PM1']
 			pm25 = pm['PM2.5']
 			pm10 = pm['PM10']
@@ -475,11 +482,14 @@ def Full_Test_OPC_GPIO():
 				ox_ppm = ox_sensor.ppm
 
 			pm = opc_n2.pm()
-			if any(pm_val < 0 for pm_val in list(pm.values())):
+			if pm is not None and any(pm_val < 0 for pm_val in list(pm.values())):
 				## Account for any potential intialization error for the OPC-N2
 				opc_n2.on()
 				time.sleep(1)
 				pm = opc_n2.pm()
+			if pm is None: 		## OPC-N2 still warming up (or faulted); no PM reading yet
+				time.sleep(util.MEASUREMENT_INTERVAL)
+				continue
 			pm1 = pm['PM1'] if pm['PM1'] >= 0 else 0.0000
 			pm25 = pm['PM2.5'] if pm['PM2.5'] >= 0 else 0.0000
 			pm10 = pm['PM10'] if pm['PM10'] >= 0 else 0.0000
@@ -507,15 +517,17 @@ def Full_Test_OPC_GPIO():
 				# payload.update({ influx.MeasurementTypes.tvoc: voc })
 				# db.queue_measurement(influx.MeasurementTypes.tvoc, voc)
 				# db.queue_data_line({ influx.MeasurementTypes.tvoc: voc })
-				if db:
+				if db and voc is not None:
 					db.queue_data_point({ influx.MeasurementTypes.tvoc: voc })
+				voc = float('nan') if voc is None else voc 	## SGP30 service without a measurement yet
 
 				if util.INCLUDE_ECO2:  # and sgp is not None:
 					eco2 = sgp_sensor.get_eco2()
 					# db.queue_measurement(influx.MeasurementTypes.eco2, eco2)
 					# db.queue_data_line({ influx.MeasurementTypes.eco2: eco2 })
-					if db:
+					if db and eco2 is not None:
 						db.queue_data_point({ influx.MeasurementTypes.eco2: eco2 })
+					eco2 = float('nan') if eco2 is None else eco2
 
 					if util.SHOW_DATETIME:
 						print(data_str.format(temp, humid, voc, eco2, co_ppm, no2_ppm, ox_ppm, pm1, pm25, pm10) + '  [ {} ]'.format(util.get_datetime()))
@@ -609,20 +621,28 @@ def main():
 		## If the global `bme` instance exists, use `bme.get_temperature`
 		## Elif our co2_sensor (the K33) is hooked up, use `co2_sensor.read_temp`
 		## Else, use `board_temperature` from util.py
+		## The K33's CO2, temperature & RH all come from one shared read_all() frame per measurement cycle
+		def k33_co2():
+			return co2_sensor.read_all(max_age=k33.SHARED_READ_AGE)[0]
+
+		def k33_temp():
+			return co2_sensor.read_all(max_age=k33.SHARED_READ_AGE)[1]
+
+		def k33_rh():
+			return co2_sensor.read_all(max_age=k33.SHARED_READ_AGE)[2]
+
 		if bme_sensor is not None:
 			# get_temperature = bme_sensor.get_temperature
 			def get_temperature():
 				bme_temp = bme_sensor.get_temperature()
-				k33_temp = co2_sensor.read_temp()
-				return round(((bme_temp + k33_temp) / 2), 2)
+				return round(((bme_temp + k33_temp()) / 2), 2)
 
 			def get_humidity():
 				bme_rh = bme_sensor.get_humidity()
-				k33_rh = co2_sensor.read_rh()
-				return round(((bme_rh + k33_rh) / 2), 2)
+				return round(((bme_rh + k33_rh()) / 2), 2)
 		else:
-			get_temperature = co2_sensor.read_temp 	## NOTE: Experimentally, the K33 temperature reading appears more accurate than the BME680's!
-			get_humidity = co2_sensor.read_rh
+			get_temperature = k33_temp 	## NOTE: Experimentally, the K33 temperature reading appears more accurate than the BME680's!
+			get_humidity = k33_rh
 		# else:
 		# 	get_temperature = util.board_temperature
 		## ^ NOTE: Do NOT use board temperature!! It is unreliable (much hotter than what the sensors are exposed to)
@@ -638,7 +658,10 @@ def main():
 		co_op2_pin = 1 	## AE: Yellow wire from Molex connector --> channel A1 of first ADC breakout
 		co_op1 = analog_in.AnalogIn(adc0, co_op1_pin)
 		co_op2 = analog_in.AnalogIn(adc0, co_op2_pin)
-		co_sensor = isb.CO(co_op1, co_op2, serial=co_serial, temperature_function=get_temperature)
+		co_diff = analog_in.AnalogIn(adc0, co_op1_pin, co_op2_pin) if util.ISB_DIFFERENTIAL else None
+		co_archive = raw_archive.RawArchive(co_serial) if util.ARCHIVE_RAW_ISB else None
+		co_sensor = isb.CO(co_op1, co_op2, serial=co_serial, temperature_function=get_temperature, 
+								raw_archive=co_archive, diff_channel=co_diff)
 		# isb_co_func = co_sensor.get_ppm 
 		print(f"[{__file__}] CO-B4 enabled.")
 
@@ -648,7 +671,10 @@ def main():
 		no2_op2_pin = 3  ## AE: Yellow wire from Molex connector --> channel A3 of first ADC breakout
 		no2_op1 = analog_in.AnalogIn(adc0, no2_op1_pin)
 		no2_op2 = analog_in.AnalogIn(adc0, no2_op2_pin)
-		no2_sensor = isb.NO2(no2_op1, no2_op2, serial=no2_serial, temperature_function=get_temperature)
+		no2_diff = analog_in.AnalogIn(adc0, no2_op1_pin, no2_op2_pin) if util.ISB_DIFFERENTIAL else None
+		no2_archive = raw_archive.RawArchive(no2_serial) if util.ARCHIVE_RAW_ISB else None
+		no2_sensor = isb.NO2(no2_op1, no2_op2, serial=no2_serial, temperature_function=get_temperature, 
+								raw_archive=no2_archive, diff_channel=no2_diff)
 		# isb_no2_func = no2_sensor.get_ppm 
 		# function_map[influx.MeasurementTypes.no2] = isb_no2_func
 		print(f"[{__file__}] NO2-B43F enabled.")
@@ -659,7 +685,10 @@ def main():
 		ox_op2_pin = 1 	## AE: Yellow wire from Molex connector --> channel A1 of second ADC breakout
 		ox_op1 = analog_in.AnalogIn(adc1, ox_op1_pin)
 		ox_op2 = analog_in.AnalogIn(adc1, ox_op2_pin)
-		ox_sensor = isb.OX(ox_op1, ox_op2, serial=ox_serial, temperature_function=get_temperature)
+		ox_diff = analog_in.AnalogIn(adc1, ox_op1_pin, ox_op2_pin) if util.ISB_DIFFERENTIAL else None
+		ox_archive = raw_archive.RawArchive(ox_serial) if util.ARCHIVE_RAW_ISB else None
+		ox_sensor = isb.OX(ox_op1, ox_op2, serial=ox_serial, temperature_function=get_temperature, 
+								raw_archive=ox_archive, diff_channel=ox_diff)
 		# isb_ox_func = ox_sensor.get_ppm 
 		# function_map[influx.MeasurementTypes.ox] = isb_ox_func
 		if util.HAVE_NO2_AND_OX:   ## Obviously true in this scenario
@@ -703,6 +732,9 @@ def main():
 			press = owm.get_sea_level_pressure()
 			sgp_sensor.set_iaq_humidity(util.rh_to_abs_humidity(rh, temp, press))
 			print(f"[{__file__}] SGP30 re-enabled.")
+
+		## Pressure for the SGP30's per-cycle humidity compensation when there is no BME680
+		sgp_press = owm.get_sea_level_pressure() if (sgp_sensor is not None and bme_sensor is None) else None
 		
 		# sgp_tvoc_func = sgp_sensor.get_tvoc if (sgp_sensor is not None and util.INCLUDE_VOC) else None
 		# sgp_eco2_func = sgp_sensor.get_eco2 if (sgp_sensor is not None and util.INCLUDE_ECO2) else None
@@ -712,7 +744,7 @@ def main():
 				influx.MeasurementTypes.temp: get_temperature,
 				influx.MeasurementTypes.rh:   get_humidity,
 				influx.MeasurementTypes.co:   get_avg_co,
-				influx.MeasurementTypes.co2:  co2_sensor.read_co2,  #k33_co2_func,
+				influx.MeasurementTypes.co2:  k33_co2,  #k33_co2_func,
 				influx.MeasurementTypes.no2:  no2_sensor.get_ppm,  #isb_no2_func,
 				influx.MeasurementTypes.ox:   get_ozone,  #ox_sensor.get_ppm,  #isb_ox_func,
 				influx.MeasurementTypes.eco2: sgp_sensor.get_eco2 if (sgp_sensor is not None and util.INCLUDE_ECO2) else None,   #sgp_eco2_func
@@ -759,10 +791,19 @@ def main():
 				for sensor_type in function_map:
 					if function_map[sensor_type] is not None:
 						sensor_reading = function_map[sensor_type]()
+						if sensor_reading is None: 	## e.g., the SGP30 service has no measurement yet
+							disp_str += f"\n\t{sensor_type.name.upper():5} =  {'n/a':^10} ({units_map[sensor_type]})"
+							continue
 						payload[sensor_type] = sensor_reading
 						disp_str += f"\n\t{sensor_type.name.upper():5} =  {sensor_reading:^10.4f} ({units_map[sensor_type]})"
 						time.sleep(0.1)
 
+				## Keep the SGP30's humidity compensation current (its service applies it before its next measurement)
+				if sgp_sensor is not None and sgp_sensor.service is not None:
+					press = bme_sensor.get_pressure() if bme_sensor is not None else sgp_press
+					rh, temp = payload[influx.MeasurementTypes.rh], payload[influx.MeasurementTypes.temp]
+					sgp_sensor.set_iaq_humidity(util.rh_to_abs_humidity(rh, temp, press))
+
 				## TODO: Print sensor readings to the console
 				"""
 				if util.SHOW_DATETIME:
@@ -776,6 +817,11 @@ def main():
 				## Publish sensor measurements to the database
 				if db is not None and not util.DRY_RUN:
 					db.queue_data_point(payload)
+					if util.PUBLISH_PM_HISTOGRAM:
+						## Same OPC snapshot as the PM values above, so the write costs one extra point
+						hist_fields = opc_sensor.histogram_fields(rh=payload.get(influx.MeasurementTypes.rh))
+						if hist_fields is not None:
+							db.queue_fields(influx.MeasurementTypes.pm_hist, hist_fields)
 					success = db.flush()
 					if not success:
 						print("[{}}] Write to InfluxDB failed!  ({})".format(__file__, util.get_datetime()))
@@ -786,6 +832,9 @@ def main():
 				if pump_relay is not None:
 					pump_relay.off()
 					print(f"[{__file__}] Air pump disabled.")
+				for archive in (co_archive, no2_archive, ox_archive):
+					if archive is not None:
+						archive.close()
 				opc_sensor.off()
 				print(f"[{__file__}] OPC-N2 disabled.")
 				die(exit=False)
@@ -798,6 +847,8 @@ def main():
 #------------------------------------------------------------------------------
 
 def die(msg="DEAD", exit=True):
+	if sgp_sensor is not None:
+		sgp_sensor.stop_service() 	## Also checkpoints the SGP30's baselines
 	if db is not None:
 		db.kill()
 	death_text = "\n[air_node::die] {} @ {}".format(msg, util.get_datetime())
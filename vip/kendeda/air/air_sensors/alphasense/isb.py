@@ -2,6 +2,9 @@ import numpy as np
 # from util.util import *
 from util import util
 
+## Full-scale input ranges (V) of the ADS1x15 PGA for each gain setting
+_ADS1X15_PGA_RANGE = {2 / 3: 6.144, 1: 4.096, 2: 2.048, 4: 1.024, 8: 0.512, 16: 0.256}
+
 #------------------------------------------------------------------------------
 
 ## Base class for Alphasense B4 sensors outfitted with an ISB (Individual Sensor Board)
@@ -15,13 +18,36 @@ class ISB(object):
 	WeAux = WeVo - AuxVo;   // corrects for drift in Aux and We probes ie OP1 and OP2
 	ppm2 = WeAux/sens;    	// aux corrected ppm reading
 	"""
-	def __init__(self, op1, op2, we_offset, ae_offset, sensitivty, temperature_function):
+	## Alphasense nT table for the sensor type, defined by each subclass:
+	_xs = None 	## Temperature points (*C)
+	_ys = None 	## Temp Coefficient Factors
+
+	def __init_subclass__(cls, **kwargs):
+		## The nT table is static, so fit its best-fit line & precompute its
+		## interpolation segments just once per sensor type (not on every read)
+		super().__init_subclass__(**kwargs)
+		cls._nT_m, cls._nT_b = util.best_fit_slope_and_intercept(cls._xs, cls._ys)
+		cls._nT_segments = util.piecewise_linear_segments(cls._xs, cls._ys)
+
+	def __init__(self, op1, op2, we_offset, ae_offset, sensitivty, temperature_function, interpolate_nT=None, raw_archive=None,
+										diff_channel=None, ae_refresh=None):
 		self.op1 = op1 	## ADC voltage input channel for Working Electrode 
 		self.op2 = op2 	## ADC voltage input channel for Auxiliary Electrode
 		self.weVo = we_offset
 		self.auxVo = ae_offset
 		self.sens = sensitivty
 		self.get_temp = temperature_function
+		## If True, nT is linearly interpolated between the table's points instead of using the best-fit line
+		self.interpolate_nT = interpolate_nT if interpolate_nT is not None else util.INTERPOLATE_NT
+		## Optional backend.raw_archive.RawArchive for recording the raw signals behind each ppm reading
+		self.raw_archive = raw_archive
+		self._temp = None 	## Temperature used for the last nT (None if uncompensated)
+		## Optional differential ADC channel (OP1 - OP2) for reading WE - AE in a single conversion;
+		## the AE output itself is then only re-read once every `ae_refresh` readings for the nT term
+		self.diff_channel = diff_channel
+		self.ae_refresh = ae_refresh if ae_refresh is not None else util.ISB_AE_REFRESH
+		self._ae = None
+		self._diff_reads = 0
 
 	@property
 	def we_voltage(self):
@@ -39,14 +65,81 @@ class ISB(object):
 	def ae_mv(self):
 		return float(self.aux_voltage * 1000.0)
 
-	def _get_nT(self, xs, ys):
+	## Returns the raw ADC code & its voltage (mV) from a single conversion on an AnalogIn channel
+	@staticmethod
+	def _read_code_and_mv(chan):
+		code = chan.value
+		return code, code * _ADS1X15_PGA_RANGE[chan._ads.gain] / 32.767
+
+	def _sample(self):
+		""" Measure the raw WE & AE outputs (mV) for one ppm reading.
+		If a raw archive is attached, their ADC codes are kept for `_archive_sample` as well.
+		"""
+		if self.diff_channel is not None:
+			return self._sample_differential()
+		if self.raw_archive is None:
+			return self.we_mv, self.ae_mv
+		we_code, we_mv = self._read_code_and_mv(self.op1)
+		ae_code, ae_mv = self._read_code_and_mv(self.op2)
+		self._raw = (we_mv, ae_mv, we_code, ae_code)
+		return we_mv, ae_mv
+
+	def _sample_differential(self):
+		## WE = (WE - AE) + AE, with the slowly-varying AE output cached between refreshes
+		if self._ae is None or self._diff_reads >= self.ae_refresh:
+			self._ae = self._read_code_and_mv(self.op2)
+			self._diff_reads = 0
+		self._diff_reads += 1
+		diff_code, diff_mv = self._read_code_and_mv(self.diff_channel)
+		ae_code, ae_mv = self._ae
+		we_mv = diff_mv + ae_mv
+		self._raw = (we_mv, ae_mv, diff_code, ae_code) 	## (WE code is the differential one in this mode)
+		return we_mv, ae_mv
+
+	def _archive_sample(self):
+		if self.raw_archive is not None:
+			self.raw_archive.append(*self._raw, temp=self._temp)
+
+	def _get_nT(self):
 		y = 1.0
+		self._temp = None
 		if util.USE_TEMP_COEFFICIENT and self.get_temp is not None: 	# and bme is not None:
 			x = self.get_temp()   
-			m, b = util.best_fit_slope_and_intercept(xs, ys)
-			y = float(m*x + b)
+			self._temp = x
+			if self.interpolate_nT:
+				y = util.interpolate_segments(x, self._nT_segments)
+			else:
+				y = self._nT_m*x + self._nT_b
 		return y 
 
+	## For nT, the temperature dependence coefficient (uses best-fit line, or table interpolation)
+	@property
+	def nT(self):
+		self._nT = self._get_nT()
+		return self._nT
+
+	## Vectorized nT for an array of temperatures (*C), using the same model as `nT`
+	def nT_array(self, temps):
+		temps = np.asarray(temps, dtype=np.dtype(float))
+		if self.interpolate_nT:
+			return np.interp(temps, self._xs, self._ys) 	## Clamps to the table's end points, like `nT`
+		return self._nT_m*temps + self._nT_b
+
+	def ppm_array(self, we_mv, ae_mv, temps=None):
+		""" Batch version of `ppm`: converts arrays of raw WE & AE outputs (mV) -- and optionally
+		the temperatures (*C) they were sampled at -- to gas concentrations (ppm) in one vectorized pass.
+		If `temps` is None, no temperature compensation is applied (nT = 1), as for any NaN temperatures.
+		"""
+		we_mv = np.asarray(we_mv, dtype=np.dtype(float))
+		ae_mv = np.asarray(ae_mv, dtype=np.dtype(float))
+		if temps is None:
+			nT = 1.0
+		else:
+			temps = np.asarray(temps, dtype=np.dtype(float))
+			nT = np.where(np.isnan(temps), 1.0, self.nT_array(temps))
+		weC = (we_mv - self.weVo) - (nT * (ae_mv - self.auxVo))
+		return np.abs(weC / self.sens)
+
 	def get_ppm(self):
 		return round(self.ppm, 4) 
 
@@ -67,12 +160,13 @@ class CO(ISB):
 	_ys = np.array(list(CO_n.values()), dtype=np.dtype(float))
 
 	def __init__(self, op1, op2, serial=None, we_offset=None, ae_offset=None, 
-									sensitivty=None, temperature_function=None):
+									sensitivty=None, temperature_function=None, interpolate_nT=None, raw_archive=None,
+									diff_channel=None, ae_refresh=None):
 		super().__init__(op1, op2,
 						we_offset if we_offset is not None else CO.WE_ZERO_OFFSET,
 						ae_offset if ae_offset is not None else CO.AUX_ZERO_OFFSET,
 						sensitivty if sensitivty is not None else CO.SENSITIVITY,
-						temperature_function)
+						temperature_function, interpolate_nT, raw_archive, diff_channel, ae_refresh)
 		if serial is not None:
 			## For a specific sensor (identified by its serial # on label),
 			## if that ISB serial #'s constant values (i.e., offsets, sensitivity)
@@ -87,12 +181,6 @@ class CO(ISB):
 				print("[CO-B4] Given serial # not recognized: " + serial)
 		self.serial = serial
 
-	## For nT, the temperature dependence coefficient (uses best-fit line)
-	@property
-	def nT(self):
-		self._nT = self._get_nT(CO._xs, CO._ys)
-		return self._nT
-	
 	## Get the ambient Carbon Monoxide gas concentration in parts per million
 	@property
 	def ppm(self):
@@ -100,8 +188,9 @@ class CO(ISB):
 		##    These will be the 'we_mv' and 'ae_mv' respectively.
 		## 2. Subtract the WE electronic offset ('weVo') from the raw WE output. 
 		##    Similarly, subtract the AE electronic offset ('auxVo') from the raw AE output.
-		weU = self.we_mv - self.weVo 
-		aeU = self.ae_mv - self.auxVo
+		we_mv, ae_mv = self._sample()
+		weU = we_mv - self.weVo 
+		aeU = ae_mv - self.auxVo
 		## 3. Determine the coefficient 'nT' using the table from above.
 		## 4. Use this equation to get the corrected WE output:  
 		##    	weC = (we_mv - weVo) - (nT * (ae_mv - auxVo))
@@ -109,6 +198,7 @@ class CO(ISB):
 		## 5. Divide the WE corrected output by the sensitivity to acquire the gas concentration.
 		self._ppm = weC / self.sens
 		self._ppm = abs(self._ppm)
+		self._archive_sample()
 		return self._ppm
 	
 #------------------------------------------------------------------------------
@@ -127,12 +217,13 @@ class NO2(ISB):
 	_ys = np.array(list(NO2_n.values()), dtype=np.dtype(float))
 
 	def __init__(self, op1, op2, serial=None, we_offset=None, ae_offset=None, 
-									sensitivty=None, temperature_function=None):
+									sensitivty=None, temperature_function=None, interpolate_nT=None, raw_archive=None,
+									diff_channel=None, ae_refresh=None):
 		super().__init__(op1, op2,
 						we_offset if we_offset is not None else NO2.WE_ZERO_OFFSET,
 						ae_offset if ae_offset is not None else NO2.AUX_ZERO_OFFSET,
 						sensitivty if sensitivty is not None else NO2.SENSITIVITY,
-						temperature_function)
+						temperature_function, interpolate_nT, raw_archive, diff_channel, ae_refresh)
 		if serial is not None:
 			if serial in isb_serials:
 				consts = isb_serials[serial]
@@ -144,19 +235,15 @@ class NO2(ISB):
 				print("[NO2-B43F] Given serial # not recognized: " + serial)
 		self.serial = serial
 
-	@property
-	def nT(self):
-		# self._nT = ISB._get_nT(NO2._xs, NO2._ys)
-		self._nT = self._get_nT(NO2._xs, NO2._ys)
-		return self._nT
-	
 	@property
 	def ppm(self):
-		weU = self.we_mv - self.weVo 
-		aeU = self.ae_mv - self.auxVo
+		we_mv, ae_mv = self._sample()
+		weU = we_mv - self.weVo 
+		aeU = ae_mv - self.auxVo
 		weC = weU - (self.nT * aeU)
 		self._ppm = weC / self.sens
 		self._ppm = abs(self._ppm)
+		self._archive_sample()
 		return self._ppm
 
 #------------------------------------------------------------------------------
@@ -179,12 +266,13 @@ class OX(ISB):
 	_ys = np.array(list(OX_n.values()), dtype=np.dtype(float))
 
 	def __init__(self, op1, op2, serial=None, we_offset=None, ae_offset=None, 
-									sensitivty=None, temperature_function=None):
+									sensitivty=None, temperature_function=None, interpolate_nT=None, raw_archive=None,
+									diff_channel=None, ae_refresh=None):
 		super().__init__(op1, op2,
 						we_offset if we_offset is not None else OX.WE_ZERO_OFFSET,
 						ae_offset if ae_offset is not None else OX.AUX_ZERO_OFFSET,
 						sensitivty if sensitivty is not None else OX.SENSITIVITY,
-						temperature_function)
+						temperature_function, interpolate_nT, raw_archive, diff_channel, ae_refresh)
 		if serial is not None:
 			if serial in isb_serials:
 				consts = isb_serials[serial]
@@ -197,19 +285,15 @@ class OX(ISB):
 		self.serial = serial
 		self._ox_ppm = 0
 
-	@property
-	def nT(self):
-		# self._nT = ISB._get_nT(OX._xs, OX._ys)
-		self._nT = self._get_nT(OX._xs, OX._ys)
-		return self._nT
-	
 	@property
 	def ppm(self):
-		weU = self.we_mv - self.weVo 
-		aeU = self.ae_mv - self.auxVo
+		we_mv, ae_mv = self._sample()
+		weU = we_mv - self.weVo 
+		aeU = ae_mv - self.auxVo
 		weC = weU - (self.nT * aeU)
 		self._ppm = weC / self.sens
 		self._ppm = abs(self._ppm)
+		self._archive_sample()
 		return self._ppm
 
 	## Measures Ozone + Nitrogen Dioxide --> Ozone = (full reading - Nitrogen Dioxide)
@@ -220,6 +304,10 @@ class OX(ISB):
 			self._ox_ppm = abs(self._ox_ppm)
 		return self._ox_ppm
 
+	## Batch version of `get_oxide_ppm_only`, for arrays of OX outputs & the matching NO2 concentrations
+	def oxide_ppm_only_array(self, we_mv, ae_mv, no2_ppm, temps=None):
+		return np.abs(self.ppm_array(we_mv, ae_mv, temps) - np.asarray(no2_ppm, dtype=np.dtype(float)))
+
 #------------------------------------------------------------------------------
 
 """
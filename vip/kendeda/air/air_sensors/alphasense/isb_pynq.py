@@ -1,6 +1,6 @@
 import numpy as np
 # from util.util import *
-from statistics import mean
+from bisect import bisect_right
 # from pynq import Overlay 
 from pynq.pl import PL
 from pynq.overlays.base import BaseOverlay
@@ -17,10 +17,35 @@ from pynq.lib.arduino import Arduino_Analog, ARDUINO_GROVE_A1, ARDUINO_GROVE_A2,
 ##-----------------------------------------------------------------------------
 
 def best_fit_slope_and_intercept(xs, ys):
-	m = (float(((mean(xs)*mean(ys)) - mean(xs*ys))) / float(((mean(xs)*mean(xs)) - mean(xs*xs))))
-	b = mean(ys) - m*mean(xs)
+	## Least-squares line through the points (xs, ys), computed about the means for accuracy
+	xs = [float(x) for x in xs]
+	ys = [float(y) for y in ys]
+	x_bar = sum(xs) / len(xs)
+	y_bar = sum(ys) / len(ys)
+	m = sum((x - x_bar) * (y - y_bar) for x, y in zip(xs, ys)) / sum((x - x_bar) ** 2 for x in xs)
+	b = y_bar - m*x_bar
 	return m, b
 
+
+def piecewise_linear_segments(xs, ys):
+	## Per-segment (xs, slopes, intercepts) for linearly interpolating the table (xs, ys)
+	xs = tuple(float(x) for x in xs)
+	ys = tuple(float(y) for y in ys)
+	slopes = tuple((ys[i+1] - ys[i]) / (xs[i+1] - xs[i]) for i in range(len(xs) - 1))
+	intercepts = tuple(ys[i] - slopes[i]*xs[i] for i in range(len(xs) - 1))
+	return xs, slopes, intercepts
+
+
+def interpolate_segments(x, segments):
+	## Evaluate a table precomputed by `piecewise_linear_segments` at x (clamped to the table's end points)
+	xs, slopes, intercepts = segments
+	if x <= xs[0]:
+		x = xs[0]
+	elif x >= xs[-1]:
+		x = xs[-1]
+	i = min(bisect_right(xs, x), len(slopes)) - 1
+	return slopes[i]*x + intercepts[i]
+
 #------------------------------------------------------------------------------
 
 """
@@ -115,7 +140,18 @@ class ISB(object):
 	WeAux = WeVo - AuxVo;   // corrects for drift in Aux and We probes ie OP1 and OP2
 	ppm2 = WeAux/sens;    	// aux corrected ppm reading
 	"""
-	def __init__(self, we_pin, ae_pin, we_offset, ae_offset, sensitivty, bme_sensor=None):
+	## Alphasense nT table for the sensor type, defined by each subclass:
+	_xs = None 	## Temperature points (*C)
+	_ys = None 	## Temp Coefficient Factors
+
+	def __init_subclass__(cls, **kwargs):
+		## The nT table is static, so fit its best-fit line & precompute its
+		## interpolation segments just once per sensor type (not on every read)
+		super().__init_subclass__(**kwargs)
+		cls._nT_m, cls._nT_b = best_fit_slope_and_intercept(cls._xs, cls._ys)
+		cls._nT_segments = piecewise_linear_segments(cls._xs, cls._ys)
+
+	def __init__(self, we_pin, ae_pin, we_offset, ae_offset, sensitivty, bme_sensor=None, interpolate_nT=False):
 		self.we_pin = we_pin 	## Analog pin number for Working Electrode (0 ... 5)
 		self.ae_pin = ae_pin 	## Analog pin number for Auxiliary Electrode (0 ... 5)
 		self.weVo = we_offset
@@ -123,6 +159,8 @@ class ISB(object):
 		self.sens = sensitivty
 		self.bme_sensor = bme_sensor
 		self.use_temp_coefficient = self.bme_sensor is not None
+		## If True, nT is linearly interpolated between the table's points instead of using the best-fit line
+		self.interpolate_nT = interpolate_nT
 
 		base_needs_download = not 'base.bit' in PL.bitfile_name.split('/')
 		print(f'{__file__}\t{"~Downloading base overlay~" if base_needs_download else "~Base overlay already loaded~"}')
@@ -178,16 +216,44 @@ class ISB(object):
 	def ae_mv(self):
 		return float(self.aux_voltage * 1000.0)
 
-	# @classmethod
-	# def _get_nT(cls, xs, ys):
-	def _get_nT(self, xs, ys):
+	def _get_nT(self):
 		y = 1.0
 		if self.use_temp_coefficient: 	# and bme is not None:
 			x = self.bme_sensor.get_temperature()
-			m, b = best_fit_slope_and_intercept(xs, ys)
-			y = float(m*x + b)
+			if self.interpolate_nT:
+				y = interpolate_segments(x, self._nT_segments)
+			else:
+				y = self._nT_m*x + self._nT_b
 		return y 
 
+	## For nT, the temperature dependence coefficient (uses best-fit line, or table interpolation)
+	@property
+	def nT(self):
+		self._nT = self._get_nT()
+		return self._nT
+
+	## Vectorized nT for an array of temperatures (*C), using the same model as `nT`
+	def nT_array(self, temps):
+		temps = np.asarray(temps, dtype=np.dtype(float))
+		if self.interpolate_nT:
+			return np.interp(temps, self._xs, self._ys) 	## Clamps to the table's end points, like `nT`
+		return self._nT_m*temps + self._nT_b
+
+	def ppm_array(self, we_mv, ae_mv, temps=None):
+		""" Batch version of `ppm`: converts arrays of raw WE & AE outputs (mV) -- and optionally
+		the temperatures (*C) they were sampled at -- to gas concentrations (ppm) in one vectorized pass.
+		If `temps` is None, no temperature compensation is applied (nT = 1), as for any NaN temperatures.
+		"""
+		we_mv = np.asarray(we_mv, dtype=np.dtype(float))
+		ae_mv = np.asarray(ae_mv, dtype=np.dtype(float))
+		if temps is None:
+			nT = 1.0
+		else:
+			temps = np.asarray(temps, dtype=np.dtype(float))
+			nT = np.where(np.isnan(temps), 1.0, self.nT_array(temps))
+		weC = (we_mv - self.weVo) - (nT * (ae_mv - self.auxVo))
+		return np.abs(weC / self.sens)
+
 #------------------------------------------------------------------------------
 
 ## Subclass for Alphasense CO-B4 Carbon Monoxide sensors
@@ -204,12 +270,12 @@ class CO(ISB):
 	## Y-axis values are Temp Coefficient Factors
 	_ys = np.array(list(CO_n.values()), dtype=np.dtype(float))
 
-	def __init__(self, op1, op2, serial=None, we_offset=None, ae_offset=None, sensitivty=None, bme_sensor=None):
+	def __init__(self, op1, op2, serial=None, we_offset=None, ae_offset=None, sensitivty=None, bme_sensor=None, interpolate_nT=False):
 		super().__init__(op1, op2,
 						we_offset if we_offset is not None else CO.WE_ZERO_OFFSET,
 						ae_offset if ae_offset is not None else CO.AUX_ZERO_OFFSET,
 						sensitivty if sensitivty is not None else CO.SENSITIVITY,
-						bme_sensor)
+						bme_sensor, interpolate_nT)
 		if serial is not None:
 			## For a specific sensor (identified by its serial # on label),
 			## if that ISB serial #'s constant values (i.e., offsets, sensitivity)
@@ -224,13 +290,6 @@ class CO(ISB):
 				print("[CO-B4] Given serial # not recognized: " + serial)
 		self.serial = serial
 
-	## For nT, the temperature dependence coefficient (uses best-fit line)
-	@property
-	def nT(self):
-		# self._nT = ISB._get_nT(CO._xs, CO._ys)
-		self._nT = self._get_nT(CO._xs, CO._ys)
-		return self._nT
-	
 	## Get the ambient Carbon Monoxide gas concentration in parts per million
 	@property
 	def ppm(self):
@@ -264,11 +323,12 @@ class NO2(ISB):
 	## Y-axis values are Temp Coefficient Factors
 	_ys = np.array(list(NO2_n.values()), dtype=np.dtype(float))
 
-	def __init__(self, op1, op2, serial=None, we_offset=None, ae_offset=None, sensitivty=None):
+	def __init__(self, op1, op2, serial=None, we_offset=None, ae_offset=None, sensitivty=None, bme_sensor=None, interpolate_nT=False):
 		super().__init__(op1, op2,
 						we_offset if we_offset is not None else NO2.WE_ZERO_OFFSET,
 						ae_offset if ae_offset is not None else NO2.AUX_ZERO_OFFSET,
-						sensitivty if sensitivty is not None else NO2.SENSITIVITY)
+						sensitivty if sensitivty is not None else NO2.SENSITIVITY,
+						bme_sensor, interpolate_nT)
 		if serial is not None:
 			if serial in isb_serials:
 				consts = isb_serials[serial]
@@ -280,12 +340,6 @@ class NO2(ISB):
 				print("[NO2-B43F] Given serial # not recognized: " + serial)
 		self.serial = serial
 
-	@property
-	def nT(self):
-		# self._nT = ISB._get_nT(NO2._xs, NO2._ys)
-		self._nT = self._get_nT(NO2._xs, NO2._ys)
-		return self._nT
-	
 	@property
 	def ppm(self):
 		weU = self.we_mv - self.weVo 
@@ -314,11 +368,12 @@ class OX(ISB):
 	## Y-axis values are Temp Coefficient Factors
 	_ys = np.array(list(OX_n.values()), dtype=np.dtype(float))
 
-	def __init__(self, op1, op2, serial=None, we_offset=None, ae_offset=None, sensitivty=None):
+	def __init__(self, op1, op2, serial=None, we_offset=None, ae_offset=None, sensitivty=None, bme_sensor=None, interpolate_nT=False):
 		super().__init__(op1, op2,
 						we_offset if we_offset is not None else OX.WE_ZERO_OFFSET,
 						ae_offset if ae_offset is not None else OX.AUX_ZERO_OFFSET,
-						sensitivty if sensitivty is not None else OX.SENSITIVITY)
+						sensitivty if sensitivty is not None else OX.SENSITIVITY,
+						bme_sensor, interpolate_nT)
 		if serial is not None:
 			if serial in isb_serials:
 				consts = isb_serials[serial]
@@ -331,12 +386,6 @@ class OX(ISB):
 		self.serial = serial
 		self._ox_ppm = 0
 
-	@property
-	def nT(self):
-		# self._nT = ISB._get_nT(OX._xs, OX._ys)
-		self._nT = self._get_nT(OX._xs, OX._ys)
-		return self._nT
-	
 	@property
 	def ppm(self):
 		weU = self.we_mv - self.weVo 
@@ -354,6 +403,10 @@ class OX(ISB):
 			self._ox_ppm = abs(self._ox_ppm)
 		return self._ox_ppm
 
+	## Batch version of `get_oxide_ppm_only`, for arrays of OX outputs & the matching NO2 concentrations
+	def oxide_ppm_only_array(self, we_mv, ae_mv, no2_ppm, temps=None):
+		return np.abs(self.ppm_array(we_mv, ae_mv, temps) - np.asarray(no2_ppm, dtype=np.dtype(float)))
+
 #------------------------------------------------------------------------------
 
 """
@@ -1,14 +1,34 @@
 import adafruit_bme680
 import math
+import time
+from collections import namedtuple
 from util.util import rh_to_abs_humidity 
 
 # RV = 461.5  ## specific gas constant for water vapor
 
+## Measurement profiles, each with its own cadence (seconds between measurements):
+##   PROFILE_THP  -  temperature, pressure & humidity only: gas heater off, so fast with negligible
+##                   self-heating (for frequent use, e.g., temperature/humidity compensation)
+##   PROFILE_GAS  -  the above plus the gas resistance: runs the heater (~150 ms longer & heats the die)
+PROFILE_THP = 'thp'
+PROFILE_GAS = 'gas'
+THP_INTERVAL = 1
+GAS_INTERVAL = 60
+
+## The Adafruit driver always sets run_gas, but only writes the heater duration (gas_wait_0) once at
+## start-up, so the THP profile switches the heater off by setting a heater duration of 0 ms
+_GAS_WAIT_0 = 0x64
+GAS_WAIT_ON = 0x65 		## 37 ms x 4 = 148 ms (the driver's default)
+GAS_WAIT_OFF = 0x00
+
+## One measurement: temperature (C), pressure (hPa), humidity (%RH) & gas resistance (ohms; None for PROFILE_THP)
+BME680Sample = namedtuple('BME680Sample', ['temperature', 'pressure', 'humidity', 'gas'])
+
 class BME680():
 	""" Wrapper class for an Adafruit BME680 sensor breakout. """
 	I2C_ADDR = 0x77
 
-	def __init__(self, bus, use_i2c=True, stabilize_humidity=False):
+	def __init__(self, bus, use_i2c=True, stabilize_humidity=False, thp_interval=THP_INTERVAL, gas_interval=GAS_INTERVAL):
 		""" Can use I2C or SPI to communicate with a Raspberry Pi.
 
 		Note that the internally created Adafruit_BME680 object requires that 
@@ -28,10 +48,17 @@ class BME680():
 			stabilize_humidity: Boolean, set to True to have the sensor 
 				continuously poll its relative humidity upon initialization
 				until the readings stabilize/converge
+			thp_interval: Seconds for which a measurement serves temperature,
+				pressure & humidity reads before a new (PROFILE_THP) one is taken
+			gas_interval: Seconds for which a measurement serves gas (VOC)
+				reads before a new (PROFILE_GAS) one is taken
 
 		Raises:
 			ValueError: If no connected BME680 sensor is found
 		"""
+		self.intervals = {PROFILE_THP: thp_interval, PROFILE_GAS: gas_interval}
+		self._samples = {PROFILE_THP: None, PROFILE_GAS: None} 	## (time.monotonic(), BME680Sample) per profile
+		self._heater_on = True
 		if use_i2c:
 			self.bme = adafruit_bme680.Adafruit_BME680_I2C(bus)
 		else:
@@ -48,24 +75,58 @@ class BME680():
 		from time import sleep 
 		print("[BME680] Stabilizing humidity ...")
 		prev = 100.1
-		hum = self.get_humidity()
+		hum = self.sample(PROFILE_THP).humidity
 		while hum < prev:
 			prev = hum 
 			sleep(0.5)
-			hum = self.get_humidity()
+			hum = self.sample(PROFILE_THP).humidity
 		print("[BME680] Humidity stabilized at {:4.2f}%".format(hum))
 
+	def _set_heater(self, on):
+		if on != self._heater_on:
+			self.bme._write(_GAS_WAIT_0, [GAS_WAIT_ON if on else GAS_WAIT_OFF])
+			self._heater_on = on
+
+	def sample(self, profile=PROFILE_GAS):
+		""" Returns a BME680Sample taken from a single measurement of the sensor,
+		using the given measurement profile (gas is None for PROFILE_THP).
+		"""
+		self._set_heater(profile == PROFILE_GAS)
+		self.bme._last_reading = 0 		## Force a new measurement; the reads below all share it (refresh_rate)
+		sample = BME680Sample(
+			round(self.bme.temperature, 2),
+			round(self.bme.pressure, 2),
+			round(self.bme.humidity, 2),
+			round(self.bme.gas, 2) if profile == PROFILE_GAS else None,
+		)
+		self._samples[profile] = (time.monotonic(), sample)
+		return sample
+
+	def reading(self, profile=PROFILE_THP):
+		""" Returns the latest BME680Sample satisfying `profile`, only measuring
+		when that profile's interval has passed. (A PROFILE_GAS measurement also
+		serves PROFILE_THP reads.)
+		"""
+		now = time.monotonic()
+		candidates = [self._samples[PROFILE_GAS]]
+		if profile == PROFILE_THP:
+			candidates.append(self._samples[PROFILE_THP])
+		candidates = [c for c in candidates if c is not None and now - c[0] < self.intervals[profile]]
+		if candidates:
+			return max(candidates, key=lambda c: c[0])[1]
+		return self.sample(profile)
+
 	def get_temperature(self):
 		""" Returns the compensated temperature in degrees celsius. """
-		return round(self.bme.temperature, 2) 	## Units: °C
+		return self.reading(PROFILE_THP).temperature 	## Units: °C
 
 	def get_pressure(self):
 		""" Returns the barometric pressure in hectoPascals. """
-		return round(self.bme.pressure, 2) 		## Units: hPa
+		return self.reading(PROFILE_THP).pressure 		## Units: hPa
 
 	def get_humidity(self):
 		""" Returns the current relative humidity in RH %. """
-		return round(self.bme.humidity, 2) 		## Units: %
+		return self.reading(PROFILE_THP).humidity 		## Units: %
 
 	def get_absolute_humidity(self):
 		""" Returns the current absolute humidity (in grams
@@ -102,7 +163,7 @@ class BME680():
 		The gas resistance in ohms for the sensor reading is proportional to 
 		the amount of VOC particles detected in the air.
 		"""
-		return round(self.bme.gas, 2) 			## Units: ohms	
+		return self.reading(PROFILE_GAS).gas 			## Units: ohms	
 
 	def update_sea_level_pressure(self, val):
 		if val > 0:
@@ -10,16 +10,26 @@ CS  -     [I2C] | CS   [SPI]
 
 
 import math
+import time
 
 RV = 461.5  ## specific gas constant for water vapor
 
+## Measurement profiles, each with its own cadence (seconds between measurements):
+##   PROFILE_THP  -  temperature, pressure & humidity only: gas heater off, so fast with negligible
+##                   self-heating (for frequent use, e.g., temperature/humidity compensation)
+##   PROFILE_GAS  -  the above plus the gas resistance: runs the heater (~150 ms longer & heats the die)
+PROFILE_THP = 'thp'
+PROFILE_GAS = 'gas'
+THP_INTERVAL = 1
+GAS_INTERVAL = 60
+
 class BME680():
 	""" Wrapper class for an Adafruit BME680 sensor breakout.
 	"""
 
 	I2C_ADDR = 0x77
 
-	def __init__(self, bus, use_i2c=True, stabilize_humidity=False):
+	def __init__(self, bus, use_i2c=True, stabilize_humidity=False, thp_interval=THP_INTERVAL, gas_interval=GAS_INTERVAL):
 		""" Can use I2C or SPI to communicate with a Raspberry Pi.
 
 		Note that the internally created Adafruit_BME680 object requires that 
@@ -39,14 +49,20 @@ class BME680():
 			stabilize_humidity: Boolean, set to True to have the sensor 
 				continuously poll its relative humidity upon initialization
 				until the readings stabilize/converge
+			thp_interval: Seconds for which a measurement serves temperature,
+				pressure & humidity reads before a new (PROFILE_THP) one is taken
+			gas_interval: Seconds for which a measurement serves gas (VOC)
+				reads before a new (PROFILE_GAS) one is taken
 
 		Raises:
 			ValueError: If no connected BME680 sensor is found
 		"""
+		self.intervals = {PROFILE_THP: thp_interval, PROFILE_GAS: gas_interval}
+		self._samples = {PROFILE_THP: None, PROFILE_GAS: None} 	## (time.monotonic(), BME680Sample) per profile
 		if use_i2c:
 			self.bme = Pynq_BME680_I2C(bus)
 		else:
-			self.bme = Pynq_BME680_SPI(spi, cs=0)
+			self.bme = Pynq_BME680_SPI(bus, cs=0)
 
 		## Default: A rough average of previous month's recorded air 
 		## pressure measurements in Atlanta (as of March, 2020)
@@ -59,27 +75,51 @@ class BME680():
 		from time import sleep 
 		print("[BME680] Stabilizing humidity ...")
 		prev = 100.1
-		hum = self.get_humidity()
+		hum = self.sample(PROFILE_THP).humidity
 		while hum < prev:
 			prev = hum 
 			sleep(0.5)
-			hum = self.get_humidity()
+			hum = self.sample(PROFILE_THP).humidity
 		print("[BME680] Humidity stabilized at {:4.2f}%".format(hum))
 
+	def sample(self, profile=PROFILE_GAS):
+		""" Returns a BME680Sample (temperature, pressure, humidity & gas)
+		taken from a single measurement of the sensor, using the given
+		measurement profile (gas is None for PROFILE_THP).
+		"""
+		self.bme.run_gas = (profile == PROFILE_GAS)
+		sample = self.bme.sample()
+		self._samples[profile] = (time.monotonic(), sample)
+		return sample
+
+	def reading(self, profile=PROFILE_THP):
+		""" Returns the latest BME680Sample satisfying `profile`, only measuring
+		when that profile's interval has passed. (A PROFILE_GAS measurement also
+		serves PROFILE_THP reads.)
+		"""
+		now = time.monotonic()
+		candidates = [self._samples[PROFILE_GAS]]
+		if profile == PROFILE_THP:
+			candidates.append(self._samples[PROFILE_THP])
+		candidates = [c for c in candidates if c is not None and now - c[0] < self.intervals[profile]]
+		if candidates:
+			return max(candidates, key=lambda c: c[0])[1]
+		return self.sample(profile)
+
 	def get_temperature(self):
 		""" Returns the compensated temperature in degrees celsius.
 		"""
-		return self.bme.temperature 	## Units: °C
+		return self.reading(PROFILE_THP).temperature 	## Units: °C
 
 	def get_pressure(self):
 		""" Returns the barometric pressure in hectoPascals.
 		"""
-		return self.bme.pressure 		## Units: hPa
+		return self.reading(PROFILE_THP).pressure 		## Units: hPa
 
 	def get_humidity(self):
 		""" Returns the current relative humidity in RH %.
 		"""
-		return self.bme.humidity 		## Units: %
+		return self.reading(PROFILE_THP).humidity 		## Units: %
 
 	def get_absolute_humidity(self):
 		""" Returns the current absolute humidity (in grams
@@ -87,9 +127,7 @@ class BME680():
 		humidity, temperature, and barometric pressure.
 		Source: https://planetcalc.com/2167/
 		"""
-		rh = self.bme.humidity
-		t = self.bme.temperature
-		p = self.bme.pressure
+		rh, t, p = self.get_humidity(), self.get_temperature(), self.get_pressure()
 		eW = self._saturation_vapor_pressure(p, t)
 		e = eW * (rh / 100.0)
 		ah = ((e / (t * RV)) * 10.0) * 1000 ## * 1000 to convert kg/m3 to g/m3
@@ -120,7 +158,7 @@ class BME680():
 		The gas resistance in ohms for the sensor reading is proportional to 
 		the amount of VOC particles detected in the air.
 		"""
-		return self.bme.gas 			## Units: ohms	
+		return self.reading(PROFILE_GAS).gas 			## Units: ohms	
 
 	def update_sea_level_pressure(self, val):
 		if val > 0:
@@ -178,6 +216,7 @@ Implementation Notes
 
 
 import time
+from collections import namedtuple
 
 try:
 	import struct
@@ -214,6 +253,15 @@ _BME680_SAMPLERATES = (0, 1, 2, 4, 8, 16)
 _BME680_FILTERSIZES = (0, 1, 3, 7, 15, 31, 63, 127)
 
 _BME680_RUNGAS = 0x10
+_BME680_NEW_DATA = 0x80
+_BME680_MODE_FORCED = 0x01
+
+## Measurement duration (see the BME680 datasheet, section 3.3 & Bosch's bme680_get_profile_dur()):
+## 1963 us per oversampling cycle, 477 us for each of the 4 T/P/H switches & 5 gas steps, 500 us to wake up
+_BME680_CYCLE_US = 1963
+_BME680_OVERHEAD_US = 477 * 4 + 477 * 5 + 500
+_BME680_POLL_INTERVAL = 0.001 	## Seconds between status reads once the expected duration has passed
+_BME680_MEAS_TIMEOUT = 0.5 		## Seconds past the expected duration before giving up on a measurement
 
 _LOOKUP_TABLE_1 = (
 	2147483647.0,
@@ -254,6 +302,22 @@ _LOOKUP_TABLE_2 = (
 )
 
 
+## One triggered measurement: temperature (C), pressure (hPa), humidity (%RH) & gas resistance (ohms)
+BME680Sample = namedtuple('BME680Sample', ['temperature', 'pressure', 'humidity', 'gas'])
+
+
+def measurement_duration(temp_oversample, pressure_oversample, humidity_oversample, gas_wait=0.0):
+	"""Expected seconds for one forced-mode measurement with the given oversampling rates (1x, 2x, ...)
+	and heater duration (seconds; 0 without gas)"""
+	cycles = temp_oversample + pressure_oversample + humidity_oversample
+	return (cycles * _BME680_CYCLE_US + _BME680_OVERHEAD_US) / 1e6 + gas_wait
+
+
+def _gas_wait_seconds(code):
+	"""Heater duration encoded in a gas_wait register: 6-bit ms value times a 1/4/16/64 multiplier"""
+	return (code & 0x3F) * (4 ** (code >> 6)) / 1000.0
+
+
 def _read24(arr):
 	"""Parse an unsigned 24-bit value as a floating point and return it."""
 	ret = 0.0
@@ -283,9 +347,14 @@ class Pynq_BME680:
 
 		self._read_calibration()
 
+		# Last value written to each config register, so they are only re-written when changed
+		self._config = {}
+
 		# set up heater
 		self._write(_BME680_BME680_RES_HEAT_0, [0x73])
 		self._write(_BME680_BME680_GAS_WAIT_0, [0x65])
+		self._gas_wait = _gas_wait_seconds(0x65)
+		self.run_gas = True 	## Heat & measure the gas resistance (False for temperature, pressure & humidity only)
 
 		self.sea_level_pressure = 1013.25
 		"""Pressure in hectoPascals at sea level. Used to calibrate ``altitude``."""
@@ -358,6 +427,9 @@ class Pynq_BME680:
 	def temperature(self):
 		"""The compensated temperature in degrees celsius."""
 		self._perform_reading()
+		return self._calc_temperature()
+
+	def _calc_temperature(self):
 		calc_temp = ((self._t_fine * 5) + 128) / 256
 		return calc_temp / 100
 
@@ -365,6 +437,9 @@ class Pynq_BME680:
 	def pressure(self):
 		"""The barometric pressure in hectoPascals"""
 		self._perform_reading()
+		return self._calc_pressure()
+
+	def _calc_pressure(self):
 		var1 = (self._t_fine / 2) - 64000
 		var2 = ((var1 / 4) * (var1 / 4)) / 2048
 		var2 = (var2 * self._pressure_calibration[5]) / 4
@@ -392,6 +467,9 @@ class Pynq_BME680:
 	def humidity(self):
 		"""The relative humidity in RH %"""
 		self._perform_reading()
+		return self._calc_humidity()
+
+	def _calc_humidity(self):
 		temp_scaled = ((self._t_fine * 5) + 128) / 256
 		var1 = (self._adc_hum - (self._humidity_calibration[0] * 16)) - (
 			(temp_scaled * self._humidity_calibration[2]) / 200
@@ -438,6 +516,9 @@ class Pynq_BME680:
 	def gas(self):
 		"""The gas resistance in ohms"""
 		self._perform_reading()
+		return self._calc_gas()
+
+	def _calc_gas(self):
 		var1 = (
 			(1340 + (5 * self._sw_err)) * (_LOOKUP_TABLE_1[self._gas_range])
 		) / 65536
@@ -446,32 +527,56 @@ class Pynq_BME680:
 		calc_gas_res = (var3 + (var2 / 2)) / var2
 		return int(calc_gas_res)
 
-	def _perform_reading(self):
+	@property
+	def measurement_duration(self):
+		"""Expected seconds from triggering a measurement until its data is ready"""
+		return measurement_duration(
+			_BME680_SAMPLERATES[self._temp_oversample],
+			_BME680_SAMPLERATES[self._pressure_oversample],
+			_BME680_SAMPLERATES[self._humidity_oversample],
+			self._gas_wait if self.run_gas else 0.0,
+		)
+
+	def sample(self):
+		"""Temperature, pressure, humidity & gas from one triggered measurement (one burst read).
+		   Gas is None unless ``run_gas`` is set."""
+		self._perform_reading(force=True)
+		gas = self._calc_gas() if self.run_gas else None
+		return BME680Sample(self._calc_temperature(), self._calc_pressure(), self._calc_humidity(), gas)
+
+	def _write_config(self, register, value):
+		"""Write a config register only if its value changed since the last write"""
+		if self._config.get(register) != value:
+			self._write(register, [value])
+			self._config[register] = value
+
+	def _perform_reading(self, force=False):
 		"""Perform a single-shot reading from the sensor and fill internal data structure for
 		   calculations"""
-		if time.monotonic() - self._last_reading < self._min_refresh_time:
+		if not force and time.monotonic() - self._last_reading < self._min_refresh_time:
 			return
 
-		# set filter
-		self._write(_BME680_REG_CONFIG, [self._filter << 2])
-		# turn on temp oversample & pressure oversample
+		self._write_config(_BME680_REG_CONFIG, self._filter << 2)
+		# ctrl_hum only takes effect with the following write to ctrl_meas
+		self._write_config(_BME680_REG_CTRL_HUM, self._humidity_oversample)
+		self._write_config(_BME680_REG_CTRL_GAS, _BME680_RUNGAS if self.run_gas else 0x00)
+
+		# The sensor drops back to sleep mode after each measurement, so ctrl_meas is always
+		# written: temp & pressure oversampling with forced mode, which starts the measurement
 		self._write(
 			_BME680_REG_CTRL_MEAS,
-			[(self._temp_oversample << 5) | (self._pressure_oversample << 2)],
+			[(self._temp_oversample << 5) | (self._pressure_oversample << 2) | _BME680_MODE_FORCED],
 		)
-		# turn on humidity oversample
-		self._write(_BME680_REG_CTRL_HUM, [self._humidity_oversample])
-		# gas measurements enabled
-		self._write(_BME680_REG_CTRL_GAS, [_BME680_RUNGAS])
-
-		ctrl = self._read_byte(_BME680_REG_CTRL_MEAS)
-		ctrl = (ctrl & 0xFC) | 0x01  # enable single shot!
-		self._write(_BME680_REG_CTRL_MEAS, [ctrl])
-		new_data = False
-		while not new_data:
+		expected = self.measurement_duration
+		time.sleep(expected)
+		deadline = time.monotonic() + _BME680_MEAS_TIMEOUT
+		while True:
 			data = self._read(_BME680_REG_MEAS_STATUS, 15)
-			new_data = data[0] & 0x80 != 0
-			time.sleep(0.005)
+			if data[0] & _BME680_NEW_DATA:
+				break
+			if time.monotonic() > deadline:
+				raise RuntimeError("BME680 measurement not ready %.3f s after the expected %.3f s" % (_BME680_MEAS_TIMEOUT, expected))
+			time.sleep(_BME680_POLL_INTERVAL)
 		self._last_reading = time.monotonic()
 
 		self._adc_pres = _read24(data[2:5]) / 16
@@ -544,6 +649,7 @@ class Pynq_BME680_I2C(Pynq_BME680):
 		## Ensure the passed i2c device was created by pynq.lib.pynqmicroblaze.rpc
 		assert (i2c is not None) and (i2c.__class__.__name__ == 'i2c') and (i2c.val == 0)
 		self._i2c = i2c
+		self._address = address
 		####
 
 		self._debug = debug
@@ -560,7 +666,13 @@ class Pynq_BME680_I2C(Pynq_BME680):
 		#         print("\t$%02X => %s" % (register, [hex(i) for i in result]))
 		#     return result
 		####
-		## TODO
+		self._i2c.write(self._address, [register & 0xFF], 1)
+		result = [0] * length
+		self._i2c.read(self._address, result, length)
+		result = [b & 0xFF for b in result] 	## Undo the RPC's implicit unsigned-to-signed conversion
+		if self._debug:
+			print("\t$%02X => %s" % (register, [hex(i) for i in result]))
+		return result
 
 	def _write(self, register, values):
 		"""Writes an array of 'length' bytes to the 'register'"""
@@ -574,15 +686,22 @@ class Pynq_BME680_I2C(Pynq_BME680):
 		#     if self._debug:
 		#         print("\t$%02X <= %s" % (values[0], [hex(i) for i in values[1:]]))
 		####
-		## TODO
+		## Register/value pairs, so a multi-register write is one I2C transaction
+		buffer = []
+		for i, value in enumerate(values):
+			buffer += [(register + i) & 0xFF, value & 0xFF]
+		self._i2c.write(self._address, buffer, len(buffer))
+		if self._debug:
+			print("\t$%02X <= %s" % (register, [hex(i) for i in values]))
 
 
 
 class Pynq_BME680_SPI(Pynq_BME680):
 	"""Driver for SPI connected BME680.
 
-		:param busio.SPI spi: SPI device
-		:param digitalio.DigitalInOut cs: Chip Select
+		:param spi: PYNQ SPI device (from MicroblazeLibrary's spi_open(), already configured for
+		  SPI mode 0 or 3; chip select is the `ss` pin it was opened with)
+		:param cs: Unused (kept for compatibility with the Adafruit driver)
 		:param bool debug: Print debug statements when True.
 		:param int baudrate: Clock rate, default is 100000
 		:param int refresh_rate: Maximum number of readings per second. Faster property reads
@@ -597,7 +716,9 @@ class Pynq_BME680_SPI(Pynq_BME680):
 
 		# self._spi = spi_device.SPIDevice(spi, cs, baudrate=baudrate)
 		####
-		## TODO 
+		assert spi is not None
+		self._spi = spi
+		self._spi_mem_page = None 	## Last memory page selected (None: unknown)
 
 		self._debug = debug
 		super().__init__(refresh_rate=refresh_rate)
@@ -619,13 +740,20 @@ class Pynq_BME680_SPI(Pynq_BME680):
 		#         print("\t$%02X => %s" % (register, [hex(i) for i in result]))
 		#     return result
 		####
-		## TODO
+		## One full-duplex transfer: the register byte, then `length` dummy bytes clocking out the data
+		rx = [0] * (length + 1)
+		self._spi.transfer([register] + [0x00] * length, rx, length + 1)
+		result = [b & 0xFF for b in rx[1:]] 	## Undo the RPC's implicit unsigned-to-signed conversion
+		if self._debug:
+			print("\t$%02X => %s" % (register, [hex(i) for i in result]))
+		return result
 
 	def _write(self, register, values):
 		if register != _BME680_REG_STATUS:
 			# _BME680_REG_STATUS exists in both SPI memory pages
 			# For all other registers, we must set the correct memory page
 			self._set_spi_mem_page(register)
+		soft_reset = (register == _BME680_REG_SOFTRESET)
 		register &= 0x7F  # Write, bit 7 low.
 
 		####
@@ -638,10 +766,19 @@ class Pynq_BME680_SPI(Pynq_BME680):
 		#     if self._debug:
 		#         print("\t$%02X <= %s" % (values[0], [hex(i) for i in values[1:]]))
 		####
-		## TODO
+		buffer = []
+		for i, value in enumerate(values):
+			buffer += [(register + i) & 0x7F, value & 0xFF]
+		self._spi.transfer(buffer, [0] * len(buffer), len(buffer))
+		if self._debug:
+			print("\t$%02X <= %s" % (register, [hex(i) for i in values]))
+		if soft_reset:
+			self._spi_mem_page = None 	## A soft reset restores the default page
 
 	def _set_spi_mem_page(self, register):
 		spi_mem_page = 0x00
 		if register < 0x80:
 			spi_mem_page = 0x10
-		self._write(_BME680_REG_STATUS, [spi_mem_page])
\ No newline at end of file
+		if spi_mem_page != self._spi_mem_page: 	## Only switch pages when needed (not on every access)
+			self._write(_BME680_REG_STATUS, [spi_mem_page])
+			self._spi_mem_page = spi_mem_page
\ No newline at end of file
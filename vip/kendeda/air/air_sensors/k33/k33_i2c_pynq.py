@@ -10,6 +10,8 @@ import os
 import sys
 import signal
 import time
+import threading
+from collections import namedtuple
 
 from pynq import Overlay
 from pynq import PL
@@ -68,6 +70,18 @@ RESPONSE_METADATA_BYTES = 2		## Length of a Write Response, and of all bytes of
 
 MAX_CO2_PPM = ((2 ** 15) - 1)
 
+MEASURING_BIT  = 5 		## STATUS_REG bit set while a measurement cycle is in progress
+CONTINUOUS_BIT = 6 		## STATUS_REG bit set while in continuous measurement mode
+
+RESPONSE_WAIT = 0.005 	## Seconds between an I2C request & reading its response (p. 13 of the I2C guide: 1-20 ms)
+POLL_INTERVAL = 1.0 	## Seconds between K33_I2C's background polls of STATUS_REG
+
+## CO2, temperature & RH live in the contiguous RAM range 0x08 - 0x15, read by K33_I2C in one request
+ALL_REGS_LEN = (RH_REG + 2) - CO2_REG
+
+## Latest measurement published by K33_I2C (timestamp is time.time() of the read)
+K33Reading = namedtuple('K33Reading', ['timestamp', 'co2', 'temp', 'rh'])
+
 #=========================================================#
 
 initialized = False
@@ -264,11 +278,12 @@ def measurement_cycle():
 #=========================================================#
 
 def continuous_measurement_cycle():
-	start_continuous_measurement()
-	time.sleep(STARTUP_DELAY)
-
-	## ... TODO ...
-	raise NotImplementedError
+	cleanup() 		## K33_I2C opens (& owns) its own bus
+	with K33_I2C(IOP_NAME, overlay=base) as sensor:
+		while True:
+			reading = sensor.wait_for_reading(timeout=MEASUREMENT_PERIOD * 2)
+			if reading is not None:
+				print(f"\nCO2:  {reading.co2} ppm\nTemp:  {reading.temp} C\nRh:  {reading.rh} %\n")
 
 
 #=========================================================#
@@ -697,6 +712,186 @@ def delay(ms=I2C_DELAY):
 	time.sleep(s)
 
 
+#=========================================================#
+
+class K33_I2C():
+	"""
+	K33 BLG/ELG over I2C, in continuous measurement mode.
+
+	A background thread polls STATUS_REG every `poll_interval` seconds and, whenever a measurement
+	cycle completes (the measuring bit clears) or a whole measurement period passes without one,
+	reads CO2, temperature & RH in a single RAM read. The result is published as an immutable
+	K33Reading that callers read through `snapshot` (or co2/temp/rh) without locking or ever
+	waiting on the sensor's measurement period. Only the bus itself is guarded by a lock.
+
+	:param iop_name:      "Arduino", "PmodA" or "PmodB"
+	:param overlay:       loaded base overlay (loaded if None)
+	:param period:        the sensor's measurement period in seconds (see set_measurement_period())
+	:param poll_interval: seconds between STATUS_REG polls
+	:param start:         start continuous measurement & the polling thread right away
+	"""
+
+	def __init__(self, iop_name=IOP_NAME, overlay=None, period=MEASUREMENT_PERIOD, poll_interval=POLL_INTERVAL, start=True):
+		self.iop_name = iop_name.upper()
+		if overlay is None:
+			overlay = Overlay('base.bit', download=(PL.bitfile_name.split('/')[-1] != 'base.bit'))
+		self.overlay = overlay
+		if self.iop_name == "ARDUINO":
+			iop = overlay.iop_arduino
+		elif self.iop_name == "PMODA":
+			iop = overlay.iop_pmoda
+		else:
+			iop = overlay.iop_pmodb
+		self.lib = MicroblazeLibrary(iop, ['i2c'])
+		self.bus = self._open_bus()
+
+		self.period = period
+		self.poll_interval = poll_interval
+		self.errors = 0 		## Failed (checksum / status) transactions
+		self.snapshot = None 	## Latest K33Reading; replaced (never mutated) by the polling thread
+		self._new_reading = threading.Event()
+		self._bus_lock = threading.Lock()
+		self._stop = threading.Event()
+		self._thread = None
+		if start:
+			self.start()
+
+
+	def _open_bus(self):
+		if self.iop_name == "ARDUINO":
+			return self.lib.i2c_open_device(0)
+		return self.lib.i2c_open(PMOD_SDA, PMOD_SCL)
+
+
+	def _transact(self, request, resp_length):
+		""" Write `request` & read its `resp_length` byte response. Returns the response, or None if it failed. """
+		response = [0x00] * resp_length
+		with self._bus_lock:
+			self.bus.write(WRITE_ADDR, request, len(request))
+			time.sleep(RESPONSE_WAIT)
+			self.bus.read(READ_ADDR, response, resp_length)
+		if response[0] & 0x1 and (sum(response[:-1]) & 0xFF) == response[-1]:
+			return response
+		self.errors += 1
+		return None
+
+
+	def read_ram(self, ram_address, num_bytes):
+		""" `num_bytes` (up to 15) of RAM from `ram_address`, or None if the read failed. """
+		response = self._transact(format_read_request(num_bytes, ram_address), RESPONSE_METADATA_BYTES + num_bytes)
+		return None if response is None else response[1:-1]
+
+
+	def write_ram(self, ram_address, data):
+		return self._transact(format_write_request(len(data), ram_address, data), RESPONSE_METADATA_BYTES) is not None
+
+
+	def status(self):
+		""" Contents of STATUS_REG, or None if the read failed. """
+		data = self.read_ram(STATUS_REG, 2)
+		return None if data is None else (data[0] << 8) | data[1]
+
+
+	def check_complete_bit_set(self, bit_index):
+		status = self.status()
+		return status is not None and bool(status & (0x1 << bit_index))
+
+
+	def read_all(self):
+		""" Read CO2 (ppm), temperature (C) & RH (%) in one request. Returns a K33Reading, or None on failure. """
+		data = self.read_ram(CO2_REG, ALL_REGS_LEN)
+		if data is None:
+			return None
+		def reg(addr):
+			i = addr - CO2_REG
+			return (data[i] << 8) | data[i + 1]
+		return K33Reading(time.time(), float(reg(CO2_REG)), reg(TEMP_REG) / 100.0, reg(RH_REG) / 100.0)
+
+
+	def start_continuous_measurement(self):
+		""" Write the "start continuous measurement" command; True if the sensor acknowledged it. """
+		return self.write_ram(SCR_REG, [CONTIN_MEASURE_START_CMD]) and self.check_complete_bit_set(CONTINUOUS_BIT)
+
+
+	def stop_continuous_measurement(self):
+		return self.write_ram(SCR_REG, [CONTIN_MEASURE_STOP_CMD]) and not self.check_complete_bit_set(CONTINUOUS_BIT)
+
+
+	def start(self):
+		if self._thread is not None and self._thread.is_alive():
+			return
+		if not self.start_continuous_measurement():
+			print(f"[K33_I2C]  WARNING: Continuous measurement mode not acknowledged (status = {self.status()})")
+		self._stop.clear()
+		self._thread = threading.Thread(target=self._poll, name="K33_I2C-poll", daemon=True)
+		self._thread.start()
+
+
+	def _poll(self):
+		measuring = False
+		last_read = time.monotonic() 	## The registers hold stale data until the first cycle after start-up
+		while not self._stop.wait(self.poll_interval):
+			status = self.status()
+			if status is None:
+				continue
+			busy = bool(status & (0x1 << MEASURING_BIT))
+			overdue = time.monotonic() - last_read >= self.period + self.poll_interval
+			if (measuring and not busy) or overdue:
+				reading = self.read_all()
+				if reading is not None:
+					if reading.co2 == MAX_CO2_PPM:
+						print("\n[K33_I2C]  WARNING: Suspected battery failure, check that the K33 unit is receiving power!\n")
+					self.snapshot = reading
+					self._new_reading.set()
+					last_read = time.monotonic()
+			measuring = busy
+
+
+	def wait_for_reading(self, timeout=None):
+		""" Block until the next reading is published (for callers that do want to wait). Returns the snapshot. """
+		self._new_reading.clear()
+		self._new_reading.wait(timeout)
+		return self.snapshot
+
+
+	@property
+	def co2(self):
+		reading = self.snapshot
+		return None if reading is None else reading.co2
+
+	@property
+	def temp(self):
+		reading = self.snapshot
+		return None if reading is None else reading.temp
+
+	@property
+	def rh(self):
+		reading = self.snapshot
+		return None if reading is None else reading.rh
+
+	@property
+	def age(self):
+		""" Seconds since the latest reading (None before the first). """
+		reading = self.snapshot
+		return None if reading is None else time.time() - reading.timestamp
+
+
+	def close(self, stop_measuring=False):
+		self._stop.set()
+		if self._thread is not None:
+			self._thread.join(timeout=self.poll_interval + 1)
+		if stop_measuring:
+			self.stop_continuous_measurement()
+		self.bus.close()
+
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		self.close()
+
+
 #=========================================================#
 
 if __name__ == "__main__":
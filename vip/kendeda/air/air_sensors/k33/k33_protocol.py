@@ -0,0 +1,294 @@
+""" k33_protocol.py -- UART protocol layer for the CO2Meter K33-ELG (K-series) sensors.
+
+Shared by k33_uart.K33 (pyserial) & k33_uart_pynq.K33_UART (pyserial or a PYNQ IOP's UART).
+The port is opened once and kept open; each transaction drains stale input, writes the request
+and then reads only as many bytes as the response frame still needs, returning as soon as the
+frame is complete (or raising once its deadline has passed). Frames are checked with the
+K-series' Modbus CRC16, and only transient failures (timeouts, CRC errors, I/O errors) are retried.
+
+Read frames (RAM: 0x44, EEPROM: 0x46):
+	request   [0xFE, cmd, addr_hi, addr_lo, n, crc_lo, crc_hi]
+	response  [0xFE, cmd, n, data_0 ... data_n-1, crc_lo, crc_hi]
+"""
+
+import select
+import time
+
+try:
+	import serial
+except ImportError:
+	serial = None
+
+#######################
+######  GLOBALS  ######
+#######################
+
+ANY_ADDRESS = 0xFE 		## K-series "any sensor" address
+RAM_READ    = 0x44
+EEPROM_READ = 0x46
+
+BAUDRATE = 9600
+BYTE_TIME = 10.0 / BAUDRATE 	## Seconds per byte on the wire (8N1)
+
+RESPONSE_TIMEOUT = 0.1 	## Seconds for the sensor to start answering, on top of the frame's wire time
+RETRIES = 2 			## Retries of a transaction after a timeout, CRC or I/O error
+NO_RESP_RETRIES = 1 	## ... but after a timeout with nothing at all received (likely unpowered), only this many
+
+## Consecutive failed transactions after which the sensor is reported dead (K33NoResponse)
+MAX_FAILED_TRANSACTIONS = 32
+
+#######################
+#######################
+
+class K33Error(Exception):
+	""" Base class for K33 communication failures. """
+
+class K33Timeout(K33Error):
+	""" The response frame did not complete before its deadline. """
+	def __init__(self, msg, received=0):
+		super().__init__(msg)
+		self.received = received
+
+class K33CRCError(K33Error):
+	""" A complete response frame failed its CRC check. """
+
+class K33NoResponse(K33Error):
+	""" Too many consecutive transactions failed (battery pack likely died). """
+
+
+def _make_crc_table():
+	table = []
+	for i in range(256):
+		crc = i
+		for _ in range(8):
+			crc = (crc >> 1) ^ 0xA001 if crc & 1 else crc >> 1
+		table.append(crc)
+	return tuple(table)
+
+_CRC_TABLE = _make_crc_table()
+
+
+def crc16(data):
+	""" Modbus CRC16 (poly 0xA001 reflected, init 0xFFFF) of `data`. Sent low byte first. """
+	crc = 0xFFFF
+	for b in data:
+		crc = (crc >> 8) ^ _CRC_TABLE[(crc ^ b) & 0xFF]
+	return crc
+
+
+def read_command(address, length, command=RAM_READ):
+	""" 7-byte request frame reading `length` bytes starting at `address`. """
+	frame = bytes([ANY_ADDRESS, command, (address >> 8) & 0xFF, address & 0xFF, length])
+	crc = crc16(frame)
+	return frame + bytes([crc & 0xFF, crc >> 8])
+
+
+class FrameParser():
+	"""
+	Incremental parser for one read response. feed() accepts any chunk of received bytes and
+	returns the frame's data bytes once the frame is complete; leading garbage (and any header
+	not matching the request) is skipped so the parser resynchronizes on the next 0xFE.
+	"""
+
+	def __init__(self, command=RAM_READ, length=2):
+		self.command = command
+		self.length = length
+		self.frame_len = 3 + length + 2
+		self.reset()
+
+	def reset(self):
+		self._buf = bytearray()
+		self.received = 0 	## Total bytes fed since reset (including skipped ones)
+
+	@property
+	def needed(self):
+		""" Bytes still missing for a complete frame. """
+		return self.frame_len - len(self._buf)
+
+	def _resync(self):
+		## Drop the current start byte and skip ahead to the next candidate address byte
+		start = self._buf.find(ANY_ADDRESS, 1)
+		del self._buf[:start if start > 0 else len(self._buf)]
+
+	def feed(self, data):
+		self._buf += data
+		self.received += len(data)
+		while self._buf:
+			if self._buf[0] != ANY_ADDRESS:
+				self._resync()
+				continue
+			if len(self._buf) >= 2 and self._buf[1] != self.command:
+				self._resync()
+				continue
+			if len(self._buf) >= 3 and self._buf[2] != self.length:
+				self._resync()
+				continue
+			if len(self._buf) < self.frame_len:
+				return None
+			frame = bytes(self._buf[:self.frame_len])
+			del self._buf[:self.frame_len]
+			if crc16(frame[:-2]) != (frame[-2] | (frame[-1] << 8)):
+				raise K33CRCError("CRC mismatch in response {}".format(frame.hex()))
+			return frame[3:-2]
+		return None
+
+
+class SerialLink():
+	""" Transport over a pyserial port, waiting for input with select() (or by polling `in_waiting`). """
+
+	def __init__(self, ser):
+		self.ser = ser
+		try:
+			self._fd = ser.fileno()
+		except (AttributeError, OSError, ValueError):
+			self._fd = None
+
+	def drain(self):
+		self.ser.reset_input_buffer()
+
+	def write(self, data):
+		self.ser.write(data)
+
+	def read(self, n, timeout):
+		""" Up to `n` bytes, waiting at most `timeout` seconds for the first one. """
+		if not self.ser.in_waiting:
+			if self._fd is not None:
+				select.select([self._fd], [], [], max(timeout, 0.0))
+			else:
+				time.sleep(min(max(timeout, 0.0), BYTE_TIME))
+		waiting = self.ser.in_waiting
+		return self.ser.read(min(n, waiting)) if waiting else b''
+
+	def reopen(self):
+		self.ser.close()
+		self.ser.open()
+		try:
+			self._fd = self.ser.fileno()
+		except (AttributeError, OSError, ValueError):
+			self._fd = None
+
+	def close(self):
+		if self.ser.is_open:
+			self.ser.close()
+
+
+class MicroblazeLink():
+	"""
+	Transport over a PYNQ IOP UART (MicroblazeLibrary 'uart'), whose reads never block: input is
+	polled once per byte time until it arrives. `opener` re-creates the UART handle on reopen().
+	"""
+
+	def __init__(self, uart, opener=None):
+		self.uart = uart
+		self._opener = opener
+
+	def drain(self):
+		buf = [0] * 16
+		while self.uart.read(buf, len(buf)) > 0:
+			pass
+
+	def write(self, data):
+		self.uart.write(list(data), len(data))
+
+	def read(self, n, timeout):
+		deadline = time.monotonic() + max(timeout, 0.0)
+		buf = [0] * n
+		while True:
+			got = self.uart.read(buf, n)
+			if got > 0:
+				return bytes(buf[:got])
+			if time.monotonic() >= deadline:
+				return b''
+			time.sleep(BYTE_TIME)
+
+	def reopen(self):
+		self.uart.close()
+		if self._opener is not None:
+			self.uart = self._opener()
+
+	def close(self):
+		self.uart.close()
+
+
+class K33Protocol():
+	"""
+	Request/response engine on top of a SerialLink or MicroblazeLink.
+
+	:param link:     the transport (kept open for the lifetime of the protocol)
+	:param timeout:  seconds for the sensor to start answering a request
+	:param retries:  retries of a transaction failing with a timeout, CRC or I/O error
+	"""
+
+	def __init__(self, link, timeout=RESPONSE_TIMEOUT, retries=RETRIES):
+		self.link = link
+		self.timeout = timeout
+		self.retries = retries
+		self.stats = {'transactions': 0, 'retries': 0, 'timeouts': 0, 'crc_errors': 0, 'io_errors': 0}
+		self.failures = 0 			## Consecutive failed transactions
+		self.last_latency = None 	## Seconds taken by the last successful transaction
+
+	def _io_errors(self):
+		errors = (OSError,)
+		if serial is not None:
+			errors += (serial.SerialException,)
+		return errors
+
+	def _attempt(self, cmd, parser):
+		parser.reset()
+		self.link.drain()
+		self.link.write(cmd)
+		deadline = time.monotonic() + self.timeout + (len(cmd) + parser.frame_len) * BYTE_TIME
+		while True:
+			remaining = deadline - time.monotonic()
+			if remaining <= 0:
+				raise K33Timeout("Response incomplete after {} of {} bytes".format(parser.received, parser.frame_len), parser.received)
+			data = parser.feed(self.link.read(parser.needed, remaining))
+			if data is not None:
+				return data
+
+	def transact(self, cmd):
+		""" Send a read request frame & return the response's data bytes. Raises K33Error on failure. """
+		cmd = bytes(cmd)
+		if len(cmd) != 7 or cmd[1] not in (RAM_READ, EEPROM_READ):
+			raise ValueError("Not a K33 read request: {}".format(cmd.hex()))
+		parser = FrameParser(cmd[1], cmd[4])
+		start = time.monotonic()
+		self.stats['transactions'] += 1
+
+		attempt = 0
+		while True:
+			try:
+				data = self._attempt(cmd, parser)
+				self.failures = 0
+				self.last_latency = time.monotonic() - start
+				return data
+			except K33Timeout as t_e:
+				self.stats['timeouts'] += 1
+				error = t_e
+				limit = self.retries if t_e.received else min(self.retries, NO_RESP_RETRIES)
+			except K33CRCError as c_e:
+				self.stats['crc_errors'] += 1
+				error = c_e
+				limit = self.retries
+			except self._io_errors() as io_e:
+				self.stats['io_errors'] += 1
+				error = K33Error("{}: {}".format(type(io_e).__name__, io_e))
+				limit = self.retries
+				try:
+					self.link.reopen()
+				except self._io_errors():
+					pass
+
+			if attempt >= limit:
+				self.failures += 1
+				if self.failures >= MAX_FAILED_TRANSACTIONS:
+					raise K33NoResponse("{} consecutive transactions failed (last: {})".format(self.failures, error))
+				raise error
+			attempt += 1
+			self.stats['retries'] += 1
+
+	def read_ram(self, address, length):
+		return self.transact(read_command(address, length, RAM_READ))
+
+	def close(self):
+		self.link.close()
@@ -5,8 +5,13 @@ import signal
 import termios
 from datetime import datetime as dt
 
-## TODO: Create custom Exceptions for errors, especially for NO_RESP failures 
-## so that air_node.py can remove the dead K33 from the sensor loop (battery pack likely died)
+try:
+	from . import k33_protocol
+except ImportError:
+	import k33_protocol
+
+K33Error = k33_protocol.K33Error
+K33NoResponse = k33_protocol.K33NoResponse 	## Raised once the K33 stops answering altogether (battery pack likely died)
 
 #######################
 ######  GLOBALS  ######
@@ -17,25 +22,22 @@ MAX_CO2_PPM = ((2 ** 15) - 1)
 ## Seconds in between successful measurement readings
 LOOP_DELAY = 20
 
-## For tracking 3 statistic classifications: I/O error count, serial read failure count, & empty response packets
+## read_all() results younger than this (seconds) are shared by callers passing `max_age`
+## (e.g., air_node's temperature, humidity & CO2 entries within one measurement cycle)
+SHARED_READ_AGE = 5
+
+## K33 RAM layout of the contiguous range covered by READ_ALL_CMD (offsets relative to 0x08)
+_CO2_OFFSET  = 0x08 - 0x08
+_TEMP_OFFSET = 0x12 - 0x08
+_RH_OFFSET   = 0x14 - 0x08
+_ALL_LEN     = 0x0E 	## 0x08 ... 0x15
+
+## For displaying the protocol's statistics: transactions, retries, timeouts, CRC errors & I/O errors
 DISPLAY_STATS = False # True
-RESET_STATS_ON_SUCCESS = True
 REQUEST_CO2 = True
 REQUEST_RH = True
 REQUEST_TEMP = True
 
-## For termios.error: (5, 'Input/output error')
-MAX_ERR_CNT = 8
-_ERR = 0
-
-## For serial.SerialException events incurred by ser.read() failure
-MAX_FAIL_CNT = 16
-_FAIL = 1
-
-## For empty byte response blocks returned from the K33
-MAX_EMPTY_CNT = 32
-_EMPTY = 2
-
 #######################
 #######################
 
@@ -66,16 +68,20 @@ class K33():
 	READ_CO2_CMD = bytes([0xFE, 0x44, 0x00, 0x08, 0x02, 0x9F, 0x25])
 	READ_RH_CMD = bytes([0xFE, 0x44, 0x00, 0x14, 0x02, 0x97, 0xE5]) 	## Pulls relative humidity from K33
 	READ_TEMP_CMD = bytes([0xFE, 0x44, 0x00, 0x12, 0x02, 0x94, 0x45])
+	## One RAM read of 14 bytes (0x08 - 0x15) covering the CO2, temperature & RH registers at once
+	READ_ALL_CMD = bytes([0xFE, 0x44, 0x00, 0x08, _ALL_LEN, 0x9F, 0x20])
 
 	def __init__(self, port='/dev/serial0'):
 		self.port = port 
-		self.ser = serial.Serial(port, baudrate=9600, timeout=0.5)
+		self.ser = serial.Serial(port, baudrate=k33_protocol.BAUDRATE, timeout=0.5)
+		## The port stays open; every transaction drains stale input & waits only for its own response frame
+		self.protocol = k33_protocol.K33Protocol(k33_protocol.SerialLink(self.ser))
 		self.flush()
-		self.stats = [0]*3
 		self.loop_cnt = 0   ## Loop counter (ignoring failed measurement attempts)
 		self._prev_co2 = 0
 		self._prev_rh = 0
 		self._prev_temp = 0
+		self._all_time = None 	## time.monotonic() of the last successful read_all()
 		signal.signal(signal.SIGINT, self.handle_signal)
 		signal.signal(signal.SIGTERM, self.handle_signal)
 		time.sleep(1)
@@ -87,17 +93,16 @@ class K33():
 		return dt.now().strftime('%m/%d/%Y,%I:%M:%S %p')
 
 
+	@property
+	def stats(self):
+		return self.protocol.stats
+
+
 	def flush(self):
 		try:
-			self.ser.flushInput()
-		except termios.error as t_e:
-			self.stats[_ERR] += 1
-			self.loop_cnt = 0
-			if self.stats[_ERR] > MAX_ERR_CNT:
-				print("{}\n[ERROR] termios exceptions caused routine to fail, terminating now.\n".format(t_e))
-				self.show_stats()
-				self.close()
-				sys.exit(1)
+			self.protocol.link.drain()
+		except (termios.error, serial.SerialException) as e:
+			print("[K33::flush]  {}".format(e))
 
 	def read_co2(self):
 		"""
@@ -107,76 +112,67 @@ class K33():
 			if co2 <= 0 or co2 == self._prev_co2 or (co2 > 0 and self._prev_co2 > 0 and co2 > (self._prev_co2 << 4)):
 				print("[read_co2]  Bad co2 value:  {}".format(co2))
 		"""
-		co2 = self._read_uart(self.READ_CO2_CMD)
-		if int(co2) == MAX_CO2_PPM:
+		data = self._read_uart(self.READ_CO2_CMD)
+		if data is None:
+			return self._prev_co2
+		co2 = (data[0] << 8) + data[1]
+		if co2 == MAX_CO2_PPM:
 			print("\n[K33::read_co2]  WARNING: Suspected battery failure, check that the K33 unit is receiving power!\n")
 		self._prev_co2 = co2
 		return co2
 
 	def read_rh(self):
-		rh = round(self._read_uart(self.READ_RH_CMD) * 0.01, 2)
-		self._prev_rh = rh
-		return rh
+		data = self._read_uart(self.READ_RH_CMD)
+		if data is not None:
+			self._prev_rh = round(((data[0] << 8) + data[1]) * 0.01, 2)
+		return self._prev_rh
 
 	def read_temp(self):
-		temp = round(self._read_uart(self.READ_TEMP_CMD) * 0.01, 2)
-		self._prev_temp = temp 
-		return temp
+		data = self._read_uart(self.READ_TEMP_CMD)
+		if data is not None:
+			self._prev_temp = round(((data[0] << 8) + data[1]) * 0.01, 2)
+		return self._prev_temp
 
 
-	def _reset_uart(self):
-		## The following close-delay-open block is absolutely necessary for reliable 
-		## UART communication prior to serial reads (for some reason...)
-		self.ser.close()
-		time.sleep(0.5)
-		self.ser.open()
-	
-	
-	def _read_uart(self, cmd):
-		self._reset_uart()
-		self.flush()
+	def read_all(self, max_age=0):
+		"""
+		Read CO2 (ppm), temperature (C) & relative humidity (%) with a single request/response,
+		returning (co2, temp, rh). If a previous read_all() succeeded less than `max_age` seconds ago,
+		its values are returned without touching the UART, so several consumers can share one frame.
+		On a failed read, the previous values are returned.
+		"""
+		if max_age and self._all_time is not None and time.monotonic() - self._all_time < max_age:
+			return self._prev_co2, self._prev_temp, self._prev_rh
+
+		data = self._read_uart(self.READ_ALL_CMD)
+		if data is not None:
+			co2 = (data[_CO2_OFFSET] << 8) + data[_CO2_OFFSET + 1]
+			if co2 == MAX_CO2_PPM:
+				print("\n[K33::read_all]  WARNING: Suspected battery failure, check that the K33 unit is receiving power!\n")
+			self._prev_co2 = co2
+			self._prev_temp = round(((data[_TEMP_OFFSET] << 8) + data[_TEMP_OFFSET + 1]) * 0.01, 2)
+			self._prev_rh = round(((data[_RH_OFFSET] << 8) + data[_RH_OFFSET + 1]) * 0.01, 2)
+			self._all_time = time.monotonic()
+		return self._prev_co2, self._prev_temp, self._prev_rh
 
-		## Issue command to initiate reading a measured value from RAM
-		self.ser.write(cmd)
-		time.sleep(0.125)
 
+	def _read_uart(self, cmd):
+		"""
+		One CRC-checked transaction (retried by the protocol on timeouts / bad frames).
+		Returns the response's data bytes, or None if it failed. Raises K33NoResponse once
+		the K33 has stopped answering altogether.
+		"""
 		try:
-			## Request 7 bytes (CO2/RH/Temp value extracted from bytes 4 & 5)
-			resp = self.ser.read(7)
-		except serial.SerialException as s_e:
-			self.stats[_FAIL] += 1
-			self.loop_cnt = 0
-			if self.stats[_FAIL] > MAX_FAIL_CNT:
-				print("{}\n[FAILURE] serial.read() repeatedly failed to communicate with device, terminating now.\n".format(s_e))
-				self.show_stats()
-				sys.exit(1)
-			time.sleep(0.2)
-			return -1
-
-		ret_val = 0
-		bytes_recvd = len(resp)
-		if bytes_recvd > 3:
-			if len(resp) != 7:
-				print("  ~~ [ANOMALY_1] response bytes received: {}  ~~\n".format(bytes_recvd))
-
-			ret_val = (resp[3] << 8) + resp[4]
-
-			if RESET_STATS_ON_SUCCESS:
-				## Set all statistics to 0
-				self.stats = [0 for s in self.stats]
-			self.loop_cnt += 1
-
-		elif bytes_recvd == 0:
-			self.stats[_EMPTY] += 1
+			data = self.protocol.transact(cmd)
+		except K33NoResponse:
+			self.show_stats()
+			raise
+		except K33Error as e:
+			print("  ~~ [K33] {}  ~~".format(e))
 			self.loop_cnt = 0
-			if self.stats[_EMPTY] > MAX_EMPTY_CNT:
-				print("\n[NO_RESP] over {} consecutive read attempts returned no data, terminating now.\n".format(MAX_EMPTY_CNT))
-				self.show_stats()
-				sys.exit(1)
-		else:
-			print("  ~~ [ANOMALY_2] response bytes received: {}  ~~\n".format(bytes_recvd))
-
-		return ret_val
+			return None
+		self.loop_cnt += 1
+		return data
 	
 	def close(self):
 		if self.ser.is_open:
@@ -184,7 +180,8 @@ class K33():
 
 	def show_stats(self):
 		if DISPLAY_STATS:
-			print("\n ___Stats___\n\ttermios I/O errors from flush:\t{0}\n\tSerialException read fails:\t{1}\n\tEmpty byte responses received:\t{2}\n".format(*self.stats))
+			print("\n ___Stats___\n\t" + "\n\t".join("{}:\t{}".format(k, v) for k, v in self.stats.items())
+					+ "\n\tlast latency:\t{}\n".format(self.protocol.last_latency))
 
 	def handle_signal(self, signum, stack):
 		print(" < Signal received ({}) > \n".format(signum))
@@ -204,6 +201,14 @@ if __name__ == "__main__":
 	# k33 = K33("/dev/ttyS0") 
 
 	while True:
+		if REQUEST_CO2 and REQUEST_RH and REQUEST_TEMP:
+			co2, temp, humid = k33.read_all()
+			ts = K33.get_timestamp()
+			latency = k33.protocol.last_latency
+			print("<{}> [{}]\tCO2: {} ppm\tHumidity: {} %\tTemperature: {} C\t({:.1f} ms)\n".format(k33.loop_cnt, ts, co2, humid, temp, (latency or 0) * 1e3))
+			time.sleep(LOOP_DELAY)
+			continue
+
 		if REQUEST_CO2:
 			co2 = k33.read_co2()
 			ts = K33.get_timestamp()
@@ -5,11 +5,19 @@ import signal
 import termios
 from datetime import datetime as dt
 
-# from pynq import Overlay
-# from pynq.lib import MicroblazeLibrary
+try:
+	from pynq import Overlay
+	from pynq.lib import MicroblazeLibrary
+except ImportError:
+	Overlay = MicroblazeLibrary = None 	## Only needed when not using the USB cable
 
-## TODO: Create custom Exceptions for errors, especially for NO_RESP failures 
-## so that air_node.py can remove the dead K33 from the sensor loop (battery pack likely died)
+try:
+	from . import k33_protocol
+except ImportError:
+	import k33_protocol
+
+K33Error = k33_protocol.K33Error
+K33NoResponse = k33_protocol.K33NoResponse 	## Raised once the K33 stops answering altogether (battery pack likely died)
 
 #######################
 ######  GLOBALS  ######
@@ -23,25 +31,12 @@ MAX_CO2_PPM = ((2 ** 15) - 1)
 ## Seconds in between successful measurement readings
 LOOP_DELAY = 20
 
-## For tracking 3 statistic classifications: I/O error count, serial read failure count, & empty response packets
+## For displaying the protocol's statistics: transactions, retries, timeouts, CRC errors & I/O errors
 DISPLAY_STATS = False # True
-RESET_STATS_ON_SUCCESS = True
 REQUEST_CO2 = True
 REQUEST_RH = True
 REQUEST_TEMP = True
 
-## For termios.error: (5, 'Input/output error')
-MAX_ERR_CNT = 8
-_ERR = 0
-
-## For serial.SerialException events incurred by ser.read() failure
-MAX_FAIL_CNT = 16
-_FAIL = 1
-
-## For empty byte response blocks returned from the K33
-MAX_EMPTY_CNT = 32
-_EMPTY = 2
-
 #######################
 #######################
 
@@ -75,22 +70,25 @@ class K33_UART():
 
 	def __init__(self, use_usb=False, port='/dev/serial0', overlay=None, iop=None):
 		self.port = port
-		if overlay is None:
-			overlay = Overlay('base.bit')
-		self.overlay = overlay 
+		self.using_usb = use_usb
 
 		if use_usb:
-			self.ser = serial.Serial(port, baudrate=9600, timeout=0.5)
+			self.overlay = overlay
+			self.ser = serial.Serial(port, baudrate=k33_protocol.BAUDRATE, timeout=0.5)
+			link = k33_protocol.SerialLink(self.ser)
 		else:
+			if overlay is None:
+				overlay = Overlay('base.bit')
+			self.overlay = overlay 
 			if iop is None:
 				iop = self.overlay.iop_arduino
 			lib = MicroblazeLibrary(iop, ['uart'])
 			self.ser = lib.uart_open(UART_TXD, UART_RXD)
-		
-		self.using_usb = use_usb
+			link = k33_protocol.MicroblazeLink(self.ser, opener=lambda: lib.uart_open(UART_TXD, UART_RXD))
 
+		## The port stays open; every transaction drains stale input & waits only for its own response frame
+		self.protocol = k33_protocol.K33Protocol(link)
 		self.flush()
-		self.stats = [0]*3
 		self.loop_cnt = 0   ## Loop counter (ignoring failed measurement attempts)
 		self._prev_co2 = 0
 		self._prev_rh = 0
@@ -106,21 +104,16 @@ class K33_UART():
 		return dt.now().strftime('%m/%d/%Y,%I:%M:%S %p')
 
 
-	def flush(self):
-		if not hasattr(self.ser, 'flushInput'):
-			# print('[flush]  Skipping call to non-existent method "flushInput"')
-			return 
+	@property
+	def stats(self):
+		return self.protocol.stats
+
 
+	def flush(self):
 		try:
-			self.ser.flushInput()
-		except termios.error as t_e:
-			self.stats[_ERR] += 1
-			self.loop_cnt = 0
-			if self.stats[_ERR] > MAX_ERR_CNT:
-				print("{}\n[ERROR] termios exceptions caused routine to fail, terminating now.\n".format(t_e))
-				self.show_stats()
-				self.close()
-				sys.exit(1)
+			self.protocol.link.drain()
+		except (termios.error, serial.SerialException) as e:
+			print("[K33_UART::flush]  {}".format(e))
 
 
 	def read_co2(self):
@@ -131,103 +124,57 @@ class K33_UART():
 			if co2 <= 0 or co2 == self._prev_co2 or (co2 > 0 and self._prev_co2 > 0 and co2 > (self._prev_co2 << 4)):
 				print("[read_co2]  Bad co2 value:  {}".format(co2))
 		"""
-		co2 = self._read_uart(self.READ_CO2_CMD)
-		if int(co2) == MAX_CO2_PPM:
+		data = self._read_uart(self.READ_CO2_CMD)
+		if data is None:
+			return self._prev_co2
+		co2 = (data[0] << 8) + data[1]
+		if co2 == MAX_CO2_PPM:
 			print("\n[K33::read_co2]  WARNING: Suspected battery failure, check that the K33 unit is receiving power!\n")
 		self._prev_co2 = co2
 		return co2
 
 
 	def read_rh(self):
-		rh = round(self._read_uart(self.READ_RH_CMD) * 0.01, 2)
-		self._prev_rh = rh
-		return rh
+		data = self._read_uart(self.READ_RH_CMD)
+		if data is not None:
+			self._prev_rh = round(((data[0] << 8) + data[1]) * 0.01, 2)
+		return self._prev_rh
 
 
 	def read_temp(self):
-		temp = round(self._read_uart(self.READ_TEMP_CMD) * 0.01, 2)
-		self._prev_temp = temp 
-		return temp
-
-
-	def _reset_uart(self):
-		## The following close-delay-open block is absolutely necessary for reliable 
-		## UART communication prior to serial reads (for some reason...)
-		self.ser.close()
-		time.sleep(0.5)
-		if self.using_usb:
-			self.ser.open()
-		else:
-			self.ser.open(UART_TXD, UART_RXD)
-	
+		data = self._read_uart(self.READ_TEMP_CMD)
+		if data is not None:
+			self._prev_temp = round(((data[0] << 8) + data[1]) * 0.01, 2)
+		return self._prev_temp
 
-	def _read_uart(self, cmd):
-		self._reset_uart()
-		self.flush()
-
-		# if self.using_usb:
-		#     cmd = bytes(cmd)
-
-		## Issue command to initiate reading a measured value from RAM
-		if self.using_usb:
-			self.ser.write(bytes(cmd))
-		else:
-			self.ser.write(cmd, len(cmd))
-		time.sleep(0.125)
 
+	def _read_uart(self, cmd):
+		"""
+		One CRC-checked transaction (retried by the protocol on timeouts / bad frames).
+		Returns the response's data bytes, or None if it failed. Raises K33NoResponse once
+		the K33 has stopped answering altogether.
+		"""
 		try:
-			## Request 7 bytes (CO2/RH/Temp value extracted from bytes 4 & 5)
-			if self.using_usb:
-				resp = self.ser.read(7)
-			else:
-				resp = [0x0]*7
-				self.ser.read(resp, 7)
-		except serial.SerialException as s_e:
-			self.stats[_FAIL] += 1
-			self.loop_cnt = 0
-			if self.stats[_FAIL] > MAX_FAIL_CNT:
-				print("{}\n[FAILURE] serial.read() repeatedly failed to communicate with device, terminating now.\n".format(s_e))
-				self.show_stats()
-				sys.exit(1)
-			time.sleep(0.2)
-			return -1
-
-		ret_val = 0
-		bytes_recvd = len(resp)
-		if bytes_recvd > 3:
-			if len(resp) != 7:
-				print("  ~~ [ANOMALY_1] response bytes received: {}  ~~\n".format(bytes_recvd))
-
-			ret_val = (resp[3] << 8) + resp[4]
-
-			if RESET_STATS_ON_SUCCESS:
-				## Set all statistics to 0
-				self.stats = [0 for s in self.stats]
-			self.loop_cnt += 1
-
-		elif bytes_recvd == 0:
-			self.stats[_EMPTY] += 1
+			data = self.protocol.transact(cmd)
+		except K33NoResponse:
+			self.show_stats()
+			raise
+		except K33Error as e:
+			print("  ~~ [K33_UART] {}  ~~".format(e))
 			self.loop_cnt = 0
-			if self.stats[_EMPTY] > MAX_EMPTY_CNT:
-				print("\n[NO_RESP] over {} consecutive read attempts returned no data, terminating now.\n".format(MAX_EMPTY_CNT))
-				self.show_stats()
-				sys.exit(1)
-		else:
-			print("  ~~ [ANOMALY_2] response bytes received: {}  ~~\n".format(bytes_recvd))
-
-		return ret_val
+			return None
+		self.loop_cnt += 1
+		return data
 	
 
 	def close(self):
-		if not self.using_usb:
-			self.ser.close()
-		elif self.ser.is_open:
-			self.ser.close()
+		self.protocol.close()
 
 
 	def show_stats(self):
 		if DISPLAY_STATS:
-			print("\n ___Stats___\n\ttermios I/O errors from flush:\t{0}\n\tSerialException read fails:\t{1}\n\tEmpty byte responses received:\t{2}\n".format(*self.stats))
+			print("\n ___Stats___\n\t" + "\n\t".join("{}:\t{}".format(k, v) for k, v in self.stats.items())
+					+ "\n\tlast latency:\t{}\n".format(self.protocol.last_latency))
 
 
 	def handle_signal(self, signum, stack):
@@ -1,5 +1,7 @@
 """ Average Carbon Monoxide levels in homes vary from 0.5 to 5 parts per million (ppm). """
 
+import json
+import os
 import time
 import math
 # import board
@@ -22,6 +24,22 @@ except ImportError:
 co_x1 = 10
 co_x2 = 100
 
+## Full-scale input ranges (V) of the ADS1x15 PGA for each gain setting
+_ADS1X15_PGA_RANGE = {2 / 3: 6.144, 1: 4.096, 2: 2.048, 4: 1.024, 8: 0.512, 16: 0.256}
+
+RO_MAX_AGE = 30 * 24 * 3600     # a cached Ro whose last full calibration is older than this (seconds) is recalibrated at start-up
+RO_SAVE_INTERVAL = 3600         # minimum seconds between caching incrementally recalibrated Ro values
+
+## Incremental recalibration: every RECAL_WINDOW MQRead()s form a window, and a window counts as
+## clean air if its Rs stayed within RECAL_MAX_SPREAD of its mean and above RECAL_MIN_RATIO times
+## the Ro of the last full MQCalibration() (CO lowers the MQ7's Rs; anchoring to the calibrated Ro
+## keeps a slow CO rise from dragging Ro down window by window). Each clean window moves Ro
+## RECAL_WEIGHT of the way towards its mean.
+RECAL_WINDOW = 20
+RECAL_MAX_SPREAD = 0.05
+RECAL_MIN_RATIO = 0.9
+RECAL_WEIGHT = 0.1
+
 ######################### Helper Functions #########################
 """
 def map_voltage_to_percent(voltage, v_min=0, v_max=5, out_min=0, out_max=100):
@@ -45,6 +63,38 @@ def get_ppm(rs, ro):
     ppm = (1538.46 * (rs / ro)) ** (-1.709)
     return ppm
 
+def adc_key(adc):
+    ## Identifies an ADS1x15 channel across restarts by its I2C address & input, e.g. "0x49:A3"
+    try:
+        return "0x{:02X}:A{}".format(adc._ads.i2c_device.device_address, adc._pin_setting)
+    except AttributeError:
+        return "{}:A{}".format(type(adc).__name__, getattr(adc, '_pin_setting', 0))
+
+def load_ro(ro_file, key):
+    ## Returns (Ro, calibrated Ro, calibration timestamp) stored for `key` in `ro_file`, or None
+    ## (entries without calibration fields were written right after a full calibration)
+    try:
+        with open(ro_file) as f:
+            entry = json.load(f)[key]
+        ro = float(entry['ro'])
+        return ro, float(entry.get('calibrated_ro', ro)), float(entry.get('calibrated', entry['timestamp']))
+    except (OSError, ValueError, KeyError, TypeError, AttributeError):
+        return None
+
+def save_ro(ro_file, key, ro, calibrated_ro, calibrated):
+    ## Stores `ro` for `key` in `ro_file` (atomically), with the Ro & time.time() of its last
+    ## full calibration, keeping the other sensors' entries
+    try:
+        with open(ro_file) as f:
+            entries = json.load(f)
+    except (OSError, ValueError):
+        entries = {}
+    entries[key] = {'ro': ro, 'timestamp': time.time(), 'calibrated_ro': calibrated_ro, 'calibrated': calibrated}
+    tmp_file = ro_file + '.tmp'
+    with open(tmp_file, 'w') as f:
+        json.dump(entries, f, indent=2)
+    os.replace(tmp_file, ro_file)
+
 
 class MQ7():
     ######################### Hardware Related Macros #########################
@@ -58,8 +108,7 @@ class MQ7():
     CALIBARAION_SAMPLE_TIMES     = 50       # define how many samples you are going to take in the calibration phase
     CALIBRATION_SAMPLE_INTERVAL  = 500      # define the time interval(in milisecond) between each samples in the
                                             # cablibration phase
-    READ_SAMPLE_INTERVAL         = 10  #50       # define the time interval(in milisecond) between each samples in
-    READ_SAMPLE_TIMES            = 2  #5        # define how many samples you are going to take in normal operation 
+    READ_SAMPLE_TIMES            = 8        # define how many back-to-back ADC conversions are averaged in
                                             # normal operation
 
     R2 = 2000  ## Most MQ7 boards use a 2 kilo-ohm series resistor for R2 (see schematic)
@@ -72,19 +121,41 @@ class MQ7():
 
     
     # def __init__(self, Ro=10, analogPin=0, vdd=5.0):
-    def __init__(self, adc, Ro=10, vdd=5.0):
-        """ 'ain' parameter should be an `analog_in.AnalogIn` instance for an ADS1x15 ADC channel. """
+    def __init__(self, adc, Ro=None, vdd=5.0, ro_file=None, recalibrate=None, key=None):
+        """ 'adc' parameter should be an `analog_in.AnalogIn` instance for an ADS1x15 ADC channel.
+
+        Ro is taken from (in order): the `Ro` argument, the Ro cached in `ro_file` for this
+        sensor (keyed by `key`, by default the ADC's I2C address & channel) if its last full
+        calibration is under RO_MAX_AGE, or a blocking clean-air MQCalibration() whose result
+        is then cached. With `recalibrate`, every MQRead() also feeds the incremental clean-air
+        recalibration of Ro (cached at most every RO_SAVE_INTERVAL seconds).
+        """
         self.adc = adc
         self.VDD = vdd
-        self.Ro = Ro
+        self.ro_file = ro_file if ro_file is not None else util.MQ7_RO_FILE
+        self.recalibrate = recalibrate if recalibrate is not None else util.MQ7_RECALIBRATE
+        self.key = key if key is not None else adc_key(adc)
+        self._window = []       # Rs of the current recalibration window
+        self._ro_saved = time.monotonic()       # when Ro was last cached
         # self.MQ_PIN = analogPin
         # self.adc = analog_in.AnalogIn(ads1015.ADS1015(i2c, gain=(2/3), address=0x48), analogPin)
 
         self.COCurve = [self.CO_POINT_1[1], self.CO_POINT_2[1], self.CO_SLOPE]
-                
-        print("Calibrating...")
-        self.Ro = self.MQCalibration(self.MQ_PIN)
-        print("Calibration is done...\n")
+
+        self.Ro = Ro
+        self.calibrated_ro = Ro         # Ro of the last full calibration (anchors incremental recalibration)
+        self.calibrated = time.time()   # ... and when it happened
+        if self.Ro is None:
+            cached = load_ro(self.ro_file, self.key) if self.ro_file else None
+            if cached is not None and time.time() - cached[2] <= RO_MAX_AGE:
+                self.Ro, self.calibrated_ro, self.calibrated = cached
+                print("Loaded cached Ro for {} (calibrated {:.1f} h ago)".format(self.key, (time.time() - self.calibrated) / 3600))
+            else:
+                print("Calibrating...")
+                self.Ro = self.calibrated_ro = self.MQCalibration(self.MQ_PIN)
+                self.calibrated = time.time()
+                print("Calibration is done...\n")
+                self.save_ro()
         print("Ro=%f kohm" % self.Ro)
         print("CO CURVE\nPoint 1:  (x = {}, y = {})\nPoint 2:  (x = {}, y = {})\nSlope = {}\n".format(self.CO_POINT_1[0], self.CO_POINT_1[1], self.CO_POINT_2[0], self.CO_POINT_2[1], self.CO_SLOPE))
     
@@ -115,7 +186,7 @@ class MQ7():
             mq_pin = self.MQ_PIN
         val = 0.0
         for i in range(self.CALIBARAION_SAMPLE_TIMES):          # take multiple samples
-            rs_gas = ((self.VDD * self.R2) / self.adc.voltage) - self.R2
+            rs_gas = ((self.VDD * self.R2) / self.MQVoltage()) - self.R2
             val += rs_gas
             time.sleep(self.CALIBRATION_SAMPLE_INTERVAL/1000.0)
             
@@ -123,30 +194,65 @@ class MQ7():
         val = val/self.RO_CLEAN_AIR_FACTOR                      # divided by RO_CLEAN_AIR_FACTOR yields the Ro 
                                                                 # according to the chart in the datasheet 
         return val
-      
-      
+
+
+    def save_ro(self):
+        ## Caches the current Ro for this sensor (a failed write only costs a recalibration later)
+        if not self.ro_file:
+            return
+        try:
+            save_ro(self.ro_file, self.key, self.Ro, self.calibrated_ro, self.calibrated)
+            self._ro_saved = time.monotonic()
+        except OSError as e:
+            print("[MQ7] Could not cache Ro in '{}': {}".format(self.ro_file, e))
+
+
+    ######################### MQVoltage ########################################
+    # Input:   samples - number of conversions to average (READ_SAMPLE_TIMES by default)
+    # Output:  mean sensor voltage
+    # Remarks: The conversions run back-to-back (each takes 1/data_rate s on the ADC),
+    #          their raw codes are summed and only the mean is converted to a voltage.
+    ############################################################################
+    def MQVoltage(self, samples=None):
+        samples = samples or self.READ_SAMPLE_TIMES
+        code = 0
+        for i in range(samples):
+            code += self.adc.value
+        return (code / samples) * _ADS1X15_PGA_RANGE[self.adc._ads.gain] / 32767
+
+
     #########################  MQRead ##########################################
     # Input:   mq_pin - analog channel
     # Output:  Rs of the sensor
     # Remarks: This function use MQResistanceCalculation to caculate the sensor resistenc (Rs).
     #          The Rs changes as the sensor is in the different consentration of the target
-    #          gas. The sample times and the time interval between samples could be configured
-    #          by changing the definition of the macros.
+    #          gas. The number of averaged conversions can be configured with READ_SAMPLE_TIMES.
+    #          With `recalibrate`, each Rs also feeds the clean-air tracking of Ro.
     ############################################################################ 
     def MQRead(self, mq_pin=None):
         if not mq_pin:
             mq_pin = self.MQ_PIN
 
-        rs = 0.0
-        for i in range(self.READ_SAMPLE_TIMES):
-            sensor_volt = self.adc.voltage
-            rs += (self.VDD - sensor_volt) / sensor_volt
-            time.sleep(self.READ_SAMPLE_INTERVAL/1000.0)
-
-        rs = rs/self.READ_SAMPLE_TIMES
+        sensor_volt = self.MQVoltage()
+        rs = (self.VDD - sensor_volt) / sensor_volt
+        if self.recalibrate:
+            self._track_clean_air(rs * self.R2)     # same units as MQCalibration's Rs
         return rs
 
 
+    def _track_clean_air(self, rs):
+        window = self._window
+        window.append(rs)
+        if len(window) < RECAL_WINDOW:
+            return
+        lo, hi, avg = min(window), max(window), sum(window) / len(window)
+        window.clear()
+        if hi - lo <= RECAL_MAX_SPREAD * avg and lo >= RECAL_MIN_RATIO * self.calibrated_ro:
+            self.Ro += RECAL_WEIGHT * (avg / self.RO_CLEAN_AIR_FACTOR - self.Ro)
+            if time.monotonic() - self._ro_saved >= RO_SAVE_INTERVAL:
+                self.save_ro()
+
+
 ######################### Launcher #########################
 
 if __name__ == "__main__":
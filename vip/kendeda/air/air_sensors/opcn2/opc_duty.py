@@ -0,0 +1,219 @@
+"""
+	Duty-cycled operation of a PYNQ OPC-N2 (OPC_Pmod / OPC_Arduino / OPC_USB from opc_pynq.py)
+	for low-power (solar / battery) deployments. Each window's histograms come from the OPC's
+	histogram_record() (on OPC_USB, built from py-opc's histogram read over the USB-ISS adapter).
+
+	Instead of running the fan & laser for the whole deployment, the OPC is powered up shortly
+	before each sample window, kept on only until enough histogram periods have been collected
+	for a reading of the required quality, then powered down until the next window:
+
+		IDLE --(window start - lead time)--> WARMING --(warmed up)--> COLLECTING --(quality met or max_periods)--+
+		  ^                                  (laser off)              (fan at fan_power, laser on,                 |
+		  |                                                            one histogram per sampling period)          |
+		  +------------------------------------------ off() ---------------------------------------------------+
+
+	update() advances this without blocking (call it from the node's main loop); it returns a
+	DutySample whenever a window completes. sample() is the blocking equivalent for one window.
+	If the off() at the end of a window fails, update() keeps retrying it while idle, and the time
+	until the OPC is confirmed off still counts towards `total_on_time`.
+"""
+import time
+from collections import namedtuple
+
+import numpy as np
+try:
+	import opc_power
+except ImportError:
+	from opcn2 import opc_power
+
+## ==================================================================
+
+SAMPLE_INTERVAL = 300 	## Seconds between the starts of consecutive sample windows
+LEAD_TIME = 5 			## Seconds before a window to power up (should cover the fan's warmup)
+MIN_PERIODS = 3 		## Minimum valid histogram periods for a reading to be considered valid
+MIN_VOLUME = 20.0 		## Minimum total sampled air volume (ml) for a valid reading
+MAX_PERIODS = 10 		## Give up (reporting an invalid reading) after this many histogram reads
+
+IDLE       = 'idle'
+WARMING    = 'warming'
+COLLECTING = 'collecting'
+
+## One completed sample window:
+##   timestamp (time.time() at the end of collection), pm (PM1, PM2.5, PM10; period-weighted means),
+##   bins (number concentration (#/cc) of bins 0-15 over the whole window), periods (valid histograms used),
+##   volume (ml of air sampled), on_time (s the OPC was powered for this sample), valid (quality met)
+DutySample = namedtuple('DutySample', ['timestamp', 'pm', 'bins', 'periods', 'volume', 'on_time', 'valid'])
+
+
+class DutyCycledOPC:
+	"""
+	:param opc:         an opc_pynq OPC device (already initialized; powered off between windows)
+	:param interval:    seconds between the starts of consecutive sample windows
+	:param lead_time:   seconds before each window to start powering up
+	:param min_periods: minimum # of valid histogram periods for a valid reading
+	:param min_volume:  minimum sampled volume (ml) for a valid reading
+	:param max_periods: histogram reads after which the window ends even if the quality was not met
+	:param fan_power:   if given, fan power level (0-255) to set (via set_fan_power) on every power-up
+	"""
+
+	def __init__(self, opc, interval=SAMPLE_INTERVAL, lead_time=LEAD_TIME, min_periods=MIN_PERIODS,
+						min_volume=MIN_VOLUME, max_periods=MAX_PERIODS, fan_power=None):
+		self.opc = opc
+		self.interval = interval
+		self.lead_time = lead_time
+		self.min_periods = min_periods
+		self.min_volume = min_volume
+		self.max_periods = max(max_periods, min_periods)
+		self.fan_power = fan_power
+
+		self.state = IDLE
+		self.total_on_time = 0.0 	## Powered-on seconds over all samples so far
+		self._off_requested = None 	## time.monotonic() of a power-off not yet confirmed (None: confirmed off)
+		self.samples = 0
+		self._next_window = time.monotonic() + lead_time 	## First window as soon as the OPC can be warmed up
+		self._reset_window()
+
+
+	def _reset_window(self):
+		self._powered_at = None
+		self._last_read = None
+		self._reads = 0
+		self._periods = 0
+		self._counts = np.zeros(16)
+		self._volume = 0.0
+		self._pm_sums = np.zeros(3)
+		self._time_sum = 0.0
+
+
+	@property
+	def on_time(self):
+		"""Seconds the OPC has been powered for the current window (0 while idle)."""
+		return 0.0 if self._powered_at is None else time.monotonic() - self._powered_at
+
+
+	@property
+	def duty_cycle(self):
+		"""Fraction of the elapsed sample intervals that the OPC was powered for."""
+		return self.total_on_time / (self.samples * self.interval) if self.samples else 0.0
+
+
+	@property
+	def quality_met(self):
+		return self._periods >= self.min_periods and self._volume >= self.min_volume
+
+
+	def seconds_until_next_window(self):
+		return max(0.0, self._next_window - self.lead_time - time.monotonic())
+
+
+	def seconds_until_update(self):
+		"""Seconds until update() has something to do while idle: the next window, or sooner,
+		the next retry of a failed power-off."""
+		delay = self.seconds_until_next_window()
+		if self._off_requested is not None:
+			delay = min(delay, max(0.0, self.opc.power.retry_at - time.monotonic()))
+		return delay
+
+
+	def _confirm_off(self, now):
+		"""Retry a failed power-off; once the OPC is off, count the extra time it stayed on."""
+		power = self.opc.power.update()
+		if power == opc_power.FAULT:
+			self.opc.off(block=False) 		## Keep trying (still one attempt per retry delay)
+			power = self.opc.power.state
+		if power == opc_power.OFF:
+			self.total_on_time += now - self._off_requested
+			self._off_requested = None
+
+
+	def update(self):
+		"""Advance the duty cycle without blocking. Returns a DutySample when a window completes, else None."""
+		now = time.monotonic()
+
+		if self.state == IDLE:
+			if self._off_requested is not None:
+				self._confirm_off(now)
+			if now >= self._next_window - self.lead_time:
+				if self._off_requested is not None: 	## Never got switched off; it was on until now
+					self.total_on_time += now - self._off_requested
+					self._off_requested = None
+				self._powered_at = now
+				self.opc.on(block=False)
+				self.state = WARMING
+
+		if self.state == WARMING:
+			power = self.opc.power.update()
+			if power == opc_power.WARMING and self.opc.laser.target:
+				self.opc.toggle_laser(False, block=False) 		## No need for the laser while the fan warms up
+			elif power == opc_power.ON:
+				if self.fan_power is not None:
+					self.opc.set_fan_power(self.fan_power)
+				self.opc.toggle_laser(True, block=False)
+				self.state = COLLECTING
+			elif power == opc_power.FAULT:
+				self.opc.on(block=False) 		## Keep trying (still one attempt per retry delay)
+
+		elif self.state == COLLECTING:
+			if self.opc.laser.state == opc_power.FAULT:
+				self.opc.toggle_laser(True, block=False)
+			if self.opc.ready:
+				if self._last_read is None:
+					self.opc.histogram_record() 	## Discard whatever accumulated before the window, starting a fresh period
+					self._last_read = now
+				elif now - self._last_read >= self._period():
+					self._collect(self.opc.histogram_record(number_concentration=False))
+					self._last_read = now
+					if self.quality_met or self._reads >= self.max_periods:
+						return self._finish()
+
+		if self.state != IDLE and self.on_time > self.interval:
+			return self._finish() 		## The OPC never became ready this window; report it as invalid
+		return None
+
+
+	def _period(self):
+		"""Seconds between histogram reads: the mean reported sampling period so far (1 s until known)."""
+		return self._time_sum / self._periods if self._periods else 1.0
+
+
+	def _collect(self, hist):
+		self._reads += 1
+		if hist is None or not hist.period or not hist.sfr:
+			return
+		self._periods += 1
+		self._counts += hist.bins
+		self._volume += hist.sfr * hist.period
+		self._pm_sums += np.asarray(hist.pm) * hist.period
+		self._time_sum += hist.period
+
+
+	def _finish(self):
+		on_time = self.on_time
+		if not self.opc.off(block=False):
+			self._off_requested = time.monotonic() 	## Retried by update() while idle
+		sample = DutySample(
+			timestamp=time.time(),
+			pm=tuple(np.round(self._pm_sums / self._time_sum, 5).tolist()) if self._time_sum else (0.0, 0.0, 0.0),
+			bins=self._counts / self._volume if self._volume else self._counts,
+			periods=self._periods,
+			volume=self._volume,
+			on_time=on_time,
+			valid=self.quality_met,
+		)
+		self.total_on_time += on_time
+		self.samples += 1
+		self._next_window += self.interval
+		if self._next_window - self.lead_time < time.monotonic(): 	## Overran the interval; skip ahead
+			self._next_window = time.monotonic() + self.lead_time
+		self.state = IDLE
+		self._reset_window()
+		return sample
+
+
+	def sample(self, poll=0.1):
+		"""Blocking: wait for the next sample window & return its DutySample."""
+		while True:
+			sample = self.update()
+			if sample is not None:
+				return sample
+			time.sleep(self.seconds_until_update() if self.state == IDLE else poll)
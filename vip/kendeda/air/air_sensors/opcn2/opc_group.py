@@ -0,0 +1,110 @@
+"""
+	Concurrent sampling of several OPC-N2 devices that sit on independent hardware paths
+	(e.g., OPC_Pmod on PmodA, OPC_Arduino on the Arduino IOP & OPC_USB on the USB-ISS).
+
+	Each device gets its own single-thread worker, so the devices are read in parallel while
+	every individual device is still only ever accessed by one thread at a time. The cycle time
+	for N devices is that of the slowest one, rather than the sum of all of them.
+
+	Example:
+
+		>>> group = OPCGroup({'pmod': OPC_Pmod(overlay=base), 'arduino': OPC_Arduino(overlay=base)})
+		>>> group.on()
+		>>> timestamp, pm = group.pm()
+		>>> pm['pmod']['PM2.5'], pm['arduino']['PM2.5']
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+## ==================================================================
+
+READ_TIMEOUT = 10 		## Seconds to wait for any one device's read before reporting it as None
+POWER_TIMEOUT = 60 		## Seconds to wait for on/off/close (which retry with long delays)
+
+
+class OPCGroup:
+	"""
+	Runs the same method on every OPC in `devices` (dict of name -> device) concurrently.
+	Methods return (timestamp, {name: result}), where `timestamp` is the midpoint of the
+	devices' reads; `skew` holds the spread (seconds) between the earliest & latest of them.
+	A device whose call raised or timed out gets a result of None.
+	"""
+
+	def __init__(self, devices, timeout=READ_TIMEOUT):
+		self.devices = dict(devices)
+		self.timeout = timeout
+		self.skew = 0.0
+		self._workers = {name: ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"OPC-{name}") for name in self.devices}
+		self.log_msg_prefix = f"[{self.__class__.__name__}] "
+
+
+	def log(self, prefix, msg, end='\n'):
+		print(f"{prefix} {msg}", end=end)
+
+
+	def _timed_call(self, device, method, args, kwargs):
+		result = getattr(device, method)(*args, **kwargs)
+		return time.time(), result
+
+
+	def map(self, method, *args, timeout=None, **kwargs):
+		"""Call `device.method(*args, **kwargs)` on all devices at once.
+
+		:rtype: (float, dict)
+		"""
+		timeout = self.timeout if timeout is None else timeout
+		futures = {name: self._workers[name].submit(self._timed_call, device, method, args, kwargs)
+						for name, device in self.devices.items()}
+
+		deadline = time.time() + timeout
+		results = {}
+		times = []
+		for name, future in futures.items():
+			try:
+				t, results[name] = future.result(timeout=max(0.0, deadline - time.time()))
+				times.append(t)
+			except TimeoutError:
+				self.log(self.log_msg_prefix, f"{name}.{method}() timed out after {timeout} s")
+				results[name] = None
+			except Exception as e:
+				self.log(self.log_msg_prefix, f"{name}.{method}() raised {type(e).__name__}: {e}")
+				results[name] = None
+
+		if times:
+			self.skew = max(times) - min(times)
+			timestamp = (max(times) + min(times)) / 2
+		else:
+			self.skew = 0.0
+			timestamp = time.time()
+		return timestamp, results
+
+
+	def pm(self):
+		return self.map('pm')
+
+
+	def histogram(self, number_concentration=True):
+		return self.map('histogram', number_concentration)
+
+
+	def on(self, force=False):
+		return self.map('on', force, timeout=POWER_TIMEOUT)[1]
+
+
+	def off(self, force=False):
+		return self.map('off', force, timeout=POWER_TIMEOUT)[1]
+
+
+	def close(self, force=False):
+		results = self.map('close', force, timeout=POWER_TIMEOUT)[1]
+		for worker in self._workers.values():
+			worker.shutdown(wait=False)
+		return results
+
+
+	def __enter__(self):
+		return self
+
+
+	def __exit__(self, *exc):
+		self.close()
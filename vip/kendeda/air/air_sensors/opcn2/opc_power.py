@@ -0,0 +1,142 @@
+"""
+	Non-blocking on/off state machine for the OPC-N2's switchable subsystems
+	(fan & laser power together, or the fan / laser individually).
+
+	A Switch never sleeps on its own: request() records the desired state and makes at most one
+	command attempt, and every later update() (also run by `ready` & seconds_until_ready()) makes
+	the next attempt once the retry delay has passed. Readiness is tracked with timestamps, so a
+	reader can cheaply check `ready` and skip or defer its read while the device is still warming
+	up, instead of freezing the whole node in sleep()s. wait() is the blocking equivalent.
+
+	States:
+		OFF      -  confirmed off (and meant to be)
+		PENDING  -  state change requested, command not yet attempted
+		BACKOFF  -  last command attempt failed; retried after `retry_delay`
+		FAULT    -  `max_retries` attempts failed; cleared by the next request()
+		WARMING  -  confirmed on, but not yet `warmup` seconds ago
+		ON       -  on & warmed up, i.e., ready for reads
+"""
+import time
+
+OFF     = 'off'
+PENDING = 'pending'
+BACKOFF = 'backoff'
+FAULT   = 'fault'
+WARMING = 'warming'
+ON      = 'on'
+
+
+class Switch:
+	"""
+	:param name:        for logging / display
+	:param command:     callable(on) -> bool making ONE attempt to switch the subsystem on/off
+	:param warmup:      seconds from a successful 'on' command until the subsystem is ready
+	:param retry_delay: seconds between failed command attempts
+	:param max_retries: failed attempts before giving up (FAULT)
+	"""
+
+	def __init__(self, name, command, warmup=0.0, retry_delay=10, max_retries=4, clock=time.monotonic):
+		self.name = name
+		self._command = command
+		self.warmup = warmup
+		self.retry_delay = retry_delay
+		self.max_retries = max_retries
+		self._clock = clock
+
+		self.target = False 		## Desired state
+		self.is_on = False 			## Last state confirmed by the device
+		self.attempts = 0 			## Failed attempts at reaching `target`
+		self.retry_at = 0.0
+		self.ready_at = 0.0
+
+
+	def __repr__(self):
+		return f"<Switch {self.name}: {self.state}>"
+
+
+	@property
+	def state(self):
+		if self.is_on != self.target:
+			if self.attempts >= self.max_retries:
+				return FAULT
+			return BACKOFF if self.attempts else PENDING
+		if not self.is_on:
+			return OFF
+		return WARMING if self._clock() < self.ready_at else ON
+
+
+	def request(self, on, force=False):
+		"""Ask for the subsystem to be switched on/off, making the first attempt right away.
+		With `force`, the command is sent even if the subsystem is believed to be in that state.
+		"""
+		on = bool(on)
+		if force:
+			self.is_on = not on
+		if on != self.target or force or self.state == FAULT:
+			self.target = on
+			self.attempts = 0
+			self.retry_at = 0.0
+		return self.update()
+
+
+	def assume(self, on, warmup=0.0):
+		"""Record a state change that happened as a side effect of another command (no command sent)."""
+		self.target = self.is_on = bool(on)
+		self.attempts = 0
+		self.ready_at = self._clock() + warmup
+
+
+	def update(self):
+		"""Advance the state machine, making at most one (due) command attempt. Returns the state."""
+		if self.is_on != self.target and self.attempts < self.max_retries:
+			now = self._clock()
+			if now >= self.retry_at:
+				if self._command(self.target):
+					self.is_on = self.target
+					self.attempts = 0
+					self.ready_at = now + (self.warmup if self.target else 0.0)
+				else:
+					self.attempts += 1
+					self.retry_at = now + self.retry_delay
+		return self.state
+
+
+	@property
+	def ready(self):
+		"""True once on & warmed up. Never blocks (beyond a due command attempt)."""
+		return self.update() == ON
+
+
+	def seconds_until_ready(self):
+		"""Best-case seconds until `ready` (0 if ready now), or None if it won't become ready
+		without a new request() (i.e., it is meant to be off, or has faulted).
+		"""
+		state = self.update()
+		now = self._clock()
+		if state == ON:
+			return 0.0
+		if state == WARMING:
+			return self.ready_at - now
+		if not self.target or state == FAULT:
+			return None
+		return max(0.0, self.retry_at - now) + self.warmup
+
+
+	def wait(self, timeout=None):
+		"""Block until the requested state is reached (including warmup) or the switch faults.
+		Returns True if it settled in the requested state within `timeout` seconds.
+		"""
+		deadline = None if timeout is None else self._clock() + timeout
+		while True:
+			state = self.update()
+			if state in (ON, OFF):
+				return True
+			if state == FAULT:
+				return False
+			now = self._clock()
+			delay = (self.ready_at if state == WARMING else self.retry_at) - now
+			if deadline is not None:
+				if now >= deadline:
+					return False
+				delay = min(delay, deadline - now)
+			time.sleep(max(delay, 0.0))
@@ -13,24 +13,33 @@
 
 		on()
 		off()
+		ready
 		wait()
 		reset()
 		close()
 		pm()
 		histogram()
+		histogram_record()
 		ping()
 		sn()
 		read_info_string()
 		firmware_version()
 		set_fan_power()
 		toggle_fan()
+		toggle_laser()
 """
 import os
 import sys
 import time
 import struct
 import functools
+import numpy as np
+from collections import namedtuple
 from pynq.lib import MicroblazeLibrary
+try:
+	import opc_power
+except ImportError:
+	from opcn2 import opc_power
 
 ## ==================================================================
 
@@ -38,6 +47,7 @@ TESTING = False			## If True, will only run the OPC '_test_*' functions
 MOCK_MICROBLAZE = False
 RUN_FAN_POWER_TEST = False
 INFINITE_POLL = False
+USE_IOP_PROGRAM = True 	## Load OPCN2_IOP_PROGRAM so that each multi-byte read costs one Microblaze RPC
 
 ## Default Arduino header pin assignments for SPI connection
 ARDUINO_SCLK_PIN = 13
@@ -63,6 +73,8 @@ OFF = 0
 ON  = 1
 MAX_RETRIES = 4
 RETRY_DELAY = 10 	## Seconds to wait in between reattempting failed on/off commands
+WARMUP_TIME = 3 	## Seconds after powering on before the fan & laser give valid readings
+FAN_SPINUP_TIME = 2 	## Seconds for the fan alone to spin back up after toggle_fan(ON)
 SAMPLE_DELAY = 5	## Seconds to wait in between reading new sensor data
 
 MSBFIRST = 'BIG_ENDIAN' 	## I believe the OPC is big endian
@@ -78,9 +90,57 @@ OPC_CLK_PHASE = 1
 MB_BIT_ORDER = LSBFIRST
 FP_PRECISION = 5
 
+OPC_MAX_READ_LEN = 62 		## Longest response (in bytes) to any OPC-N2 command (the histogram)
+OPC_BYTE_DELAY_US = 10 		## Delay between consecutive response bytes (microseconds)
+
+## Layout of the 62 byte histogram response (all multi-byte fields little-endian):
+##   bins 0-15 (uint16 x 16), MToF of bins 1/3/5/7 (uint8 x 4, units of 1/3 us), sample flow rate (float, ml/s),
+##   temperature (*C x 10) or pressure (Pa) -- it alternates (uint32), sampling period (float, s),
+##   checksum = low 16 bits of the sum of the bins (uint16), PM1/PM2.5/PM10 (float x 3)
+HISTOGRAM_STRUCT = struct.Struct('<16H4BfIfH3f')
+assert HISTOGRAM_STRUCT.size == 62
+
+PM_STRUCT = struct.Struct('<3f')		## Layout of the 12 byte PM response (PM1, PM2.5, PM10)
+
+## Decoded histogram: `bins` is a NumPy array (16), `mtof` & `pm` (PM1, PM2.5, PM10) are tuples
+Histogram = namedtuple('Histogram', ['bins', 'mtof', 'sfr', 'temperature', 'pressure', 'period', 'checksum', 'pm'])
+
+_BIN_KEYS  = tuple(f"bin{i}" for i in range(16))
+_MTOF_KEYS = ('bin1_MToF', 'bin3_MToF', 'bin5_MToF', 'bin7_MToF')
+_PM_KEYS   = ('PM1', 'PM2.5', 'PM10')
+
+## Microblaze program compiled onto the IOP by iop_library(). Besides the usual spi_* functions,
+## it provides opcn2_read(), which sends a command byte, waits for the OPC to prepare its response,
+## then clocks out `length` bytes into read_data -- all with the datasheet's timing, in one RPC call.
+OPCN2_IOP_PROGRAM = r"""
+#include <spi.h>
+#include <timer.h>
+
+void opcn2_read(spi dev, unsigned int command, char* read_data, unsigned int length, unsigned int cmd_wait_us, unsigned int byte_wait_us) {
+	char tx = command;
+	char rx;
+	unsigned int i;
+	spi_transfer(dev, &tx, &rx, 1);
+	delay_us(cmd_wait_us);
+	tx = 0x00;
+	for (i = 0; i < length; i++) {
+		spi_transfer(dev, &tx, &read_data[i], 1);
+		delay_us(byte_wait_us);
+	}
+}
+"""
+
 ## ==================================================================
 ## Utility / Helper Functions
 
+def iop_library(mb_info):
+	"""Compile & load OPCN2_IOP_PROGRAM onto a PYNQ IOP. The returned library can be used
+	in place of `MicroblazeLibrary(mb_info, ['spi'])` (e.g., for spi_open()).
+	"""
+	from pynq.lib import MicroblazeRPC
+	return MicroblazeRPC(mb_info, OPCN2_IOP_PROGRAM)
+
+
 def _shorts2float(lo_byte_pair, hi_byte_pair):
 	""" 
 	Takes in 2 unsigned short (integers) and packs their collective
@@ -168,6 +228,57 @@ def _calculate_pressure(vals):
 	return ((vals[3] << 24) | (vals[2] << 16) | (vals[1] << 8) | vals[0])
 
 
+def _temp_or_pressure(raw):
+	"""The histogram's temperature/pressure field alternates between the two, so tell
+	them apart by magnitude. Returns (temperature, pressure), one or both of them None.
+	"""
+	if raw > 98000:
+		return None, raw
+	t = round(raw / 10.0, FP_PRECISION)
+	if t < 500:
+		return t, None
+	return None, None
+
+
+def decode_histogram(frame, number_concentration=True):
+	"""Decodes a raw 62 byte histogram response (any bytes-like object) in one pass.
+
+	:param number_concentration: If true, bins are converted from counts to number concentration (#/cc)
+	:rtype: Histogram, or None if the checksum does not match the bins
+	"""
+	fields = HISTOGRAM_STRUCT.unpack(frame)
+	counts = fields[:16]
+	checksum = fields[23]
+	if (sum(counts) & 0xFFFF) != checksum:
+		return None
+
+	sfr = round(fields[20], FP_PRECISION)
+	period = round(fields[22], FP_PRECISION)
+	bins = np.array(counts, dtype=float)
+	if number_concentration and sfr * period:
+		bins /= sfr * period 		## Divider in units of ml (cc)
+
+	temperature, pressure = _temp_or_pressure(fields[21])
+	mtof = tuple(round(m / 3.0, FP_PRECISION) for m in fields[16:20])
+	pm = tuple(round(v, FP_PRECISION) for v in fields[24:])
+	return Histogram(bins, mtof, sfr, temperature, pressure, period, checksum, pm)
+
+
+def histogram_to_dict(hist, d=None):
+	"""Flattens a Histogram into the (py-opc style) dict returned by histogram(), filling `d` if given."""
+	if d is None:
+		d = {}
+	d.update(zip(_BIN_KEYS, hist.bins.tolist()))
+	d.update(zip(_MTOF_KEYS, hist.mtof))
+	d['sfr'] = hist.sfr
+	d['temperature'] = hist.temperature
+	d['pressure'] = hist.pressure
+	d['period'] = hist.period
+	d['checksum'] = hist.checksum
+	d.update(zip(_PM_KEYS, hist.pm))
+	return d
+
+
 def _calculate_period(vals):
 	"""Calculate the sampling period in seconds"""
 	if len(vals) < 4:
@@ -204,85 +315,121 @@ class _OPC_Base:
 
 		self._pm_dict = {'PM1': 0.0, 'PM2.5': 0.0, 'PM10': 0.0}
 		self._hist_dict = {}
-		self.state = OFF
+
+		## Non-blocking on/off state machines (see opc_power.py); power = fan & laser together
+		self.power = opc_power.Switch('power', self._power_command, warmup=WARMUP_TIME, retry_delay=RETRY_DELAY, max_retries=MAX_RETRIES)
+		self.fan   = opc_power.Switch('fan', self._fan_command, warmup=FAN_SPINUP_TIME, retry_delay=RETRY_DELAY, max_retries=MAX_RETRIES)
+		self.laser = opc_power.Switch('laser', self._laser_command, retry_delay=RETRY_DELAY, max_retries=MAX_RETRIES)
+
+		self._rx_buf = [0x00] * OPC_MAX_READ_LEN 		## Reused for every multi-byte read
+		self._tx_zeros = [0x00] * OPC_MAX_READ_LEN
 
 
 	def log(self, prefix, msg, end='\n'):
 		print(f"{prefix} {msg}", end=end)
 
 
-	def on(self, force=False):
-		"""Turn ON the OPC (fan and laser)
+	@property
+	def state(self):
+		return ON if self.power.is_on else OFF
 
-		:returns: boolean success state
+
+	@property
+	def ready(self):
+		"""True once the fan & laser are on and warmed up. Never blocks (at most, it makes
+		one due command attempt), so callers can cheaply skip reads until the OPC is ready.
 		"""
+		return self.power.ready and self.fan.ready and self.laser.ready
+
+
+	def _log_result(self, success, action, switch):
+		if hasattr(self, 'log_msg_prefix'):
+			self.log(self.log_msg_prefix, '', end='')
+		if success:
+			print(f"SUCCESS -- {action}.")
+		elif switch.attempts + 1 < switch.max_retries:
+			print(f"Attempt #{switch.attempts + 1} failed -- retrying after delay ...")
+		else:
+			print("ERROR -- command failed.")
+
+
+	def _power_command(self, on):
+		"""One attempt at switching the fan & laser on/off together. Returns whether it succeeded."""
 		rb0 = [0x00]
 		rb1 = [0x00, 0x00]
-		attempts = 0
-
-		if force:
-			self.state = OFF 
 
-		while self.state != ON and attempts < MAX_RETRIES:
-			self.spi.transfer([0x03], rb0, 1)		## Send the command byte; response will be written to rb0
-			time.sleep(9e-3) 						## Sleep for 9 ms
+		self.spi.transfer([0x03], rb0, 1)			## Send the command byte; response will be written to rb0
+		time.sleep(9e-3) 							## Sleep for 9 ms
+		if on:
 			self.spi.transfer([0x00, 0x01], rb1, 2)	## Send the following 2 bytes; response will be written to rb1
-			time.sleep(0.1)
+		else:
+			self.spi.transfer([0x01], rb1, 1)		## Send the following byte; response will be written to rb1
+		time.sleep(0.1)
 
-			if rb0[0] < 0: 						## Account for implicit unsigned-to-signed 
-				rb0[0] += 256					## conversion from the transfer operation
+		success = (rb0[0] & 0xFF) == 0xF3 and rb1[0] == 0x03 	## Ensure response values are as expected
+		self._log_result(success, f"device powered {'on' if on else 'off'}", self.power)
+		if success:
+			self.fan.assume(on)
+			self.laser.assume(on)
+		return success
 
-			attempts += 1
 
-			if hasattr(self, 'log_msg_prefix'):
-				self.log(self.log_msg_prefix, '', end='')
+	def _fan_command(self, on):
+		"""One attempt at switching only the fan on/off."""
+		rb0 = [0x00]
+		rb1 = [0x00]
 
-			if rb0[0] == 0xF3 and rb1[0] == 0x03: 	## Ensure response values are as expected
-				self.state = ON 
-				print("SUCCESS -- device powered on.")
-			else:
-				if attempts != MAX_RETRIES:
-					print(f"Attempt #{attempts} failed -- retrying after delay ...")
-					time.sleep(RETRY_DELAY)
-				else:
-					print("ERROR -- command failed.")
+		self.spi.transfer([0x03], rb0, 1)
+		time.sleep(10e-3)
 
-		return self.state == ON
+		self.spi.transfer([0x05-int(on)], rb1, 1) 	## Write 0x04 to turn ON, else 0x05 for OFF
+		time.sleep(0.1)
 
+		success = (rb0[0] & 0xFF) == 0xF3 and rb1[0] == 0x03
+		self._log_result(success, f"fan toggled {'ON' if on else 'OFF'}", self.fan)
+		return success
 
-	def off(self, force=False):
+
+	def _laser_command(self, on):
+		"""One attempt at switching only the laser on/off."""
 		rb0 = [0x00]
 		rb1 = [0x00]
-		attempts = 0
 
-		if force:
-			self.state = ON 
+		self.spi.transfer([0x03], rb0, 1)
+		time.sleep(10e-3)
 
-		while self.state != OFF and attempts < MAX_RETRIES:
-			self.spi.transfer([0x03], rb0, 1)	## Send the command byte; response will be written to rb0
-			time.sleep(9e-3) 					## Sleep for 9 ms
-			self.spi.transfer([0x01], rb1, 1)	## Send the following byte; response will be written to rb1
-			time.sleep(0.1)
+		self.spi.transfer([0x03-int(on)], rb1, 1) 	## Write 0x02 to turn ON, else 0x03 for OFF
+		time.sleep(0.1)
 
-			if rb0[0] < 0: 						## Account for implicit unsigned-to-signed 
-				rb0[0] += 256					## conversion from the transfer operation
+		success = (rb0[0] & 0xFF) == 0xF3 and rb1[0] == 0x03
+		self._log_result(success, f"laser toggled {'ON' if on else 'OFF'}", self.laser)
+		return success
 
-			attempts += 1
 
-			if hasattr(self, 'log_msg_prefix'):
-				self.log(self.log_msg_prefix, '', end='')
+	def on(self, force=False, block=True):
+		"""Turn ON the OPC (fan and laser)
 
-			if rb0[0] == 0xF3 and rb1[0] == 0x03: 	## Ensure response values are as expected
-				self.state = OFF 
-				print("SUCCESS -- device powered off.")
-			else:
-				if attempts != MAX_RETRIES:
-					print(f"Attempt #{attempts} failed -- retrying after delay ...")
-					time.sleep(RETRY_DELAY)
-				else:
-					print("ERROR -- command failed.")
+		With block=False this only requests it: the first command attempt is made right away, any
+		failed attempt is retried RETRY_DELAY s later whenever the state machine is next updated
+		(e.g., by `ready` or a read), and `ready` becomes True WARMUP_TIME s after success.
+
+		:returns: boolean success state (with block=False: whether the command has succeeded yet)
+		"""
+		self.power.request(ON, force=force)
+		if block:
+			self.power.wait()
+		return self.power.is_on
 
-		return self.state == OFF 
+
+	def off(self, force=False, block=True):
+		"""Turn OFF the OPC (fan and laser). See on() for the non-blocking (block=False) behavior.
+
+		:returns: boolean success state
+		"""
+		self.power.request(OFF, force=force)
+		if block:
+			self.power.wait()
+		return not self.power.is_on
 
 
 	def wait(self, **kwargs):
@@ -314,9 +461,7 @@ class _OPC_Base:
 
 	def reset(self, force=False):
 		self.off(force=force)
-		time.sleep(2)
 		self.on(force=force)
-		time.sleep(2)
 
 
 	def close(self, force=False):
@@ -342,8 +487,28 @@ class _OPC_Base:
 		# return self.lib.spi_get_num_devices()  ## ^ Should be equivalent to the above command
 
 
+	def _read_bytes(self, command, length, cmd_wait=10e-3):
+		"""Send a command byte, wait `cmd_wait` seconds, then read the `length` byte response.
+
+		With the OPCN2_IOP_PROGRAM library loaded this is a single RPC to the IOP (which also
+		keeps the inter-byte delay); otherwise it is one transfer for the command byte and one
+		multi-byte transfer for the response.
+
+		:rtype: bytes (unsigned)
+		"""
+		rx = self._rx_buf
+		bulk_read = getattr(self._lib, 'opcn2_read', None)
+		if bulk_read is not None:
+			bulk_read(self.spi, command, rx, length, int(cmd_wait * 1e6), OPC_BYTE_DELAY_US)
+		else:
+			self.spi.transfer([command], [0x00], 1)
+			time.sleep(cmd_wait)
+			self.spi.transfer(self._tx_zeros, rx, length)
+		return bytes(b & 0xFF for b in rx[:length]) 	## Undo the implicit unsigned-to-signed conversion
+
+
 	def pm(self):
-		"""Read the PM data and reset the histogram
+		"""Read the PM data and reset the histogram. Returns None right away if the OPC is not `ready`.
 
 		**NOTE: This method is supported by firmware v18+.**
 
@@ -358,27 +523,18 @@ class _OPC_Base:
 			'PM10': 1.42
 		}
 		"""
+		if not self.ready:
+			return None
 
 		self._pm_dict = dict.fromkeys(self._pm_dict, 0.0)		## Initialize all PM values to 0
 		read_attempts = 0
 
 		while not any(self._pm_dict.values()):		## First read always returns all zeros; try again until good data is read 
-			resp = []
-			self.spi.transfer([0x32], [0x00], 1)	## Send the command byte
-			time.sleep(10e-3) 						## Wait 10 ms
-
-			## Read the 12 bytes of PM data from the histogram
-			for i in range(12):
-				rb = [0x00]
-				self.spi.transfer([0x00], rb, 1)
-				if rb[0] < 0:
-					rb[0] += 256
-				resp.append(rb[0])
+			resp = self._read_bytes(0x32, 12)		## Send the command byte, then read the 12 bytes of PM data
 
 			## Make conversions to floats & store PM values
-			self._pm_dict['PM1']   = _calculate_float(resp[:4])
-			self._pm_dict['PM2.5'] = _calculate_float(resp[4:8])
-			self._pm_dict['PM10']  = _calculate_float(resp[8:])
+			for key, value in zip(_PM_KEYS, PM_STRUCT.unpack(resp)):
+				self._pm_dict[key] = round(value, FP_PRECISION)
 
 			time.sleep(0.1)
 			read_attempts += 1
@@ -422,97 +578,25 @@ class _OPC_Base:
 		}
 		"""
 
-		resp = []
-		self.spi.transfer([0x30], [0x00], 1)
-		time.sleep(10e-3)
-		for i in range(62):
-			rb = [0x00]
-			self.spi.transfer([0x00], rb, 1)
-			if rb[0] < 0:
-				rb[0] += 256
-			resp.append(rb[0])
-		
-		self._hist_dict['bin0']  = _16bit_unsigned(resp[0],  resp[1])
-		self._hist_dict['bin1']  = _16bit_unsigned(resp[2],  resp[3])
-		self._hist_dict['bin2']  = _16bit_unsigned(resp[4],  resp[5])
-		self._hist_dict['bin3']  = _16bit_unsigned(resp[6],  resp[7])
-		self._hist_dict['bin4']  = _16bit_unsigned(resp[8],  resp[9])
-		self._hist_dict['bin5']  = _16bit_unsigned(resp[10], resp[11])
-		self._hist_dict['bin6']  = _16bit_unsigned(resp[12], resp[13])
-		self._hist_dict['bin7']  = _16bit_unsigned(resp[14], resp[15])
-		self._hist_dict['bin8']  = _16bit_unsigned(resp[16], resp[17])
-		self._hist_dict['bin9']  = _16bit_unsigned(resp[18], resp[19])
-		self._hist_dict['bin10'] = _16bit_unsigned(resp[20], resp[21])
-		self._hist_dict['bin11'] = _16bit_unsigned(resp[22], resp[23])
-		self._hist_dict['bin12'] = _16bit_unsigned(resp[24], resp[25])
-		self._hist_dict['bin13'] = _16bit_unsigned(resp[26], resp[27])
-		self._hist_dict['bin14'] = _16bit_unsigned(resp[28], resp[29])
-		self._hist_dict['bin15'] = _16bit_unsigned(resp[30], resp[31])
-
-		self._hist_dict['bin1_MToF'] = _calculate_mtof(resp[32])
-		self._hist_dict['bin3_MToF'] = _calculate_mtof(resp[33])
-		self._hist_dict['bin5_MToF'] = _calculate_mtof(resp[34])
-		self._hist_dict['bin7_MToF'] = _calculate_mtof(resp[35])
-
-		self._hist_dict['sfr'] = _calculate_float(resp[36:40])		## Sample flow rate
-
-		## Alright, we don't know whether it is temp or pressure since it switches...
-		tmp = _calculate_pressure(resp[40:44])
-		if tmp > 98000:
-			self._hist_dict['temperature'] = None
-			self._hist_dict['pressure']    = tmp
-		else:
-			tmp = _calculate_temp(resp[40:44])
-			if tmp < 500:
-				self._hist_dict['temperature'] = tmp
-				self._hist_dict['pressure']    = None
-			else:
-				self._hist_dict['temperature'] = None
-				self._hist_dict['pressure']    = None
-
-		self._hist_dict['period'] = _calculate_float(resp[44:48])		## Sampling period
-
-		self._hist_dict['checksum'] = _16bit_unsigned(resp[48], resp[49])
-
-		self._hist_dict['PM1']   = _calculate_float(resp[50:54])
-		self._hist_dict['PM2.5'] = _calculate_float(resp[54:58])
-		self._hist_dict['PM10']  = _calculate_float(resp[58:])
-
-		## Calculate the sum of the histogram bins
-		histogram_sum = self._hist_dict['bin0'] + self._hist_dict['bin1'] + self._hist_dict['bin2'] + \
-				self._hist_dict['bin3'] + self._hist_dict['bin4'] + self._hist_dict['bin5'] + self._hist_dict['bin6'] + \
-				self._hist_dict['bin7'] + self._hist_dict['bin8'] + self._hist_dict['bin9'] + self._hist_dict['bin10'] + \
-				self._hist_dict['bin11'] + self._hist_dict['bin12'] + self._hist_dict['bin13'] + self._hist_dict['bin14'] + \
-				self._hist_dict['bin15']
-
-		## Check that checksum and the least significant bits of the sum of histogram bins are equivilant
-		if (histogram_sum & 0x0000FFFF) != self._hist_dict['checksum']:
-			self.log(self.log_msg_prefix if hasattr(self, 'log_msg_prefix') else '', "CHECKSUM ERROR: Histogram data transfer was incomplete")
+		hist = self.histogram_record(number_concentration)
+		if hist is None:
 			return None
+		return histogram_to_dict(hist, self._hist_dict)
 
-		## If number_concentration flag is set, convert histogram values to number concentration
-		if number_concentration is True:
-			_conv_ = self._hist_dict['sfr'] * self._hist_dict['period'] 	## Divider in units of ml (cc)
-
-			self._hist_dict['bin0']  /= _conv_
-			self._hist_dict['bin1']  /= _conv_
-			self._hist_dict['bin2']  /= _conv_
-			self._hist_dict['bin3']  /= _conv_
-			self._hist_dict['bin4']  /= _conv_
-			self._hist_dict['bin5']  /= _conv_
-			self._hist_dict['bin6']  /= _conv_
-			self._hist_dict['bin7']  /= _conv_
-			self._hist_dict['bin8']  /= _conv_
-			self._hist_dict['bin9']  /= _conv_
-			self._hist_dict['bin10'] /= _conv_
-			self._hist_dict['bin11'] /= _conv_
-			self._hist_dict['bin12'] /= _conv_
-			self._hist_dict['bin13'] /= _conv_
-			self._hist_dict['bin14'] /= _conv_
-			self._hist_dict['bin15'] /= _conv_
 
+	def histogram_record(self, number_concentration=True):
+		"""Same as histogram(), but returns the compact Histogram record (bins as a NumPy array)
+		rather than a dict. Returns None if the histogram checksum fails or the OPC is not `ready`.
+
+		:rtype: Histogram
+		"""
+		if not self.ready:
+			return None
+		hist = decode_histogram(self._read_bytes(0x30, 62), number_concentration)
+		if hist is None:
+			self.log(self.log_msg_prefix if hasattr(self, 'log_msg_prefix') else '', "CHECKSUM ERROR: Histogram data transfer was incomplete")
 		time.sleep(0.1)
-		return self._hist_dict 
+		return hist
 
 
 	def ping(self):
@@ -545,15 +629,9 @@ class _OPC_Base:
 		>>> alpha.sn()
 		'OPC-N2 123456789'
 		"""
-		string = []
-		resp = [0x00]
-		self.spi.transfer([0x10], [0x00], 1)
-		time.sleep(9e-3)
-		for i in range(60):
-			self.spi.transfer([0x00], resp, 1)
-			string.append(chr(resp[0]))
+		resp = self._read_bytes(0x10, 60, cmd_wait=9e-3)
 		time.sleep(0.1)
-		return ''.join(string).strip()
+		return resp.decode('latin-1').strip()
 
 
 	def read_info_string(self):
@@ -566,20 +644,10 @@ class _OPC_Base:
 		>>> alpha.read_info_string()
 		'OPC-N2 FirmwareVer=OPC-018.2....................BD'
 		"""
-		infostring = []
-
-		## Send the command byte and sleep for 9 ms
-		self.spi.transfer([0x3F], [0x00], 1)
-		time.sleep(9e-3)
-
-		## Read the info string by sending 60 empty bytes
-		for i in range(60):
-			resp = [0x00]
-			self.spi.transfer([0x00], resp, 1)
-			infostring.append(chr(resp[0] & 0xFF))
-
+		## Send the command byte, wait 9 ms, then read the 60 byte info string
+		resp = self._read_bytes(0x3F, 60, cmd_wait=9e-3)
 		time.sleep(0.1)
-		return ''.join(infostring).strip()
+		return resp.decode('latin-1').strip()
 
 	
 	def firmware_version(self):
@@ -624,33 +692,24 @@ class _OPC_Base:
 		return success
 			
 
-	def toggle_fan(self, state):
+	def toggle_fan(self, state, block=True):
+		"""Switch only the fan on/off. See on() for the non-blocking (block=False) behavior."""
 		if state not in (OFF, ON):
 			raise ValueError("The fan state must be 0|False or 1|True.")
+		self.fan.request(state)
+		if block:
+			self.fan.wait()
+		return self.fan.is_on == bool(state)
 
-		rb0 = [0x00]
-		rb1 = [0x00]
-
-		self.spi.transfer([0x03], rb0, 1)
-		time.sleep(10e-3)
-
-		self.spi.transfer([0x05-state], rb1, 1) 	## Write 0x04 to turn ON, else 0x05 for OFF
-		time.sleep(0.1)
-
-		if rb0[0] < 0:
-			rb0[0] += 256
-
-		success = (rb0[0] == 0xF3) and (rb1[0] == 0x03)
-
-		if hasattr(self, 'log_msg_prefix'):
-			self.log(self.log_msg_prefix, '', end=' ')
-			
-		if success:
-			print(f"Fan toggled to {'OFF' if state == OFF else 'ON'}")
-		else:
-			print("ERROR: Failed to toggle OPC fan power")
 
-		return success 
+	def toggle_laser(self, state, block=True):
+		"""Switch only the laser on/off. See on() for the non-blocking (block=False) behavior."""
+		if state not in (OFF, ON):
+			raise ValueError("The laser state must be 0|False or 1|True.")
+		self.laser.request(state)
+		if block:
+			self.laser.wait()
+		return self.laser.is_on == bool(state)
 
 
 ## ==================================================================
@@ -659,19 +718,21 @@ class OPC_Pmod(_OPC_Base):
 	""" 
 	Methods inherited from _OPC_Base:
 		- log(self, prefix, msg, end='\n')
-		- on(self, force=False)
-		- off(self, force=False)
+		- on(self, force=False, block=True)
+		- off(self, force=False, block=True)
 		- wait(self, **kwargs)
 		- reset(self, force=False)
 		- close(self, force=False)
 		- pm(self)
 		- histogram(self, number_concentration=True)
+		- histogram_record(self, number_concentration=True)
 		- ping(self)
 		- sn(self)
 		- read_info_string(self)
 		- firmware_version(self)
 		- set_fan_power(self, power)
-		- toggle_fan(self, state)
+		- toggle_fan(self, state, block=True)
+		- toggle_laser(self, state, block=True)
 	"""
 
 	def __init__(self, pmod_ab='A', overlay=None, mb_info=None, wait=False,
@@ -696,7 +757,7 @@ class OPC_Pmod(_OPC_Base):
 		if mb_info is None:
 			mb_info = self._overlay.iop_pmoda if pmod_ab.upper() == 'A' else self._overlay.iop_pmodb
 
-		self._lib = MicroblazeLibrary(mb_info, ['spi'])
+		self._lib = iop_library(mb_info) if USE_IOP_PROGRAM else MicroblazeLibrary(mb_info, ['spi'])
 		self.spi = self._lib.spi_open(self.sclk, self.miso, self.mosi, self.ss)
 		""" 
 			^ Methods for the `spi` object:
@@ -736,19 +797,21 @@ class OPC_Arduino(_OPC_Base):
 	""" 
 	Methods inherited from _OPC_Base:
 		- log(self, prefix, msg, end='\n')
-		- on(self, force=False)
-		- off(self, force=False)
+		- on(self, force=False, block=True)
+		- off(self, force=False, block=True)
 		- wait(self, **kwargs)
 		- reset(self, force=False)
 		- close(self, force=False)
 		- pm(self)
 		- histogram(self, number_concentration=True)
+		- histogram_record(self, number_concentration=True)
 		- ping(self)
 		- sn(self)
 		- read_info_string(self)
 		- firmware_version(self)
 		- set_fan_power(self, power)
-		- toggle_fan(self, state)
+		- toggle_fan(self, state, block=True)
+		- toggle_laser(self, state, block=True)
 	"""
 
 	def __init__(self, overlay=None, mb_info=None, wait=False):
@@ -759,7 +822,7 @@ class OPC_Arduino(_OPC_Base):
 		if mb_info is None:
 			mb_info = self._overlay.iop_arduino
 
-		self._lib = MicroblazeLibrary(mb_info, ['spi'])
+		self._lib = iop_library(mb_info) if USE_IOP_PROGRAM else MicroblazeLibrary(mb_info, ['spi'])
 		self.spi = self._lib.spi_open(ARDUINO_SCLK_PIN, ARDUINO_MISO_PIN, ARDUINO_MOSI_PIN, ARDUINO_SS_PIN)
 		""" 
 			^ Methods for the `spi` object:
@@ -859,32 +922,25 @@ class OPC_USB(_OPC_Base):
 
 		
 	## Overriden method
-	def on(self, force=False):
-		if force:
-			self.state = OFF 
-		if self.state == OFF:
-			self._opcn2.on()
-			self.state = ON
-			time.sleep(3)    ## Give it some time to warm up
-		if self.state == ON:
-			self.log(self.log_msg_prefix, "SUCCESS -- device powered on.")
-			return True
-		self.log(self.log_msg_prefix, "ERROR -- command failed.")
-		return False
+	def _power_command(self, on):
+		success = bool(self._opcn2.on() if on else self._opcn2.off())
+		self._log_result(success, f"device powered {'on' if on else 'off'}", self.power)
+		if success:
+			self.fan.assume(on)
+			self.laser.assume(on)
+		return success
 
 	## Overriden method
-	def off(self, force=False):
-		if force:
-			self.state = ON 
-		if self.state == ON:
-			self._opcn2.off()
-			self.state = OFF
-			time.sleep(1)
-		if self.state == OFF:
-			self.log(self.log_msg_prefix, "SUCCESS -- device powered off.")
-			return True
-		self.log(self.log_msg_prefix, "ERROR -- command failed.")
-		return False
+	def _fan_command(self, on):
+		success = bool(self._opcn2.toggle_fan(on))
+		self._log_result(success, f"fan toggled {'ON' if on else 'OFF'}", self.fan)
+		return success
+
+	## Overriden method
+	def _laser_command(self, on):
+		success = bool(self._opcn2.toggle_laser(on))
+		self._log_result(success, f"laser toggled {'ON' if on else 'OFF'}", self.laser)
+		return success
 
 
 	# def wait(self, **kwargs):     ## <-- Allowing instead the invocation of parent's wait() method
@@ -917,10 +973,6 @@ class OPC_USB(_OPC_Base):
 	def set_fan_power(self, power):
 		return self._opcn2.set_fan_power(power)
 
-	
-	## Overriden method
-	def toggle_fan(self, state):
-		return self._opcn2.toggle_fan(state)
 
 
 	## Overriden method
@@ -928,7 +980,10 @@ class OPC_USB(_OPC_Base):
 		""" 
 		Returns a dict of the format {'PM1': x, 'PM10': y, 'PM2.5': z} 
 		Particular matter density concentration units: num. of particles per cubic centimeter (#/cc).
+		Returns None right away if the OPC is not `ready`.
 		"""
+		if not self.ready:
+			return None
 		if self._prev_pm is not None and (time.time() - self._last_read_time) < 2:
 			return self._prev_pm
 			
@@ -955,8 +1010,13 @@ class OPC_USB(_OPC_Base):
 
 	## Overriden method
 	def histogram(self, number_concentration=True):
+		if not self.ready:
+			return None
 		# self.on()    ## Ensure device is on before attempting a read operation
 		hist = self._opcn2.histogram(number_concentration=number_concentration)
+		if hist is None: 		## py-opc returns None when the checksum fails
+			self.log(self.log_msg_prefix, "CHECKSUM ERROR: Histogram data transfer was incomplete")
+			return None
 		self._hist_dict = hist
 		self._prev_pm = {   
 						'PM1':round(hist['PM1'], FP_PRECISION), 
@@ -969,6 +1029,27 @@ class OPC_USB(_OPC_Base):
 		return self._hist_dict 
 
 
+	## Overriden method
+	def histogram_record(self, number_concentration=True):
+		"""Same as histogram(), but returns the compact Histogram record, built from py-opc's histogram
+		dict (the base class' version needs the Microblaze SPI transfer, which the USB-ISS adapter lacks).
+		Returns None if the histogram checksum fails or the OPC is not `ready`.
+		"""
+		hist = self.histogram(number_concentration)
+		if hist is None:
+			return None
+		return Histogram(
+			bins=np.array([hist[f'Bin {i}'] for i in range(16)], dtype=float),
+			mtof=tuple(round(hist[f'Bin{i} MToF'], FP_PRECISION) for i in (1, 3, 5, 7)),
+			sfr=round(hist['SFR'], FP_PRECISION),
+			temperature=hist['Temperature'],
+			pressure=hist['Pressure'],
+			period=round(hist['Sampling Period'], FP_PRECISION),
+			checksum=hist['Checksum'],
+			pm=tuple(round(hist[key], FP_PRECISION) for key in _PM_KEYS),
+		)
+
+
 ## ==================================================================
 ## ==================================================================
 
@@ -1,10 +1,22 @@
 import time
 import opc      ## Pypi package name:  py-opc
 from opc.exceptions import FirmwareVersionError
+try:
+    from opcn2 import pm_mass, opc_power
+except ImportError:
+    import pm_mass
+    import opc_power
 
 OFF_STATE = 0x0
 ON_STATE  = 0x1
 
+DEFAULT_SAMPLING_PERIOD = 2.0   ## Seconds; assumed until the OPC has reported its own sampling period
+MAX_SAMPLING_PERIOD = 30.0      ## Reported periods outside of (0, MAX_SAMPLING_PERIOD] are ignored as bogus
+MAX_READ_ATTEMPTS = 5           ## Histogram reads attempted (e.g., on checksum errors) per new snapshot
+WARMUP_TIME = 3                 ## Seconds after powering on before the OPC gives valid readings
+RETRY_DELAY = 10                ## Seconds between failed on/off command attempts
+MAX_RETRIES = 4
+
 """ Wiring configuration for SPI via GPIO:
 ------------------------------------------------------------------------
 | Pin   |   Function            | OPC   | RPi                          |
@@ -24,6 +36,14 @@ class OPC_N2():
     For driving the OPC-N2 using the provided USB cable, set the `use_usb`
     parameter to True. Else, if `use_usb` is False, connect via GPIO pins.
     All communications use the SPI protocol.
+
+    The full histogram is read (and thereby reset on the device) at most once per
+    the OPC's own sampling period, and every accessor (PM1, PM25, PM10, bins, pm)
+    is served from that one snapshot, so values read together are coherent.
+
+    Powering on/off never blocks (see opc_power.py): until the OPC is on & warmed
+    up (and while its power faults or its reads fail), accessors return None rather
+    than stale or made-up values, so callers skip those readings.
     """
     def __init__(self, use_usb=False, usb_port="/dev/ttyACM0"):
         if use_usb:
@@ -39,9 +59,12 @@ class OPC_N2():
         ## Set the SPI mode and clock speed
         self.spi.mode = 1
         self.spi.max_speed_hz = 500000
-        self._state = OFF_STATE
-        self._prev_pm = None
-        self._last_read_time = 0
+        self.power = opc_power.Switch('power', self._power_command, warmup=WARMUP_TIME, retry_delay=RETRY_DELAY, max_retries=MAX_RETRIES)
+        self._primed = False            ## Whether the first (meaningless) histogram since power-on has been discarded
+        self._snapshot = None           ## Most recent valid histogram (py-opc dict)
+        self._snapshot_time = 0         ## time.time() at which the snapshot was read
+        self._period_start = 0          ## time.time() at which the OPC's current sampling period began
+        self._period = DEFAULT_SAMPLING_PERIOD
         self._opcn2 = None
         spi_err_cnt = 0
         while self._opcn2 is None and spi_err_cnt < 5:
@@ -64,38 +87,91 @@ class OPC_N2():
             raise ValueError("\n[OPC_N2] ERROR: INIT FAILED AFTER {} ATTEMPTS (SPI bus error!)\n".format(spi_err_cnt+1))
         self.on()
 
-    def on(self):
-        if self.state == OFF_STATE:
-            self._opcn2.on()
-            self._state = ON_STATE
-            time.sleep(3)    ## Give it some time to warm up
+    def on(self, block=False):
+        """ Requests the OPC (fan & laser) on. Only blocks (until warmed up) if `block` is set. """
+        self.power.request(True)
+        if block:
+            self.power.wait()
+        return self.power.is_on
+
+    def off(self, block=False):
+        self.power.request(False)
+        if block:
+            self.power.wait()
+        return not self.power.is_on
 
-    def off(self):
-        if self.state == ON_STATE:
-            self._opcn2.off()
-            self._state = OFF_STATE
+    def _power_command(self, on):
+        """ One attempt at switching the OPC on/off (see opc_power.Switch). """
+        success = bool(self._opcn2.on() if on else self._opcn2.off())
+        if not success:
+            print("[OPC_N2] Power {} command failed (attempt #{})".format('on' if on else 'off', self.power.attempts + 1))
+        elif on:
+            self._primed = False
+        return success
+
+    def _ensure_ready(self):
+        """ Never blocks: returns True once the OPC is on & warmed up (first discarding the
+        meaningless first histogram after power-up, which starts a fresh sampling period). """
+        if not self.power.ready:
+            return False
+        if not self._primed:
+            self._opcn2.histogram()
+            self._period_start = time.time()
+            self._primed = True
+        return True
+
+    def _read_snapshot(self):
+        """ Reads (and resets) the OPC's histogram, making it the current snapshot. Returns True on success. """
+        for _ in range(MAX_READ_ATTEMPTS):
+            hist = self._opcn2.histogram()
+            if hist is not None:    ## py-opc returns None on a checksum error
+                break
+        else:
+            return False
+        self._snapshot = hist
+        self._snapshot_time = self._period_start = time.time()
+        period = hist.get('Sampling Period')
+        if period is not None and 0 < period <= MAX_SAMPLING_PERIOD:
+            self._period = period
+        return True
+
+    def wait_for_next_sample(self, timeout=None):
+        """
+        Blocks until the OPC has completed a full sampling period since the current
+        snapshot (powering it on & waiting out its warmup first, if needed), then reads it.
+        Returns the new snapshot, or None if that would take longer than `timeout` seconds,
+        the OPC could not be powered on, or the read failed.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        self.on()    ## Ensure device is on before attempting a read operation
+        warmup = self.power.seconds_until_ready()
+        if warmup is None or (timeout is not None and warmup > timeout):
+            return None
+        if warmup > 0 and not self.power.wait(timeout):
+            return None
+        self._ensure_ready()
+        delay = self._period_start + self._period - time.time()
+        if deadline is not None and time.time() + delay > deadline:
+            return None
+        if delay > 0:
+            time.sleep(delay)
+        return self._snapshot if self._read_snapshot() else None
 
     def pm(self):
         """ 
         Returns a dict of the format {'PM1': x, 'PM10': y, 'PM2.5': z} 
         Particular matter density concentration units: num. of particles per cubic centimeter (#/cc).
+        Returns None if there is no fresh snapshot.
         """
-        self.on()    ## Ensure device is on before attempting a read operation
-        pm = self._opcn2.pm()
-        pm_err_cnt = 0
-        while not any(pm.values()):
-            if pm_err_cnt > 4:
-                break
-            pm = self._opcn2.pm()
-            pm_err_cnt += 1
-        for key in pm.keys():
-            pm[key] = round(pm[key], 4)
-        self._prev_pm = pm
-        self._last_read_time = time.time()
-        return pm 
+        snapshot = self.fresh_snapshot()
+        if snapshot is None:
+            return None
+        return {key: round(snapshot[key], 4) for key in ('PM1', 'PM10', 'PM2.5')}
 
     def histogram(self):
         """
+        Reads a new histogram right away (without waiting out the sampling period) and
+        returns it, or None if it could not be read. It becomes the current snapshot.
         Returns a dictionary with the following entries:
             {
                 'Temperature': None,
@@ -118,37 +194,92 @@ class OPC_N2():
             }
         """
         self.on()    ## Ensure device is on before attempting a read operation
-        hist = self._opcn2.histogram()
-        self._prev_pm = {   
-                        'PM1':round(hist['PM1'], 4), 
-                        'PM10':round(hist['PM10'], 4), 
-                        'PM2.5':round(hist['PM2.5'], 4)
-                        }
-        self._last_read_time = time.time()
-        return hist
+        if not self._ensure_ready():
+            return None
+        return self._snapshot if self._read_snapshot() else None
 
 
     @property
     def state(self):
-        return self._state
+        return ON_STATE if self.power.is_on else OFF_STATE
+
+    @property
+    def ready(self):
+        """ True once the OPC is on & warmed up (never blocks). """
+        return self.power.ready
+
+    @property
+    def sampling_period(self):
+        """ The OPC's sampling period (seconds), as last reported by the device. """
+        return self._period
+
+    @property
+    def age(self):
+        """ Seconds since the current snapshot was read (None if there is none yet). """
+        if self._snapshot is None:
+            return None
+        return time.time() - self._snapshot_time
+
+    @property
+    def snapshot(self):
+        """
+        The current histogram, first re-read if the OPC has completed a sampling period since.
+        Never waits on the OPC's power-up/warmup (the stale snapshot, or None, is returned
+        meanwhile); only the very first snapshot after warmup waits out one sampling period.
+        """
+        if not self._ensure_ready():
+            return self._snapshot
+        if self._snapshot is None or time.time() - self._period_start >= self._period:
+            delay = self._period_start + self._period - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            self._read_snapshot()
+        return self._snapshot
+
+    def fresh_snapshot(self):
+        """
+        The current snapshot (see `snapshot`), or None unless the OPC is ready and the
+        snapshot is from within its last two sampling periods (i.e., not while warming
+        up, off or faulted, and not after repeated failed reads).
+        """
+        snapshot = self.snapshot
+        if snapshot is None or not self.power.ready or self.age > 2 * self._period:
+            return None
+        return snapshot
 
     @property
     def prev_pm(self):
-        if self._prev_pm is None or (time.time() - self._last_read_time) > 2:
-            return self.pm()
-        return self._prev_pm
+        return self.pm()
+
+    def _snapshot_value(self, key):
+        snapshot = self.fresh_snapshot()
+        return round(snapshot[key], 4) if snapshot is not None else None
 
     # @property
     def PM1(self):
-        return round(self.prev_pm['PM1'], 4)
+        return self._snapshot_value('PM1')
     
     # @property
     def PM25(self):
-        return round(self.prev_pm['PM2.5'], 4)
+        return self._snapshot_value('PM2.5')
 
     # @property
     def PM10(self):
-        return round(self.prev_pm['PM10'], 4)
+        return self._snapshot_value('PM10')
+
+    def bins(self):
+        """ Number concentrations (#/cc) of histogram bins 0-15 (None if there is no fresh snapshot). """
+        snapshot = self.fresh_snapshot()
+        if snapshot is None:
+            return None
+        return [snapshot['Bin {}'.format(i)] for i in range(16)]
+
+    def histogram_fields(self, rh=None):
+        """ The current snapshot as the fields of one histogram point (see pm_mass.histogram_fields). """
+        snapshot = self.fresh_snapshot()
+        if snapshot is None:
+            return None
+        return pm_mass.histogram_fields(self.bins(), rh=rh, sfr=snapshot.get('SFR'), period=snapshot.get('Sampling Period'))
 
 
     def __del__(self):
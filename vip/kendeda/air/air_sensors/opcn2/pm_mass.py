@@ -0,0 +1,90 @@
+""" pm_mass.py -- Mass concentration (ug/m^3) from OPC-N2 particle size histograms.
+
+Each histogram bin's number concentration (#/cc) is converted to mass by assuming spherical particles
+of the bin's midpoint diameter and a configurable density, optionally corrected for hygroscopic growth
+at high relative humidity (kappa-Kohler, see Crilley et al., AMT 11, 2018). All conversions are a single
+vectorized pass over the bins and also work on batches of histograms (arrays of shape (N, 16)).
+"""
+
+import numpy as np
+
+try:
+	from util import util
+except ImportError:
+	import os, sys
+	rootpath = '/'.join(os.getcwd().split('/')[:-1])
+	print("[{}] Appending '{}' to PYTHONPATH".format(__file__, rootpath))
+	sys.path.append(rootpath)
+	from util import util
+
+##------------------------------------------------------------------------------
+
+## OPC-N2 bin boundaries (optical diameter, um): bin i spans [BIN_BOUNDARIES[i], BIN_BOUNDARIES[i+1])
+BIN_BOUNDARIES = np.array([0.38, 0.54, 0.78, 1.05, 1.34, 1.59, 2.07, 3.0, 4.0,
+							5.0, 6.5, 8.0, 10.0, 12.0, 14.0, 16.0, 17.5])
+BIN_MIDPOINTS = (BIN_BOUNDARIES[:-1] + BIN_BOUNDARIES[1:]) / 2.0
+BIN_VOLUMES = (np.pi / 6.0) * BIN_MIDPOINTS**3 		## um^3 per particle
+
+PM_SIZES = (1.0, 2.5, 10.0) 	## um
+MAX_RH = 99.0 	## RH (%) is clamped to this for the growth correction, which diverges at 100%
+
+def _pm_weights(sizes):
+	""" (len(sizes), 16) matrix of the fraction of each bin (linear in diameter) below each PM size. """
+	lo, hi = BIN_BOUNDARIES[:-1], BIN_BOUNDARIES[1:]
+	return np.clip((np.asarray(sizes)[:, None] - lo) / (hi - lo), 0.0, 1.0)
+
+PM_WEIGHTS = _pm_weights(PM_SIZES)
+
+## Field names of a published histogram point (see histogram_fields)
+_N_KEYS  = tuple('n{}'.format(i) for i in range(16))
+_M_KEYS  = tuple('m{}'.format(i) for i in range(16))
+_C_KEYS  = tuple('c{}'.format(i) for i in range(16))
+_PM_KEYS = ('mass_pm1', 'mass_pm2.5', 'mass_pm10')
+
+##------------------------------------------------------------------------------
+
+def growth_correction(rh, density=util.PM_PARTICLE_DENSITY, kappa=util.PM_KAPPA):
+	""" Factor by which hygroscopic growth inflates the measured mass at relative humidity `rh` (%).
+	Divide wet masses by this to get dry masses. Returns 1 if rh is None or kappa is 0.
+	"""
+	if rh is None or not kappa:
+		return 1.0
+	a_w = np.clip(np.asarray(rh, dtype=float), 0.0, MAX_RH) / 100.0 	## Water activity
+	return 1.0 + (kappa / density) / (1.0 / a_w - 1.0)
+
+
+def mass_concentration(bins, rh=None, density=util.PM_PARTICLE_DENSITY, kappa=util.PM_KAPPA):
+	""" Per-bin & cumulative mass concentrations (ug/m^3) of the OPC-N2 histogram `bins` (#/cc).
+	For batches, `bins` is (N, 16) and `rh` is None, a scalar or N values.
+	Returns (per_bin, cumulative), both shaped like `bins`.
+	"""
+	## n [#/cc] * 1e6 [cc/m^3] * V [um^3] * 1e-12 [cm^3/um^3] * rho [g/cm^3] * 1e6 [ug/g] = n * V * rho
+	per_bin = np.asarray(bins, dtype=float) * (BIN_VOLUMES * density)
+	correction = growth_correction(rh, density, kappa)
+	if np.ndim(correction):
+		correction = np.asarray(correction)[..., None]
+	per_bin = per_bin / correction
+	return per_bin, np.cumsum(per_bin, axis=-1)
+
+
+def pm_mass(per_bin):
+	""" PM1, PM2.5 & PM10 (ug/m^3) from per-bin mass concentrations, splitting the bins that straddle each size. """
+	return per_bin @ PM_WEIGHTS.T
+
+
+def histogram_fields(bins, rh=None, sfr=None, period=None, density=util.PM_PARTICLE_DENSITY, kappa=util.PM_KAPPA):
+	""" Flat {field: value} dict of one histogram for publishing as a single multi-field point:
+	number concentrations n0-n15 (#/cc), mass concentrations m0-m15 & cumulative mass c0-c15 (ug/m^3),
+	mass_pm1/mass_pm2.5/mass_pm10 (ug/m^3), plus the sample flow rate & sampling period if given.
+	"""
+	bins = np.asarray(bins, dtype=float)
+	per_bin, cumulative = mass_concentration(bins, rh, density, kappa)
+	fields = dict(zip(_N_KEYS, bins.round(4).tolist()))
+	fields.update(zip(_M_KEYS, per_bin.round(4).tolist()))
+	fields.update(zip(_C_KEYS, cumulative.round(4).tolist()))
+	fields.update(zip(_PM_KEYS, pm_mass(per_bin).round(4).tolist()))
+	if sfr is not None:
+		fields['sfr'] = float(sfr)
+	if period is not None:
+		fields['period'] = float(period)
+	return fields
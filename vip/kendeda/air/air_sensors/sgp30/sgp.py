@@ -1,4 +1,17 @@
 import adafruit_sgp30
+import json
+import os
+import threading
+import time
+from collections import namedtuple
+
+SAMPLE_PERIOD = 1.0                     ## Seconds between iaq_measure calls (the on-chip algorithm expects 1 Hz)
+BASELINE_CHECKPOINT = 3600              ## Seconds between baseline checkpoints (hourly, per Sensirion)
+FIRST_BASELINE_AFTER = 12 * 3600        ## Without a restored baseline, the first one is only valid after 12 h
+BASELINE_MAX_AGE = 7 * 24 * 3600        ## Stored baselines older than a week are not restored (per Sensirion)
+
+## Latest measurement published by SGP30Service (timestamp is time.time() of the measurement)
+SGPReading = namedtuple('SGPReading', ['timestamp', 'eco2', 'tvoc'])
 
 class SGP30():
         """Wrapper class for an Adafruit SGP30 sensor"""
@@ -17,53 +30,248 @@ class SGP30():
 
                 """
                 self.sgp = adafruit_sgp30.Adafruit_SGP30(bus)
+                self.service = None
                 self.humidity_set = False
                 self.iaq_init()
                 self.set_iaq_baseline(0x8CC9, 0x8F12)
 
+        def start_service(self, baseline_file=None, checkpoint_interval=BASELINE_CHECKPOINT):
+                """ Start measuring at 1 Hz on a background SGP30Service (restoring the
+                baselines checkpointed to `baseline_file`, if any). From then on, get_tvoc(),
+                get_eco2() & get_iaq() return its latest snapshot, and the humidity & baseline
+                getters/setters are handed to the service thread, which does all of the SGP30's I/O.
+                """
+                if self.service is None:
+                        self.service = SGP30Service(self.sgp, baseline_file, checkpoint_interval)
+                        self.service.start()
+                return self.service
+
+        def stop_service(self):
+                if self.service is not None:
+                        self.service.stop()
+                        self.service = None
+
         def get_tvoc(self):
-                """ Returns the Total Volatile Organic Compound in parts per billion"""
+                """ Returns the Total Volatile Organic Compound in parts per billion
+                (None while a running service has no measurement yet)
+                """
+                if self.service is not None:
+                        reading = self.service.latest()
+                        return None if reading is None else reading.tvoc
                 return self.sgp.TVOC
 
         def get_tvoc_baseline(self):
                 """ Returns the Total Volatile Organic Compound baseline value
                 in parts per billion
                 """
+                if self.service is not None:
+                        baseline = self.service.baseline()
+                        return None if baseline is None else baseline[1]
                 return self.sgp.baseline_TVOC
 
         def get_eco2(self):
-                """ Returns the Carbon Dioxide Equivalent in parts per million"""
+                """ Returns the Carbon Dioxide Equivalent in parts per million
+                (None while a running service has no measurement yet)
+                """
+                if self.service is not None:
+                        reading = self.service.latest()
+                        return None if reading is None else reading.eco2
                 return self.sgp.eCO2
 
         def get_eco2_baseline(self):
                 """ Returns the Carbon Dioxide Equivalent baseline value in parts
                 per million
                 """
+                if self.service is not None:
+                        baseline = self.service.baseline()
+                        return None if baseline is None else baseline[0]
                 return self.sgp.baseline_eCO2
 
         def iaq_init(self):
-                """ Initialize the iaq algorithm """
+                """ Initialize the iaq algorithm (not while the service is running: it would
+                restart the algorithm underneath it)
+                """
+                if self.service is not None:
+                        raise RuntimeError("SGP30 iaq_init() while its service is running; stop_service() first")
                 self.sgp.iaq_init()
 
         def get_iaq(self):
-                """ Returns the baseline eCO2 and TVOC values in an array"""
+                """ Returns the eCO2 and TVOC values in an array (the service's latest
+                measurement while it runs; None if it has none yet)
+                """
+                if self.service is not None:
+                        reading = self.service.latest()
+                        return None if reading is None else [reading.eco2, reading.tvoc]
                 return self.sgp.iaq_measure()
 
         def get_iaq_baseline(self):
-                """ Returns the baselines for eCO2 and TVOC in an array"""
+                """ Returns the baselines for eCO2 and TVOC in an array (read by the service
+                thread while it runs; None if it did not answer in time)
+                """
+                if self.service is not None:
+                        return self.service.baseline()
                 return self.sgp.get_iaq_baseline()
 
         def set_iaq_baseline(self, eCO2=0x8973, TVOC=0x8AAE):
                 """ Set the iaq algorithm baseline for eCO2 and TVOC
                 done in hex
                 usually starts as 0x8973 and 0x8AAE respectively
+                (applied by the service thread before its next measurement while it runs)
                 """
-                self.sgp.set_iaq_baseline(eCO2, TVOC)
+                if self.service is not None:
+                        self.service.set_baseline(eCO2, TVOC)
+                else:
+                        self.sgp.set_iaq_baseline(eCO2, TVOC)
 
         def set_iaq_humidity(self, gramsPM3):
                 """ Set the humidity in g/m3 for eCO2 and TVOC compensation algorithm
                 Can be set up for better accuracy through another humidity sensor
                 """
-                self.sgp.set_iaq_humidity(gramsPM3)
+                if self.service is not None:
+                        self.service.set_humidity(gramsPM3)
+                else:
+                        self.sgp.set_iaq_humidity(gramsPM3)
                 self.humidity_set = True
 
+
+class SGP30Service():
+        """ Background thread running the SGP30's IAQ algorithm at its expected 1 Hz.
+
+        Each measurement is published as an immutable SGPReading (`snapshot`) that readers
+        take without waiting on the sensor. Humidity compensation values handed to
+        set_humidity() and baselines handed to set_baseline() are written by the service
+        thread before its next measurement, and baseline() is answered by it after one, so
+        all of the SGP30's I/O stays on one thread. The IAQ baselines are checkpointed to
+        `baseline_file` (every `checkpoint_interval` seconds, but only once they are valid:
+        after 12 h of operation, unless a baseline was restored) and restored at start-up,
+        so a restart doesn't force the whole learning period again.
+        """
+
+        def __init__(self, sgp, baseline_file=None, checkpoint_interval=BASELINE_CHECKPOINT, period=SAMPLE_PERIOD):
+                """ `sgp` is the Adafruit_SGP30 driver (after iaq_init) """
+                self.sgp = sgp
+                self.baseline_file = baseline_file
+                self.checkpoint_interval = checkpoint_interval
+                self.period = period
+                self.errors = 0
+                self.snapshot = None            ## Latest SGPReading; replaced (never mutated) by the service thread
+                self._humidity = None           ## Latest humidity (g/m3) handed to set_humidity()
+                self._applied_humidity = None   ## ... and the last one written to the sensor
+                self._baseline = None           ## Baseline (eCO2, TVOC) to write before the next measurement
+                self._read_baseline = threading.Event()         ## Set by baseline(): read the baselines after the next measurement
+                self._baseline_read = threading.Event()         ## ... set by the service thread once `last_baseline` is fresh
+                self.last_baseline = None       ## Latest [eCO2, TVOC] baselines read by the service thread
+                self._new_reading = threading.Event()
+                self._stop = threading.Event()
+                self._thread = None
+
+                self.baseline_restored = self.restore_baseline()
+                ## The sensor's baselines are only worth saving once restored or learned for 12 h
+                self._baseline_valid_at = time.monotonic() + (0 if self.baseline_restored else FIRST_BASELINE_AFTER)
+                self._next_checkpoint = self._baseline_valid_at + (checkpoint_interval if self.baseline_restored else 0)
+
+        def restore_baseline(self):
+                """ Restore the checkpointed baselines (if recent enough). Returns True if restored. """
+                if not self.baseline_file or not os.path.exists(self.baseline_file):
+                        return False
+                try:
+                        with open(self.baseline_file) as f:
+                                saved = json.load(f)
+                        if time.time() - saved['timestamp'] > BASELINE_MAX_AGE:
+                                print("[SGP30Service] Stored baseline is over a week old; not restoring it")
+                                return False
+                        self.sgp.set_iaq_baseline(saved['eco2'], saved['tvoc'])
+                except (OSError, ValueError, KeyError, RuntimeError) as e:
+                        print("[SGP30Service] Could not restore baseline from '{}': {}".format(self.baseline_file, e))
+                        return False
+                print("[SGP30Service] Restored baseline eCO2=0x{:04X}, TVOC=0x{:04X}".format(saved['eco2'], saved['tvoc']))
+                return True
+
+        def save_baseline(self):
+                """ Checkpoint the current baselines to `baseline_file` (atomically). """
+                eco2, tvoc = self.sgp.get_iaq_baseline()
+                tmp_file = self.baseline_file + '.tmp'
+                with open(tmp_file, 'w') as f:
+                        json.dump({'eco2': eco2, 'tvoc': tvoc, 'timestamp': time.time()}, f)
+                os.replace(tmp_file, self.baseline_file)
+
+        def set_humidity(self, gramsPM3):
+                """ Absolute humidity (g/m3) for compensation, applied before the next measurement """
+                self._humidity = gramsPM3
+
+        def set_baseline(self, eco2, tvoc):
+                """ IAQ baselines to restore, applied before the next measurement """
+                self._baseline = (eco2, tvoc)
+
+        def baseline(self, timeout=None):
+                """ The current [eCO2, TVOC] baselines, read by the service thread after its next
+                measurement (waiting up to `timeout`, default 2 periods; None if it did not answer)
+                """
+                self._baseline_read.clear()
+                self._read_baseline.set()
+                if not self._baseline_read.wait(2 * self.period if timeout is None else timeout):
+                        return None
+                return self.last_baseline
+
+        def start(self):
+                if self._thread is None or not self._thread.is_alive():
+                        self._stop.clear()
+                        self._thread = threading.Thread(target=self._run, name="SGP30Service", daemon=True)
+                        self._thread.start()
+
+        def stop(self, checkpoint=True):
+                self._stop.set()
+                if self._thread is not None:
+                        self._thread.join(timeout=self.period + 1)
+                if checkpoint and self.baseline_file and time.monotonic() >= self._baseline_valid_at:
+                        try:
+                                self.save_baseline()
+                        except (OSError, RuntimeError) as e:
+                                print("[SGP30Service] Could not checkpoint baseline: {}".format(e))
+
+        def _run(self):
+                next_t = time.monotonic()
+                while not self._stop.wait(max(0.0, next_t - time.monotonic())):
+                        next_t += self.period
+                        try:
+                                humidity = self._humidity
+                                if humidity is not None and humidity != self._applied_humidity:
+                                        self.sgp.set_iaq_humidity(humidity)
+                                        self._applied_humidity = humidity
+                                baseline, self._baseline = self._baseline, None
+                                if baseline is not None:
+                                        self.sgp.set_iaq_baseline(*baseline)
+                                        ## A restored baseline is valid right away (as at start-up)
+                                        self._baseline_valid_at = min(self._baseline_valid_at, time.monotonic())
+                                eco2, tvoc = self.sgp.iaq_measure()
+                                self.snapshot = SGPReading(time.time(), eco2, tvoc)
+                                self._new_reading.set()
+
+                                if self._read_baseline.is_set():
+                                        self._read_baseline.clear()
+                                        self.last_baseline = self.sgp.get_iaq_baseline()
+                                        self._baseline_read.set()
+
+                                if self.baseline_file and time.monotonic() >= self._next_checkpoint:
+                                        self.save_baseline()
+                                        self._next_checkpoint = time.monotonic() + self.checkpoint_interval
+                        except (OSError, RuntimeError) as e:
+                                self.errors += 1
+                                print("[SGP30Service] {}: {}".format(type(e).__name__, e))
+                        if time.monotonic() - next_t > self.period:
+                                next_t = time.monotonic()       ## Fell behind (e.g., bus contention); don't burst to catch up
+
+        def latest(self, timeout=None):
+                """ The latest SGPReading, waiting (up to `timeout`, default 2 periods) only if there is none yet.
+                Returns None if the service has not measured by then (the sensor is never read from here).
+                """
+                if self.snapshot is None:
+                        self._new_reading.wait(2 * self.period if timeout is None else timeout)
+                return self.snapshot
+
+        @property
+        def age(self):
+                """ Seconds since the latest measurement (None before the first) """
+                reading = self.snapshot
+                return None if reading is None else time.time() - reading.timestamp
+
@@ -45,6 +45,15 @@ import time
 from adafruit_bus_device.i2c_device import I2CDevice
 from micropython import const
 
+try:
+    from util.crc import sensirion_crc8, sensirion_word, sensirion_words
+except ImportError:
+    import os, sys
+    rootpath = '/'.join(os.getcwd().split('/')[:-1])
+    print("[{}] Appending '{}' to PYTHONPATH".format(__file__, rootpath))
+    sys.path.append(rootpath)
+    from util.crc import sensirion_crc8, sensirion_word, sensirion_words
+
 __version__ = "0.0.0-auto.0"
 __repo__ = "https://github.com/adafruit/Adafruit_CircuitPython_SGP30.git"
 
@@ -56,6 +65,14 @@ _SGP30_CRC8_POLYNOMIAL = const(0x31)
 _SGP30_CRC8_INIT = const(0xFF)
 _SGP30_WORD_LEN = const(2)
 
+# Profiles: name, command, signals, delay
+_IAQ_INIT = ("iaq_init", b"\x20\x03", 0, 0.01)
+_IAQ_MEASURE = ("iaq_measure", b"\x20\x08", 2, 0.05)
+_RAW_MEASURE = ("raw_measure", b"\x20\x50", 2, 0.025)
+_IAQ_GET_BASELINE = ("iaq_get_baseline", b"\x20\x15", 2, 0.01)
+_IAQ_SET_BASELINE = b"\x20\x1E"
+_IAQ_SET_HUMIDITY = b"\x20\x61"
+
 
 class Pynq_SGP30:
     """
@@ -65,6 +82,7 @@ class Pynq_SGP30:
     def __init__(self, i2c, address=_SGP30_DEFAULT_I2C_ADDR):
         """Initialize the sensor, get the serial # and verify that we found a proper SGP30"""
         self._device = I2CDevice(i2c, address)
+        self._read_buffers = {}  # command -> reusable bytearray for its reply
 
         # get unique serial, its 48 bits so we store in an array
         self.serial = self._i2c_read_words_from_cmd([0x36, 0x82], 0.01, 3)
@@ -112,49 +130,36 @@ class Pynq_SGP30:
 
     def iaq_init(self):
         """Initialize the IAQ algorithm"""
-        # name, command, signals, delay
-        self._run_profile(["iaq_init", [0x20, 0x03], 0, 0.01])
+        self._run_profile(_IAQ_INIT)
 
 
     def iaq_measure(self):
         """Measure the eCO2 and TVOC"""
-        # name, command, signals, delay
-        return self._run_profile(["iaq_measure", [0x20, 0x08], 2, 0.05])
+        return self._run_profile(_IAQ_MEASURE)
 
 
     def raw_measure(self):
         """Measure H2 and Ethanol (Raw Signals)"""
-        # name, command, signals, delay
-        return self._run_profile(["raw_measure", [0x20, 0x50], 2, 0.025])
+        return self._run_profile(_RAW_MEASURE)
 
 
     def get_iaq_baseline(self):
         """Retreive the IAQ algorithm baseline for eCO2 and TVOC"""
-        # name, command, signals, delay
-        return self._run_profile(["iaq_get_baseline", [0x20, 0x15], 2, 0.01])
+        return self._run_profile(_IAQ_GET_BASELINE)
 
 
     def set_iaq_baseline(self, eCO2, TVOC):  # pylint: disable=invalid-name
         """Set the previously recorded IAQ algorithm baseline for eCO2 and TVOC"""
         if eCO2 == 0 and TVOC == 0:
             raise RuntimeError("Invalid baseline")
-        buffer = []
-        for value in [TVOC, eCO2]:
-            arr = [value >> 8, value & 0xFF]
-            arr.append(self._generate_crc(arr))
-            buffer += arr
-        self._run_profile(["iaq_set_baseline", [0x20, 0x1E] + buffer, 0, 0.01])
+        command = _IAQ_SET_BASELINE + sensirion_word(TVOC) + sensirion_word(eCO2)
+        self._run_profile(("iaq_set_baseline", command, 0, 0.01))
 
 
     def set_iaq_humidity(self, gramsPM3):  # pylint: disable=invalid-name
         """Set the humidity in g/m3 for eCO2 and TVOC compensation algorithm"""
-        tmp = int(gramsPM3 * 256)
-        buffer = []
-        for value in [tmp]:
-            arr = [value >> 8, value & 0xFF]
-            arr.append(self._generate_crc(arr))
-            buffer += arr
-        self._run_profile(["iaq_set_humidity", [0x20, 0x61] + buffer, 0, 0.01])
+        command = _IAQ_SET_HUMIDITY + sensirion_word(int(gramsPM3 * 256))
+        self._run_profile(("iaq_set_humidity", command, 0, 0.01))
 
 
     # Low level command functions
@@ -170,35 +175,23 @@ class Pynq_SGP30:
         return self._i2c_read_words_from_cmd(command, delay, signals)
 
     def _i2c_read_words_from_cmd(self, command, delay, reply_size):
-        """Run an SGP command query, get a reply and CRC results if necessary"""
+        """Run an SGP command query, get a reply and CRC results if necessary.
+        The reply's words are returned as a tuple."""
+        if not isinstance(command, bytes):
+            command = bytes(command)
         with self._device:
-            self._device.write(bytes(command))
+            self._device.write(command)
             time.sleep(delay)
             if not reply_size:
                 return None
-            crc_result = bytearray(reply_size * (_SGP30_WORD_LEN + 1))
+            crc_result = self._read_buffers.get(command)
+            if crc_result is None:
+                crc_result = self._read_buffers[command] = bytearray(reply_size * (_SGP30_WORD_LEN + 1))
             self._device.readinto(crc_result)
-            # print("\tRaw Read: ", crc_result)
-            result = []
-            for i in range(reply_size):
-                word = [crc_result[3 * i], crc_result[3 * i + 1]]
-                crc = crc_result[3 * i + 2]
-                if self._generate_crc(word) != crc:
-                    raise RuntimeError("CRC Error")
-                result.append(word[0] << 8 | word[1])
-            # print("\tOK Data: ", [hex(i) for i in result])
-            return result
+        # print("\tRaw Read: ", crc_result)
+        return sensirion_words(crc_result, reply_size)
 
     # pylint: disable=no-self-use
     def _generate_crc(self, data):
         """8-bit CRC algorithm for checking data"""
-        crc = _SGP30_CRC8_INIT
-        # calculates 8-Bit checksum with given polynomial
-        for byte in data:
-            crc ^= byte
-            for _ in range(8):
-                if crc & 0x80:
-                    crc = (crc << 1) ^ _SGP30_CRC8_POLYNOMIAL
-                else:
-                    crc <<= 1
-        return crc & 0xFF
+        return sensirion_crc8(data)
@@ -31,6 +31,7 @@ filename = "line_protocol.txt"
 
 MAX_RETRIES = 5
 BATCHING = WriteOptions(write_type=WriteType.batching)
+SERIES_BATCH_SIZE = 5000 	## Points per synchronous request in write_series (bounds memory & request size)
 
 try:
 	myfile = open(filename)
@@ -86,6 +87,9 @@ class DBCloud():
 		"""
 		# self.write_api = self.client.write_api(write_options=SYNCHRONOUS)
 		self.write_api = self.client.write_api(write_options=BATCHING)
+		## The batching API only queues points (failed writes never raise), so bulk jobs that must
+		## know whether their data arrived (write_series) use a synchronous one instead
+		self.series_write_api = self.client.write_api(write_options=SYNCHRONOUS)
 		"""
 		Creates a Query API instance
 		:return: Query api instance
@@ -112,16 +116,61 @@ class DBCloud():
 		#self.write_line(measurement, value)
 		self.count += 1
 
-	def create_point(self, measurement, value):
+	def create_point(self, measurement, value, timestamp=None, tags=None):
 		"""
 		Creates a Point that defines the values that will be written to the database
 		:param measurement  string parameter representing quantity we are measuring
 		:param value        value associated with measurement parameter
+		:param timestamp    optional datetime (UTC) of the measurement, defaults to now
+		:param tags         optional dictionary of extra tags to attach to the point
 		:return             instance of Point class to be written to database
 		"""
-		point = Point(measurement).tag('host', host).tag('device', device).field('value', value).time(time=datetime.utcnow())
+		point = Point(measurement).tag('host', host).tag('device', device)
+		if tags:
+			for key in tags:
+				point.tag(key, tags[key])
+		point.field('value', value).time(time=timestamp if timestamp is not None else datetime.utcnow())
 		return point
 
+	def create_fields_point(self, measurement, fields, timestamp=None, tags=None):
+		"""
+		Creates a single Point carrying several fields (e.g., all bins of a histogram)
+		:param measurement  string parameter representing quantity we are measuring
+		:param fields       dictionary mapping field names to values
+		:param timestamp    optional datetime (UTC) of the measurement, defaults to now
+		:param tags         optional dictionary of extra tags to attach to the point
+		:return             instance of Point class to be written to database
+		"""
+		point = Point(measurement).tag('host', host).tag('device', device)
+		if tags:
+			for key in tags:
+				point.tag(key, tags[key])
+		for key in fields:
+			point.field(key, fields[key])
+		point.time(time=timestamp if timestamp is not None else datetime.utcnow())
+		return point
+
+	def write_series(self, measurement, times, values, tags=None, batch_size=SERIES_BATCH_SIZE):
+		"""
+		Writes a whole (e.g., reprocessed) time series to the backend, synchronously, in requests
+		of at most `batch_size` points (only one batch of Points is built at a time)
+		:param measurement  string parameter representing quantity we are measuring
+		:param times        sequence of measurement times, in seconds since the epoch (UTC)
+		:param values       sequence of values associated with each time
+		:param tags         optional dictionary of extra tags to attach to every point
+		:return             True if every point was written, False as soon as a request fails
+		"""
+		for start in range(0, len(times), batch_size):
+			points = [self.create_point(measurement, float(value), datetime.utcfromtimestamp(float(t)), tags)
+						for t, value in zip(times[start:start + batch_size], values[start:start + batch_size])]
+			try:
+				self.series_write_api.write(bucket=bucket, org=org, record=points)
+			except Exception as e:
+				print("[DBCloud::write_series] ERROR: write_api.write() incurred the following Exception after {} points:\n{}".format(start, e))
+				return False
+			self.count += len(points)
+		return True
+
 	def create_line(self, measurement, value):
 		"""
 		This creates a string that accords with InfluxDB's write_api's
@@ -155,6 +204,15 @@ class DBCloud():
 		for point in [self.create_point(mtype, payload[mtype]) for mtype in payload]:
 			self.queue.append(point)
 
+	def queue_fields(self, measurement, fields, tags=None):
+		"""
+		Queues one multi-field point to be pushed to the InfluxDB Cloud Instance
+		:param measurement  string parameter representing quantity we are measuring
+		:param fields       dictionary mapping field names to values
+		:param tags         optional dictionary of extra tags to attach to the point
+		"""
+		self.queue.append(self.create_fields_point(measurement, fields, tags=tags))
+
 	def queue_data_line(self, payload):
 		"""
 		Allows user to queue data to be pushed to the InfluxDB Cloud Instance
@@ -248,6 +306,7 @@ class MeasurementTypes(enum.Enum):
 	pm1  = 'PM1'
 	pm25 = 'PM2.5'
 	pm10 = 'PM10'
+	pm_hist = 'PM_histogram'
 
 
 
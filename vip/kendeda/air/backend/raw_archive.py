@@ -0,0 +1,94 @@
+""" raw_archive.py -- Compact binary archive of the raw ISB signals behind each published ppm value.
+
+Every ISB reading is stored as one fixed-size little-endian record (see RECORD_FIELDS) appended
+to a per-sensor file, so months of history can later be recalibrated offline in vectorized chunks
+(see reprocess_isb.py) whenever the isb_serials constants or the nT model change.
+"""
+
+import os
+import time
+import struct
+import numpy as np
+
+try:
+	from util import util
+except ImportError:
+	import sys
+	rootpath = '/'.join(os.getcwd().split('/')[:-1])
+	print("[{}] Appending '{}' to PYTHONPATH".format(__file__, rootpath))
+	sys.path.append(rootpath)
+	from util import util
+
+##------------------------------------------------------------------------------
+
+## (name, struct format, NumPy dtype) for each field of a raw record
+RECORD_FIELDS = (
+	('time',    'd', '<f8'), 	## Seconds since the epoch (UTC)
+	('we_mv',   'f', '<f4'), 	## Working Electrode output (mV)
+	('ae_mv',   'f', '<f4'), 	## Auxiliary Electrode output (mV)
+	('we_code', 'h', '<i2'), 	## Raw ADC code of the WE conversion (of WE - AE, for differential ISB reads)
+	('ae_code', 'h', '<i2'), 	## Raw ADC code of the AE conversion
+	('temp',    'f', '<f4'), 	## Temperature used for nT (*C), or NaN if uncompensated
+)
+RECORD = struct.Struct('<' + ''.join(fmt for _, fmt, _ in RECORD_FIELDS))
+RECORD_DTYPE = np.dtype([(name, dt) for name, _, dt in RECORD_FIELDS])
+assert RECORD.size == RECORD_DTYPE.itemsize
+
+FILE_EXT = '.isbraw'
+
+##------------------------------------------------------------------------------
+
+def archive_path(serial, directory=None):
+	""" Path of the raw archive file for the ISB with the given serial #. """
+	return os.path.join(directory if directory is not None else util.RAW_ARCHIVE_DIR, 'isb_{}{}'.format(serial, FILE_EXT))
+
+
+class RawArchive():
+	""" Append-only writer for one ISB's raw archive file.
+	Records are packed into a preallocated buffer and written out every `flush_every` records.
+	"""
+	def __init__(self, serial, directory=None, flush_every=util.RAW_ARCHIVE_FLUSH_EVERY):
+		self.serial = serial
+		self.path = archive_path(serial, directory)
+		os.makedirs(os.path.dirname(self.path), exist_ok=True)
+		self.flush_every = max(1, flush_every)
+		self._buf = bytearray(RECORD.size * self.flush_every)
+		self._count = 0
+		self._file = open(self.path, 'ab')
+
+	def append(self, we_mv, ae_mv, we_code, ae_code, temp=None, timestamp=None):
+		RECORD.pack_into(self._buf, self._count * RECORD.size,
+				timestamp if timestamp is not None else time.time(),
+				we_mv, ae_mv, we_code, ae_code,
+				temp if temp is not None else float('nan'))
+		self._count += 1
+		if self._count >= self.flush_every:
+			self.flush()
+
+	def flush(self):
+		if self._count:
+			self._file.write(memoryview(self._buf)[:self._count * RECORD.size])
+			self._file.flush()
+			self._count = 0
+
+	def close(self):
+		self.flush()
+		self._file.close()
+
+
+def read_chunks(path, chunk_size=util.RAW_ARCHIVE_CHUNK_SIZE):
+	""" Yields the records of a raw archive file as NumPy structured arrays of (up to) `chunk_size`
+	records each, so that arbitrarily long archives can be processed in bounded memory.
+	Any trailing partial record (e.g., from a crash mid-write) is ignored.
+	"""
+	n_records = os.path.getsize(path) // RECORD.size
+	with open(path, 'rb') as f:
+		for start in range(0, n_records, chunk_size):
+			count = min(chunk_size, n_records - start)
+			yield np.fromfile(f, dtype=RECORD_DTYPE, count=count)
+
+
+def read_all(path):
+	""" Loads an entire raw archive file as one NumPy structured array. """
+	n_records = os.path.getsize(path) // RECORD.size
+	return np.fromfile(path, dtype=RECORD_DTYPE, count=n_records)
@@ -0,0 +1,106 @@
+""" reprocess_isb.py -- Re-run the current ISB calibration over a raw signal archive (see raw_archive.py)
+and write the corrected ppm series back to the InfluxDB backend.
+
+Usage (from the air/ directory):
+	python3 backend/reprocess_isb.py co  162030905
+	python3 backend/reprocess_isb.py no2 202931852
+	python3 backend/reprocess_isb.py ox  204930756 --no2-serial 202931852
+	python3 backend/reprocess_isb.py co  162030905 --dry-run
+
+Uses whatever isb_serials constants, nT model (util.INTERPOLATE_NT) and util.USE_TEMP_COEFFICIENT
+are currently in the tree, so fixing any of those and re-running this recalibrates the sensor's history.
+Reprocessed points are tagged with source=reprocessed.
+"""
+
+import os
+import sys
+import argparse
+import numpy as np
+
+try:
+	from util import util
+	import alphasense.isb as isb
+	import backend.raw_archive as raw_archive
+	import backend.influx_cloud as influx
+except ImportError:
+	rootpath = '/'.join(os.getcwd().split('/')[:-1])
+	print("[{}] Appending '{}' to PYTHONPATH".format(__file__, rootpath))
+	sys.path.append(rootpath)
+	from util import util
+	import alphasense.isb as isb
+	import backend.raw_archive as raw_archive
+	import backend.influx_cloud as influx
+
+##------------------------------------------------------------------------------
+
+SENSOR_TYPES = {
+	'co'  : (isb.CO,  influx.MeasurementTypes.co),
+	'no2' : (isb.NO2, influx.MeasurementTypes.no2),
+	'ox'  : (isb.OX,  influx.MeasurementTypes.ox),
+}
+
+REPROCESSED_TAGS = {'source': 'reprocessed'}
+
+##------------------------------------------------------------------------------
+
+def calibrated_ppm(sensor, records):
+	""" Vectorized ppm for a chunk of raw archive records, using the sensor's current calibration. """
+	temps = records['temp'] if util.USE_TEMP_COEFFICIENT else None
+	return sensor.ppm_array(records['we_mv'], records['ae_mv'], temps)
+
+
+def reprocess(sensor_type, serial, no2_serial=None, directory=None, db=None, chunk_size=util.RAW_ARCHIVE_CHUNK_SIZE):
+	""" Recalibrate the raw archive of one ISB, chunk by chunk. Corrected series are written to `db`
+	if given (else only summarized). Returns the total number of records reprocessed.
+	"""
+	sensor_cls, measurement = SENSOR_TYPES[sensor_type]
+	sensor = sensor_cls(None, None, serial=serial)   ## No ADC channels needed for offline conversion
+	path = raw_archive.archive_path(serial, directory)
+
+	## Ozone only = OX reading - NO2 reading, so the NO2 series is needed at the OX sample times
+	no2_times = no2_ppm = None
+	if sensor_type == 'ox' and no2_serial is not None:
+		no2_records = raw_archive.read_all(raw_archive.archive_path(no2_serial, directory))
+		no2_times = no2_records['time']
+		no2_ppm = calibrated_ppm(isb.NO2(None, None, serial=no2_serial), no2_records)
+
+	total = 0
+	for records in raw_archive.read_chunks(path, chunk_size):
+		if no2_ppm is not None:
+			temps = records['temp'] if util.USE_TEMP_COEFFICIENT else None
+			ppm = sensor.oxide_ppm_only_array(records['we_mv'], records['ae_mv'],
+						np.interp(records['time'], no2_times, no2_ppm), temps)
+		else:
+			ppm = calibrated_ppm(sensor, records)
+		ppm = np.round(ppm, 4)
+
+		if db is not None:
+			if not db.write_series(measurement, records['time'], ppm, tags=REPROCESSED_TAGS):
+				print("[reprocess_isb] Write to InfluxDB failed after {} records!".format(total))
+				break
+		total += len(records)
+		print("[reprocess_isb] {:>10} records  |  ppm min/mean/max = {:.4f} / {:.4f} / {:.4f}".format(
+				total, float(ppm.min()), float(ppm.mean()), float(ppm.max())))
+	return total
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Recalibrate an ISB's raw signal archive and republish its ppm series.")
+	parser.add_argument('type', choices=sorted(SENSOR_TYPES.keys()), help="ISB sensor type")
+	parser.add_argument('serial', help="ISB serial # (as found on the sensor's sticker)")
+	parser.add_argument('--no2-serial', default=None, help="(OX only) serial # of the NO2-B43F to subtract for ozone-only values")
+	parser.add_argument('--dir', default=None, help="raw archive directory (default: util.RAW_ARCHIVE_DIR)")
+	parser.add_argument('--dry-run', action='store_true', help="only summarize the recalibrated series, don't write it")
+	args = parser.parse_args()
+
+	db = None if args.dry_run else influx.DBCloud()
+	try:
+		total = reprocess(args.type, args.serial, no2_serial=args.no2_serial, directory=args.dir, db=db)
+	finally:
+		if db is not None:
+			db.kill()
+	print("[reprocess_isb] Done: {} records reprocessed.".format(total))
+
+
+if __name__ == '__main__':
+	main()
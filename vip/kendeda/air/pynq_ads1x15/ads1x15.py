@@ -40,6 +40,13 @@ _ADS1X15_POINTER_CONFIG = (0x01)
 _ADS1X15_CONFIG_OS_SINGLE = (0x8000)
 _ADS1X15_CONFIG_MUX_OFFSET = (12)
 _ADS1X15_CONFIG_COMP_QUE_DISABLE = (0x0003)
+## The internal oscillator may run up to 10% slow, and the ADC needs ~25 us to wake from power-down
+## before a single-shot conversion starts (see datasheet "Single-Shot Mode" & "Electrical Characteristics")
+_ADS1X15_DATA_RATE_TOLERANCE = (1.1)
+_ADS1X15_WAKEUP_TIME = (0.000025)
+## Interval between status polls if a conversion is not yet done after its expected duration
+_ADS1X15_POLL_INTERVAL = (0.0002)
+_ADS1X15_MAX_POLLS = (1000)
 _ADS1X15_CONFIG_GAIN = {
 	2 / 3: 0x0000,	## 2/3 = ±6.144 Volts
 	1: 0x0200, 		## 1 = ±4.096 Volts
@@ -60,6 +67,57 @@ class Mode:
 	SINGLE = 0x0100
 
 
+## Microblaze (IOP) program for combined ADS1x15 register transactions. Compiled & loaded with
+## `iop_library(iop)`, which also exposes every `i2c_*` function of PYNQ's MicroblazeLibrary.
+## PYNQ's i2c library has no repeated-start primitive, so each combined call is a pointer write
+## followed by a read -- but both (and, for `ads1x15_convert`, the wait & status polling too)
+## happen on the IOP within a single PS -> IOP mailbox round-trip.
+ADS1X15_IOP_PROGRAM = r"""
+#include <i2c.h>
+#include <timer.h>
+
+int ads1x15_read_register(i2c dev, unsigned int address, unsigned int reg) {
+	unsigned char buf[2];
+	buf[0] = reg;
+	if (i2c_write(dev, address, buf, 1) != 1) return -1;
+	if (i2c_read(dev, address, buf, 2) != 2) return -1;
+	return (buf[0] << 8) | buf[1];
+}
+
+int ads1x15_convert(i2c dev, unsigned int address, unsigned int config, unsigned int wait_us, unsigned int poll_us, unsigned int max_polls) {
+	unsigned char buf[3];
+	int status;
+	unsigned int polls = 0;
+	buf[0] = 0x01;
+	buf[1] = (config >> 8) & 0xFF;
+	buf[2] = config & 0xFF;
+	if (i2c_write(dev, address, buf, 3) != 3) return -1;
+	delay_us(wait_us);
+	while (1) {
+		status = ads1x15_read_register(dev, address, 0x01);
+		if (status < 0) return -1;
+		if (status & 0x8000) break;
+		if (++polls >= max_polls) return -1;
+		delay_us(poll_us);
+	}
+	return ads1x15_read_register(dev, address, 0x00);
+}
+"""
+
+
+def iop_library(iop):
+	"""Compile & load the combined-transaction ADS1x15 program onto a PYNQ IOP.
+	Use the returned library in place of `MicroblazeLibrary(iop, ['i2c'])`, i.e., open the
+	I2C device through it and pass it to the ADC as well:
+
+		lib = ads1x15.iop_library(overlay.iop_pmoda)
+		i2c = lib.i2c_open(sda, scl)
+		ads = ADS1015(i2c, lib=lib)
+	"""
+	from pynq.lib import MicroblazeRPC
+	return MicroblazeRPC(iop, ADS1X15_IOP_PROGRAM)
+
+
 class ADS1x15:
 	"""Base functionality for ADS1x15 analog to digital converters."""
 
@@ -70,10 +128,16 @@ class ADS1x15:
 		data_rate=None,
 		mode=Mode.SINGLE,
 		address=_ADS1X15_DEFAULT_ADDRESS,
+		lib=None,
 	):
 		# pylint: disable=too-many-arguments
 		self._last_pin_read = None
 		self.buf = bytearray(3)
+		self._pointer_buf = bytearray(1)
+		## IOP library from `iop_library()` for combined (single round-trip) register transactions
+		self.lib = lib
+		## Number of PS -> IOP RPC calls made so far (i.e., mailbox round-trips)
+		self.rpc_count = 0
 		self._data_rate = self._gain = self._mode = None
 		self.gain = gain
 		self.data_rate = self._data_rate_default() if data_rate is None else data_rate
@@ -140,6 +204,8 @@ class ADS1x15:
 	def mode(self, mode):
 		if mode not in (Mode.CONTINUOUS, Mode.SINGLE):
 			raise ValueError("Unsupported mode.")
+		if mode != self._mode:
+			self._last_pin_read = None 	# next read must rewrite the config register
 		self._mode = mode
 
 	def read(self, pin, is_differential=False):
@@ -164,11 +230,29 @@ class ADS1x15:
 		"""
 		raise NotImplementedError("Subclass must implement _conversion_value function!")
 
+	@property
+	def conversion_time(self):
+		"""Worst-case duration (in seconds) of one conversion at the current data rate."""
+		return _ADS1X15_DATA_RATE_TOLERANCE / self.data_rate + _ADS1X15_WAKEUP_TIME
+
 	def _read(self, pin):
 		"""Perform an ADC read. Returns the signed integer result of the read."""
 		if self.mode == Mode.CONTINUOUS and self._last_pin_read == pin:
 			return self._conversion_value(self.get_last_result(True))
-		self._last_pin_read = pin
+		if self.mode == Mode.SINGLE and self.lib is not None:
+			return self._conversion_value(self._convert_on_iop(pin))
+		self.start_conversion(pin)
+
+		if self.mode == Mode.SINGLE:
+			self.wait_for_conversion()
+		else:
+			# just sleep (can't poll in continuous)
+			time.sleep(2 / self.data_rate)
+
+		return self.read_conversion()
+
+	def _config(self, pin):
+		"""Config register value for converting the given (mux) pin with the current settings."""
 		if self.mode == Mode.SINGLE:
 			config = _ADS1X15_CONFIG_OS_SINGLE
 		else:
@@ -178,16 +262,44 @@ class ADS1x15:
 		config |= self.mode
 		config |= self.rate_config[self.data_rate]
 		config |= _ADS1X15_CONFIG_COMP_QUE_DISABLE
-		self._write_register(_ADS1X15_POINTER_CONFIG, config)
+		return config
 
-		if self.mode == Mode.SINGLE:
-			# poll conversion complete status bit
-			while not self._conversion_complete():
-				pass
-		else:
-			# just sleep (can't poll in continuous)
-			time.sleep(2 / self.data_rate)
+	def _convert_on_iop(self, pin):
+		"""Configure + wait + read a single-shot conversion in one IOP round-trip."""
+		self._last_pin_read = pin
+		self.rpc_count += 1
+		result = self.lib.ads1x15_convert(
+			self.i2c_device,
+			self.address,
+			self._config(pin),
+			int(self.conversion_time * 1e6),
+			int(_ADS1X15_POLL_INTERVAL * 1e6),
+			_ADS1X15_MAX_POLLS,
+		)
+		if result < 0:
+			raise RuntimeError("ADS1x15 conversion on the IOP failed (address 0x{:02X}).".format(self.address))
+		return result
+
+	def start_conversion(self, pin):
+		"""Write the config register to start converting the given (mux) pin,
+		without waiting for the result. See `read` for the pin numbering.
+		"""
+		self._last_pin_read = pin
+		self._write_register(_ADS1X15_POINTER_CONFIG, self._config(pin))
 
+	def wait_for_conversion(self, elapsed=0.0):
+		"""Block until a started single-shot conversion is complete. Sleeps for the
+		remainder of the expected conversion time (less any time already `elapsed`)
+		rather than spinning on the status bit, then polls only if it is running late.
+		"""
+		remaining = self.conversion_time - elapsed
+		if remaining > 0:
+			time.sleep(remaining)
+		while not self._conversion_complete():
+			time.sleep(_ADS1X15_POLL_INTERVAL)
+
+	def read_conversion(self):
+		"""Return the signed integer result of the last completed conversion."""
 		return self._conversion_value(self.get_last_result(False))
 
 	def _conversion_complete(self):
@@ -224,6 +336,7 @@ class ADS1x15:
 		####
 
 		#### (My attempt at replacing the above `write` operation to use PYNQ's I2C API):
+		self.rpc_count += 1
 		self.i2c_device.write(self.address, self.buf, len(self.buf))
 		####
 		
@@ -250,11 +363,51 @@ class ADS1x15:
 		#### (My attempt at replacing the above `readinto` & `write_then_readinto` operations to use PYNQ's I2C API):
 		num_bytes = 2
 		if fast:
+			self.rpc_count += 1
 			self.i2c_device.read(self.address, self.buf, num_bytes)
+		elif self.lib is not None:
+			## Pointer write + read combined into one IOP round-trip
+			self.rpc_count += 1
+			value = self.lib.ads1x15_read_register(self.i2c_device, self.address, reg)
+			if value < 0:
+				raise RuntimeError("ADS1x15 register read on the IOP failed (address 0x{:02X}).".format(self.address))
+			return value
 		else:
-			out_buffer = bytearray([reg])
-			self.i2c_device.write(self.address, out_buffer, len(out_buffer))
+			self._pointer_buf[0] = reg
+			self.rpc_count += 2
+			self.i2c_device.write(self.address, self._pointer_buf, 1)
 			self.i2c_device.read(self.address, self.buf, num_bytes)
 		####
 
 		return self.buf[0] << 8 | self.buf[1]
+
+
+def scan(reads):
+	"""Read many channels across one or more single-shot ADS1x15s with interleaved conversions.
+
+	Each round starts one conversion on every ADC that still has channels queued, sleeps once
+	for the longest expected conversion time, then collects each ADC's result. Reading 4 channels
+	on each of 2 ADCs therefore costs about 4 conversion periods, with no busy-wait polling.
+
+	params:
+		:param reads: sequence of (ads, pin, is_differential) tuples, with pin & is_differential as for `ADS1x15.read`.
+	Returns the signed integer results, in the same order as `reads`.
+	"""
+	queues = {}
+	for i, (ads, pin, is_differential) in enumerate(reads):
+		if ads.mode != Mode.SINGLE:
+			raise ValueError("scan requires ADCs in single-shot mode.")
+		queues.setdefault(ads, []).append((i, pin if is_differential else pin + 0x04))
+
+	results = [None] * len(reads)
+	rounds = max((len(queue) for queue in queues.values()), default=0)
+	for n in range(rounds):
+		active = [(ads, queue[n]) for ads, queue in queues.items() if n < len(queue)]
+		start = time.monotonic()
+		for ads, (_, pin) in active:
+			ads.start_conversion(pin)
+		time.sleep(max(ads.conversion_time for ads, _ in active))
+		for ads, (i, _) in active:
+			ads.wait_for_conversion(elapsed=time.monotonic() - start)
+			results[i] = ads.read_conversion()
+	return results
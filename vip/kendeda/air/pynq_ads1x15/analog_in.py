@@ -28,6 +28,8 @@ differential ADC readings.
 * Author(s): Carter Nelson, adapted from MCP3xxx original by Brent Rubell
 """
 
+import ads1x15
+
 _ADS1X15_DIFF_CHANNELS = {(0, 1): 0, (0, 3): 1, (1, 3): 2, (2, 3): 3}
 _ADS1X15_PGA_RANGE = {2 / 3: 6.144, 1: 4.096, 2: 2.048, 4: 1.024, 8: 0.512, 16: 0.256}
 
@@ -69,3 +71,19 @@ class AnalogIn:
 		"""Returns the voltage from the ADC pin as a floating point value."""
 		volts = self.value * _ADS1X15_PGA_RANGE[self._ads.gain] / 32767
 		return volts
+
+
+def scan(channels):
+	"""Read several AnalogIn channels (spread over one or more ADCs) in one interleaved pass.
+	Returns their values, scaled as for `AnalogIn.value`.
+	"""
+	raw = ads1x15.scan([(chan._ads, chan._pin_setting, chan.is_differential) for chan in channels])
+	return [value << (16 - chan._ads.bits) for value, chan in zip(raw, channels)]
+
+
+def scan_voltages(channels):
+	"""Read several AnalogIn channels in one interleaved pass, returning their voltages."""
+	return [
+		value * _ADS1X15_PGA_RANGE[chan._ads.gain] / 32767
+		for value, chan in zip(scan(channels), channels)
+	]
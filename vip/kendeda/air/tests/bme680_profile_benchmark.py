@@ -0,0 +1,60 @@
+## bme680_profile_benchmark.py -- Measured latency of each BME680 measurement profile (T/P/H only vs. full gas)
+##
+## Blinka (Raspberry Pi):  python3 bme680_profile_benchmark.py
+## PYNQ (Arduino SPI):     python3 bme680_profile_benchmark.py --pynq
+import sys
+import time
+
+ITERATIONS = 20
+
+
+def open_sensor(pynq=False):
+	if not pynq:
+		import board
+		from bme680 import bme
+		return bme, bme.BME680(board.I2C(), use_i2c=True)
+
+	import os
+	from pynq import Overlay, PL
+	from pynq.lib import MicroblazeLibrary
+	try:
+		import bme_pynq
+	except ModuleNotFoundError:
+		for root, dirs, files in os.walk('/home/xilinx'):
+			if 'bme_pynq.py' in files:
+				sys.path.append(root)
+		import bme_pynq
+	overlay = Overlay('base.bit', download=(os.path.basename(PL.bitfile_name) != 'base.bit'))
+	lib = MicroblazeLibrary(overlay.iop_arduino, ['spi'])
+	spi = lib.spi_open(13, 12, 11, 10)
+	spi.configure(0, 0) 	## clk_phase, clk_polarity: SPI mode 0 (the BME680 supports modes 0 & 3)
+	return bme_pynq, bme_pynq.BME680(spi, use_i2c=False)
+
+
+def profile_latency(sensor, profile, iterations=ITERATIONS):
+	""" (mean, min, max) milliseconds per sample() with `profile`, plus the last sample """
+	times = []
+	for _ in range(iterations):
+		start = time.perf_counter()
+		sample = sensor.sample(profile)
+		times.append((time.perf_counter() - start) * 1e3)
+	return sum(times) / len(times), min(times), max(times), sample
+
+
+if __name__ == "__main__":
+	module, sensor = open_sensor(pynq='--pynq' in sys.argv)
+
+	## Warm up both profiles first (the first gas measurements after power-up are slow to settle)
+	sensor.sample(module.PROFILE_THP)
+	sensor.sample(module.PROFILE_GAS)
+
+	for profile in (module.PROFILE_THP, module.PROFILE_GAS):
+		mean, lo, hi, sample = profile_latency(sensor, profile)
+		print(f"{profile:>4}:  mean {mean:7.2f} ms   min {lo:7.2f} ms   max {hi:7.2f} ms   ->  {sample}")
+
+	## Cadence: PROFILE_THP reads within thp_interval (and gas reads within gas_interval) are served from memory
+	start = time.perf_counter()
+	for _ in range(ITERATIONS):
+		sensor.get_temperature()
+		sensor.get_humidity()
+	print(f"get_temperature() + get_humidity() x {ITERATIONS}:  {(time.perf_counter() - start) * 1e3:7.2f} ms total")
@@ -0,0 +1,162 @@
+## bme680_pynq_check.py -- Checks bme_pynq's register traffic & measurement timing against a simulated BME680
+##
+## No hardware needed:  python3 bme680_pynq_check.py
+## The simulated chip holds a register file, is reachable through fake PYNQ Microblaze `i2c` & `spi`
+## handles (same call signatures as MicroblazeLibrary's), and only reports new data (status bit 7)
+## once the measurement time expected for the triggered profile has passed.
+import os
+import sys
+import time
+import struct
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'air_sensors', 'bme680'))
+import bme_pynq
+
+## Calibration coefficients (struct layout of Pynq_BME680._read_calibration), typical of real parts
+CALIBRATION = (26200, 3, 0, 36500, -10300, 88, 0, 7000, -130, 30, 30, 0, -2600, -2000, 30, 0,
+				63, 12000, 0, 45, 20, 120, -100, 26000, -9000, -30, 18)
+
+
+class SimulatedBME680:
+
+	def __init__(self):
+		self.regs = bytearray(256)
+		self.page = 0
+		self.writes = [] 		## (register, value) of every register write
+		self.status_reads = 0
+		self.ready_at = None 	## time.monotonic() when the triggered measurement completes (None: never)
+		self.fail = False 		## Never complete measurements
+		self.reset()
+
+	def reset(self):
+		self.regs[:] = bytes(256)
+		self.regs[0xD0] = bme_pynq._BME680_CHIPID
+		coeff = struct.pack("<hbBHhbBhhbbHhhBBBHbbbBbHhbb", *CALIBRATION)
+		self.regs[0x8A:0x8A + 24] = coeff[:24]
+		self.regs[0xE1:0xE1 + 14] = coeff[24:]
+		self.regs[0x1F:0x22] = (0x65A00 << 4).to_bytes(3, 'big') 	## Pressure ADC
+		self.regs[0x22:0x25] = (0x7E800 << 4).to_bytes(3, 'big') 	## Temperature ADC
+		self.regs[0x25:0x27] = (0x5500).to_bytes(2, 'big') 			## Humidity ADC
+		self.regs[0x2A:0x2C] = ((0x200 << 6) | 0x04).to_bytes(2, 'big') 	## Gas ADC & range
+		self.page = 0
+
+	def write(self, register, value):
+		self.writes.append((register, value))
+		if register == 0xE0 and value == 0xB6:
+			self.reset()
+		elif register == 0x73:
+			self.page = value & 0x10
+		elif register == 0x74 and value & 0x03 == bme_pynq._BME680_MODE_FORCED:
+			self.regs[0x1D] = 0
+			gas = self.regs[0x71] & bme_pynq._BME680_RUNGAS
+			cycles = sum(bme_pynq._BME680_SAMPLERATES[v] for v in (value >> 5, (value >> 2) & 0x07, self.regs[0x72] & 0x07))
+			duration = bme_pynq.measurement_duration(cycles, 0, 0, bme_pynq._gas_wait_seconds(self.regs[0x64]) if gas else 0.0)
+			self.ready_at = None if self.fail else time.monotonic() + duration
+		self.regs[register] = value
+
+	def read(self, register):
+		if register == 0x1D:
+			self.status_reads += 1
+			if self.ready_at is not None and time.monotonic() >= self.ready_at:
+				self.regs[0x1D] = bme_pynq._BME680_NEW_DATA
+		return self.regs[register]
+
+
+class i2c: 		## Named like the Microblaze RPC class that Pynq_BME680_I2C checks for
+	val = 0
+
+	def __init__(self, chip):
+		self.chip = chip
+		self.pointer = 0
+
+	def write(self, address, data, length):
+		if length == 1:
+			self.pointer = data[0]
+		for i in range(0, length - 1, 2):
+			self.chip.write(data[i], data[i + 1])
+		return length
+
+	def read(self, address, data, length):
+		for i in range(length):
+			value = self.chip.read(self.pointer + i)
+			data[i] = value - 256 if value > 127 else value 	## The RPC hands back signed chars
+		return length
+
+
+class spi:
+
+	def __init__(self, chip):
+		self.chip = chip
+
+	def _address(self, register):
+		return (register & 0x7F) | (0x00 if self.chip.page else 0x80)
+
+	def transfer(self, tx, rx, length):
+		if tx[0] & 0x80: 		## Read: register, then clock out data
+			start = self._address(tx[0])
+			for i in range(1, length):
+				value = self.chip.read(start + i - 1)
+				rx[i] = value - 256 if value > 127 else value
+		else:
+			for i in range(0, length, 2):
+				self.chip.write(0x73 if tx[i] == 0x73 else self._address(tx[i]), tx[i + 1])
+
+
+def check_sensor(name, sensor, chip):
+	meas_regs = (bme_pynq._BME680_REG_CONFIG, bme_pynq._BME680_REG_CTRL_HUM, bme_pynq._BME680_REG_CTRL_GAS, bme_pynq._BME680_REG_CTRL_MEAS)
+
+	def config_writes():
+		return [reg for reg, _ in chip.writes if reg in meas_regs]
+
+	first_expected = ([bme_pynq._BME680_REG_CONFIG, bme_pynq._BME680_REG_CTRL_HUM, bme_pynq._BME680_REG_CTRL_GAS, bme_pynq._BME680_REG_CTRL_MEAS],
+					  [bme_pynq._BME680_REG_CTRL_GAS, bme_pynq._BME680_REG_CTRL_MEAS]) 	## Toggling run_gas only re-writes ctrl_gas
+	for run_gas, expected_writes in zip((False, True), first_expected):
+		sensor.run_gas = run_gas
+		expected = sensor.measurement_duration
+		chip.writes.clear()
+		chip.status_reads = 0
+		start = time.monotonic()
+		sample = sensor.sample()
+		elapsed = time.monotonic() - start
+		first_writes = config_writes()
+
+		chip.writes.clear()
+		sensor.sample()
+		repeat_writes = config_writes()
+		page_switches = [value for reg, value in chip.writes if reg == bme_pynq._BME680_REG_STATUS]
+
+		print(f"[{name}] run_gas={run_gas}:  {sample}")
+		print(f"\texpected {expected * 1e3:.1f} ms, took {elapsed * 1e3:.1f} ms, {chip.status_reads} status read(s)")
+		print(f"\tconfig writes: first {[hex(r) for r in first_writes]}, repeat {[hex(r) for r in repeat_writes]}")
+		assert first_writes == expected_writes, "config registers written don't match the profile change"
+		assert repeat_writes == [bme_pynq._BME680_REG_CTRL_MEAS], "unchanged config registers were re-written"
+		assert not page_switches, "SPI memory page re-selected although it did not change"
+		assert chip.status_reads <= 3, "status polled too often"
+		assert expected <= elapsed < expected + 0.05, "measurement wait does not track measurement_duration"
+		assert (sample.gas is not None) == run_gas
+		assert -40 < sample.temperature < 85 and 300 < sample.pressure < 1100 and 0 <= sample.humidity <= 100
+
+	chip.fail = True
+	start = time.monotonic()
+	try:
+		sensor.sample()
+		raise AssertionError("a measurement that never completes must raise")
+	except RuntimeError as e:
+		print(f"\ttimeout after {time.monotonic() - start:.3f} s:  {e}")
+	chip.fail = False
+
+
+if __name__ == "__main__":
+	chip = SimulatedBME680()
+	check_sensor('I2C', bme_pynq.Pynq_BME680_I2C(i2c(chip)), chip)
+
+	chip = SimulatedBME680()
+	sensor = bme_pynq.Pynq_BME680_SPI(spi(chip), cs=0)
+	page_writes = sum(1 for reg, _ in chip.writes if reg == 0x73)
+	check_sensor('SPI', sensor, chip)
+	print(f"\tSPI page switches during init: {page_writes}")
+
+	chip = SimulatedBME680()
+	wrapper = bme_pynq.BME680(spi(chip), use_i2c=False)
+	print(f"[BME680 wrapper, SPI]  {wrapper.get_temperature():.2f} C, {wrapper.get_humidity():.2f} %RH, {wrapper.get_voc()} ohms")
+	print("OK")
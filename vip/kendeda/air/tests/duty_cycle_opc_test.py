@@ -0,0 +1,115 @@
+## duty_cycle_opc_test.py
+##
+## On the board:            python3 duty_cycle_opc_test.py
+## Anywhere (no hardware):  python3 duty_cycle_opc_test.py --off-failure
+##   (a simulated OPC whose first power-off command fails must still end up off, with the
+##    extra powered time counted, instead of staying on for the whole idle interval)
+import os
+import sys
+import time
+try:
+    import opc_power
+    from opc_duty import DutyCycledOPC
+except ModuleNotFoundError:
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'air_sensors', 'opcn2'))
+    for root, dirs, files in os.walk('/home/xilinx'):
+        if 'opc_pynq.py' in files:
+            sys.path.append(root)
+    import opc_power
+    from opc_duty import DutyCycledOPC
+
+SAMPLE_INTERVAL=60
+FAN_POWER=None      ## e.g., 128 to sample at a reduced fan speed
+
+
+class SimulatedOPC:
+    """ Stands in for an opc_pynq OPC: power/laser Switches & always-ready, but the power
+    command fails `failed_offs` times before the OPC actually switches off """
+
+    def __init__(self, failed_offs=1, retry_delay=0.2):
+        self.failed_offs = failed_offs
+        self.off_attempts = 0
+        self.power = opc_power.Switch('power', self._power_command, retry_delay=retry_delay)
+        self.laser = opc_power.Switch('laser', lambda on: True)
+        self.powered = False
+
+    def _power_command(self, on):
+        if not on:
+            self.off_attempts += 1
+            if self.off_attempts <= self.failed_offs:
+                return False
+        self.powered = on
+        return True
+
+    def on(self, block=False):
+        self.power.request(True)
+        return self.power.is_on
+
+    def off(self, block=False):
+        self.power.request(False)
+        return not self.power.is_on
+
+    def toggle_laser(self, state, block=False):
+        self.laser.request(state)
+
+    @property
+    def ready(self):
+        return self.power.ready and self.laser.ready
+
+    def histogram_record(self, number_concentration=True):
+        return None     ## No valid periods: each window ends (invalid) after max_periods reads
+
+
+def off_failure_test():
+    opc = SimulatedOPC(failed_offs=1, retry_delay=0.2)
+    duty = DutyCycledOPC(opc, interval=10, lead_time=0, min_periods=1, max_periods=1)
+    sample = duty.sample(poll=0.01)
+    assert opc.powered and opc.off_attempts == 1, "the first off command should have failed"
+    print(f"Window done (on for {sample.on_time:.2f} s); off failed, retrying in {opc.power.retry_delay} s")
+
+    start = time.monotonic()
+    while opc.powered and time.monotonic() - start < 1.0:
+        time.sleep(min(duty.seconds_until_update(), 0.05))
+        duty.update()
+    off_after = time.monotonic() - start
+    print(f"Off after {off_after:.2f} s ({opc.off_attempts} attempts); next window in {duty.seconds_until_next_window():.2f} s")
+    print(f"total_on_time {duty.total_on_time:.2f} s  (window {sample.on_time:.2f} s + {off_after:.2f} s until off)")
+    assert not opc.powered, "the failed power-off was never retried while idle"
+    assert off_after < 2 * opc.power.retry_delay, "the retry waited for the next window instead of the retry delay"
+    assert duty.total_on_time >= sample.on_time + opc.power.retry_delay * 0.9, "time until power-off not counted"
+    print("OK")
+
+
+def main():
+    from pynq.overlays.base import BaseOverlay
+    from opc_pynq import OPC_Arduino
+    base = BaseOverlay('base.bit')
+    opc_arduino = OPC_Arduino(overlay=base)
+    print()
+
+    duty = DutyCycledOPC(opc_arduino, interval=SAMPLE_INTERVAL, fan_power=FAN_POWER)
+
+    print('*'*40)
+    while True:
+        try:
+            sample = duty.sample()
+            print(f"\n\t{time.asctime(time.localtime(sample.timestamp))}")
+            print(f"[arduino]  {'VALID' if sample.valid else 'INVALID'} ({sample.periods} periods, {sample.volume:.1f} ml)")
+            print(f"\tPM1:    {sample.pm[0]}")
+            print(f"\tPM2.5:  {sample.pm[1]}")
+            print(f"\tPM10:   {sample.pm[2]}")
+            print(f"\tOn for {sample.on_time:.1f} s  (duty cycle so far: {100 * duty.duty_cycle:.1f} %)\n")
+            print('_'*40)
+        except KeyboardInterrupt:
+            print("\n< KeyboardInterrupt acknowledged >\n")
+            break 
+
+    print("==>  Closing arduino OPC-N2")
+    opc_arduino.close()
+
+
+if __name__ == '__main__':
+    if '--off-failure' in sys.argv:
+        off_failure_test()
+    else:
+        main()
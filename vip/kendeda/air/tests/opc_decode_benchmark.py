@@ -0,0 +1,69 @@
+## opc_decode_benchmark.py -- Compares the per-byte (legacy) & single-pass histogram decoders of opc_pynq.py
+import os
+import sys
+import struct
+import timeit
+try:
+    import opc_pynq
+except ModuleNotFoundError:
+    for root, dirs, files in os.walk('/home/xilinx'):
+        if 'opc_pynq.py' in files:
+            sys.path.append(root)
+    import opc_pynq
+from opc_pynq import _16bit_unsigned, _calculate_mtof, _calculate_float, _calculate_pressure, _calculate_temp
+
+
+ITERATIONS = 20000
+
+## A well-formed histogram frame: bins 0-15, MToFs, sfr, temperature, period, checksum, PM1/2.5/10
+BINS = [120, 95, 60, 41, 30, 22, 15, 9, 6, 4, 3, 2, 1, 1, 0, 0]
+FRAME = struct.pack('<16H4BfIfH3f', *BINS, 30, 45, 60, 75, 3.712, 253, 2.387, sum(BINS) & 0xFFFF, 1.21, 3.42, 7.96)
+
+
+def legacy_decode(resp, number_concentration=True):
+    """ The decode path of _OPC_Base.histogram() prior to decode_histogram() """
+    d = {}
+    for i in range(16):
+        d[f"bin{i}"] = _16bit_unsigned(resp[2*i], resp[2*i + 1])
+    d['bin1_MToF'] = _calculate_mtof(resp[32])
+    d['bin3_MToF'] = _calculate_mtof(resp[33])
+    d['bin5_MToF'] = _calculate_mtof(resp[34])
+    d['bin7_MToF'] = _calculate_mtof(resp[35])
+    d['sfr'] = _calculate_float(resp[36:40])
+    tmp = _calculate_pressure(resp[40:44])
+    if tmp > 98000:
+        d['temperature'], d['pressure'] = None, tmp
+    else:
+        tmp = _calculate_temp(resp[40:44])
+        d['temperature'], d['pressure'] = (tmp, None) if tmp < 500 else (None, None)
+    d['period'] = _calculate_float(resp[44:48])
+    d['checksum'] = _16bit_unsigned(resp[48], resp[49])
+    d['PM1'] = _calculate_float(resp[50:54])
+    d['PM2.5'] = _calculate_float(resp[54:58])
+    d['PM10'] = _calculate_float(resp[58:])
+    histogram_sum = sum(d[f"bin{i}"] for i in range(16))
+    if (histogram_sum & 0xFFFF) != d['checksum']:
+        return None
+    if number_concentration:
+        _conv_ = d['sfr'] * d['period']
+        for i in range(16):
+            d[f"bin{i}"] /= _conv_
+    return d
+
+
+def time_us(stmt):
+    return timeit.timeit(stmt, number=ITERATIONS) / ITERATIONS * 1e6
+
+
+if __name__ == "__main__":
+    resp = list(FRAME)  ## The legacy path operated on a list of ints
+    legacy = legacy_decode(resp)
+    record = opc_pynq.decode_histogram(FRAME)
+    as_dict = opc_pynq.histogram_to_dict(record)
+    for key, value in legacy.items():
+        assert abs(value - as_dict[key]) < 1e-6 if value is not None else as_dict[key] is None, key
+
+    print(f"Legacy decode (dict):           {time_us(lambda: legacy_decode(resp)):8.2f} us")
+    print(f"decode_histogram (record):      {time_us(lambda: opc_pynq.decode_histogram(FRAME)):8.2f} us")
+    print(f"decode_histogram + dict:        {time_us(lambda: opc_pynq.histogram_to_dict(opc_pynq.decode_histogram(FRAME))):8.2f} us")
+    print(f"PM_STRUCT.unpack (pm() frame):  {time_us(lambda: opc_pynq.PM_STRUCT.unpack(FRAME[50:])):8.2f} us")
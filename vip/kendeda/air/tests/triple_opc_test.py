@@ -5,11 +5,13 @@ import time
 from pynq.overlays.base import BaseOverlay
 try:
     from opc_pynq import OPC_Pmod, OPC_Arduino, OPC_USB 
+    from opc_group import OPCGroup
 except ModuleNotFoundError:
     for root, dirs, files in os.walk('/home/xilinx'):
         if 'opc_pynq.py' in files:
             sys.path.append(root)
     from opc_pynq import OPC_Pmod, OPC_Arduino, OPC_USB 
+    from opc_group import OPCGroup
 
 
 WAIT_FOR_START=False
@@ -23,18 +25,23 @@ print()
 opc_usb = OPC_USB(overlay=base, port="/dev/ttyACM0", wait=WAIT_FOR_START)
 print()
 devices = {'pmod':opc_pmod, 'arduino':opc_arduino, 'usb':opc_usb}
-for device in devices.values():
-    device.on()
-    print()
-    time.sleep(2)
+group = OPCGroup(devices)   ## One worker per OPC, so all three are read concurrently
+group.on()
+print()
+time.sleep(2)
 
 print('*'*40)
 while True:
     try:
         print(f"\n\t{time.asctime(time.localtime())}")
-        for name, device in devices.items():
+        start = time.time()
+        timestamp, readings = group.pm()
+        print(f"\t(read in {time.time() - start:.3f} s, skew {group.skew:.3f} s)")
+        for name, pm in readings.items():
             print(f"[{name}]")
-            pm = device.pm()
+            if pm is None:
+                print("\tREAD FAILED\n")
+                continue
             print(f"\tPM1:    {pm['PM1']}")
             print(f"\tPM2.5:  {pm['PM2.5']}")
             print(f"\tPM10:   {pm['PM10']}\n")
@@ -45,7 +52,6 @@ while True:
         print("\n< KeyboardInterrupt acknowledged >\n")
         break 
 
-for name, device in devices.items():
-    print(f"==>  Closing {name} OPC-N2")
-    device.close()
-    print()
+print(f"==>  Closing OPC-N2s:  {', '.join(devices)}")
+group.close()
+print()
@@ -0,0 +1,172 @@
+## adc_stream.py -- Continuous-mode streaming capture from an ADS1x15 ADC into a ring buffer
+
+import time
+import threading
+from array import array
+
+
+## Value of the ADS1x15 config register MODE bit for continuous conversions; the same in both
+## the Blinka driver (adafruit_ads1x15.ads1x15.Mode) and the PYNQ port (pynq_ads1x15.ads1x15.Mode)
+MODE_CONTINUOUS = 0x0000
+MODE_SINGLE = 0x0100
+
+
+def _forget_last_pin(ads):
+	""" Make the next `ads.read()` rewrite the config register (switching the ADC's mode).
+
+	In continuous mode, both drivers skip the config write when the channel is the one last read.
+	The PYNQ port's mode setter forgets that channel on a mode change, but the Blinka driver's
+	doesn't and it has no public way to, so its private `_last_pin_read` is cleared here (only if
+	the mode setter left it set).
+	"""
+	if getattr(ads, '_last_pin_read', None) is not None:
+		ads._last_pin_read = None
+
+
+class ADCStream():
+	""" Streams one ADS1x15 channel at the ADC's data rate on a background thread.
+
+	The ADC is put in continuous-conversion mode, so after the first read every sample is pulled
+	with the fast pointer-less register read (`get_last_result(True)` inside `ads.read()`).
+	Samples (signed ADC results, as returned by `ads.read`) and their timestamps go into
+	preallocated ring buffers of `capacity` entries. Works with ADS1015/ADS1115 instances from
+	either the Blinka (adafruit_ads1x15) or PYNQ-Microblaze (pynq_ads1x15) I2C backends.
+
+	While running, the stream owns the ADC: any other `ads.read()` (e.g., from an AnalogIn for
+	another channel of the same ADS1x15) raises RuntimeError instead of silently re-muxing the ADC
+	under the stream, and so does starting a second stream on it. stop() restores the ADC's data
+	rate & mode (and its own read()) as they were before start().
+
+	Counters:
+		- overruns: samples overwritten in the ring buffer before being consumed by `read()`
+		- missed:   conversions the ADC produced that the thread was too late to pull
+	"""
+	def __init__(self, ads, pin, is_differential=False, data_rate=None, capacity=4096):
+		self.ads = ads
+		self.pin = pin
+		self.is_differential = is_differential
+		self.data_rate = data_rate if data_rate is not None else ads.data_rate
+		self.capacity = capacity
+		self._values = array('h', bytes(2 * capacity))
+		self._times = array('d', bytes(8 * capacity))
+		self._head = 0 		## Total samples written
+		self._tail = 0 		## Total samples consumed (or overwritten)
+		self.overruns = 0
+		self.missed = 0
+		self._lock = threading.Lock()
+		self._stop = threading.Event()
+		self._thread = None
+		self._read = None 			## The driver's own `ads.read` (bound method) while streaming
+		self._saved = None 			## (data_rate, mode) of the ADC before start()
+
+	@property
+	def running(self):
+		return self._thread is not None and self._thread.is_alive()
+
+	@property
+	def available(self):
+		""" Number of samples buffered but not yet consumed by `read()`. """
+		return self._head - self._tail
+
+	def start(self):
+		if self.running:
+			return
+		if 'read' in vars(self.ads):
+			raise RuntimeError("ADCStream: this ADS1x15 is already being streamed")
+		self._saved = (self.ads.data_rate, self.ads.mode)
+		self.ads.data_rate = self.data_rate
+		self.ads.mode = MODE_CONTINUOUS
+		_forget_last_pin(self.ads)
+		## Shadow the driver's read() on this instance (AnalogIn channels call `ads.read`), so only
+		## the stream thread gets to read the ADC until stop()
+		self._read = self.ads.read
+		self.ads.read = self._refuse_read
+		self._stop.clear()
+		self._thread = threading.Thread(target=self._run, name='ADCStream', daemon=True)
+		self._thread.start()
+
+	def stop(self):
+		if self._thread is not None:
+			self._stop.set()
+			self._thread.join()
+			self._thread = None
+		if self._read is not None:
+			del self.ads.read 		## Back to the driver's own read()
+			self._read = None
+		if self._saved is not None:
+			self.ads.data_rate, self.ads.mode = self._saved 	## Usually single-shot: powered down between conversions
+			_forget_last_pin(self.ads)
+			self._saved = None
+
+	def _refuse_read(self, pin, is_differential=False):
+		raise RuntimeError("ADCStream: the ADS1x15 is streaming; stop() the stream before reading other channels")
+
+	def _run(self):
+		period = 1.0 / self.data_rate
+		## The first read selects the channel & waits for its first conversion; all later reads are fast
+		self._push(self._read(self.pin, is_differential=self.is_differential), time.monotonic())
+		next_t = time.monotonic() + period
+		while not self._stop.is_set():
+			delay = next_t - time.monotonic()
+			if delay > 0:
+				time.sleep(delay)
+			value = self._read(self.pin, is_differential=self.is_differential)
+			now = time.monotonic()
+			late = int((now - next_t) / period)
+			if late > 0:
+				## Fell behind by whole conversion periods: those results were overwritten in the ADC
+				self.missed += late
+				next_t += late * period
+			next_t += period
+			self._push(value, now)
+
+	def _push(self, value, timestamp):
+		with self._lock:
+			i = self._head % self.capacity
+			self._values[i] = value
+			self._times[i] = timestamp
+			self._head += 1
+			if self._head - self._tail > self.capacity:
+				self.overruns += 1
+				self._tail = self._head - self.capacity
+
+	def read(self, max_samples=None):
+		""" Consume the buffered samples (oldest first), returning (values, timestamps) as arrays.
+		Timestamps are from time.monotonic().
+		"""
+		with self._lock:
+			count = self._head - self._tail
+			if max_samples is not None:
+				count = min(count, max_samples)
+			start = self._tail % self.capacity
+			end = start + count
+			if end <= self.capacity:
+				values = self._values[start:end]
+				times = self._times[start:end]
+			else:
+				end -= self.capacity
+				values = self._values[start:] + self._values[:end]
+				times = self._times[start:] + self._times[:end]
+			self._tail += count
+		return values, times
+
+	def read_numpy(self, max_samples=None):
+		""" Same as `read`, but returns NumPy arrays (int16 values, float64 timestamps). """
+		import numpy as np
+		values, times = self.read(max_samples)
+		return np.frombuffer(values, dtype=np.int16), np.frombuffer(times, dtype=np.float64)
+
+	def latest(self):
+		""" The most recent sample as (value, timestamp), without consuming anything. """
+		with self._lock:
+			if self._head == 0:
+				return None, None
+			i = (self._head - 1) % self.capacity
+			return self._values[i], self._times[i]
+
+	def __enter__(self):
+		self.start()
+		return self
+
+	def __exit__(self, *exc):
+		self.stop()
@@ -0,0 +1,54 @@
+## crc.py -- Table-driven CRCs shared by the sensor drivers
+
+import struct
+
+##------------------------------------------------------------------------------
+## Sensirion CRC-8 (SGP30, SHT3x, SCD30, SPS30, ...): polynomial 0x31 (x^8 + x^5 + x^4 + 1), init 0xFF,
+## computed over each 16-bit data word, which is sent as [MSB, LSB, CRC]
+
+SENSIRION_CRC8_POLYNOMIAL = 0x31
+SENSIRION_CRC8_INIT = 0xFF
+
+
+def crc8_table(polynomial):
+	""" 256-entry lookup table for an MSB-first CRC-8 with the given polynomial """
+	table = bytearray(256)
+	for i in range(256):
+		crc = i
+		for _ in range(8):
+			crc = ((crc << 1) ^ polynomial) & 0xFF if crc & 0x80 else (crc << 1) & 0xFF
+		table[i] = crc
+	return bytes(table)
+
+
+SENSIRION_CRC8_TABLE = crc8_table(SENSIRION_CRC8_POLYNOMIAL)
+
+
+def sensirion_crc8(data, crc=SENSIRION_CRC8_INIT):
+	""" Sensirion CRC-8 of the bytes in `data` """
+	table = SENSIRION_CRC8_TABLE
+	for b in data:
+		crc = table[crc ^ b]
+	return crc
+
+
+def sensirion_word(value):
+	""" The 3 bytes [MSB, LSB, CRC] sent for the 16-bit `value` """
+	msb, lsb = (value >> 8) & 0xFF, value & 0xFF
+	return bytes((msb, lsb, SENSIRION_CRC8_TABLE[SENSIRION_CRC8_TABLE[SENSIRION_CRC8_INIT ^ msb] ^ lsb]))
+
+
+_WORD_STRUCTS = {}
+
+def sensirion_words(buf, num_words):
+	""" Check & unpack `num_words` [MSB, LSB, CRC] triplets from `buf` into a tuple of 16-bit words.
+	Raises RuntimeError on a CRC mismatch.
+	"""
+	unpacker = _WORD_STRUCTS.get(num_words)
+	if unpacker is None:
+		unpacker = _WORD_STRUCTS[num_words] = struct.Struct('>' + 'Hx' * num_words)
+	table = SENSIRION_CRC8_TABLE
+	for i in range(0, 3 * num_words, 3):
+		if table[table[SENSIRION_CRC8_INIT ^ buf[i]] ^ buf[i + 1]] != buf[i + 2]:
+			raise RuntimeError("CRC Error")
+	return unpacker.unpack_from(buf)
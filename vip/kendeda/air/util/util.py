@@ -7,7 +7,7 @@ import math
 # import board
 from urllib import request
 import subprocess as sp
-from statistics import mean 
+from bisect import bisect_right
 from datetime import datetime
 """  **Removed the following to avoid coupling & cyclical imports:
 try:
@@ -33,6 +33,7 @@ DRY_RUN = False #True  ## Data will only be published to InfluxDB if this is Fal
 REQUIRE_INTERNET = True  ## Set to False if a connection to the backend is not required
 DISPLAY_TEST_MENU = False #True  	 ## For enabling the user to select a test to be run
 USE_TEMP_COEFFICIENT = True  ## Compensate for temperature skew to improve reading accuracies
+INTERPOLATE_NT = False  	 ## Use piecewise-linear interpolation of the Alphasense nT tables instead of a best-fit line
 HAVE_NO2_AND_OX = True  	 ## True if this circuit/node incorporates both a NO2-B43F & OX-B431
 INCLUDE_VOC = True 
 INCLUDE_ECO2 = True
@@ -40,6 +41,8 @@ SHOW_DATETIME = True #False
 BME_USE_I2C = True 		## Else, will use SPI
 STABILIZE_HUMIDITY = True   ## Initialization option for the BME680
 INCLUDE_MQ7_CO = False
+MQ7_RO_FILE = os.path.join(os.environ['HOME'], "mq7_ro.json") 	## Calibrated Ro per MQ7 (by ADC address & channel), loaded at start-up
+MQ7_RECALIBRATE = True 	## Keep refining the cached Ro from stable clean-air windows of regular reads
 INCLUDE_AIR_PUMP = True   ## Only True if controlling an air pump with a relay (using Grove relay breakout for testing)
 
 ## TODO: Create map that describes what sensors to use in air_node.py
@@ -51,6 +54,21 @@ AIR_PUMP_PIN = 26  ## BCM pin number of the GPIO driving the air pump's relay
 
 ERROR_LOGFILE = os.path.join(os.environ['HOME'], "node_errors.log")
 
+ARCHIVE_RAW_ISB = False 	## Also record the raw WE/AE signals behind every ISB reading (for offline recalibration)
+RAW_ARCHIVE_DIR = os.path.join(os.environ['HOME'], "isb_raw")
+RAW_ARCHIVE_FLUSH_EVERY = 20 	## Records buffered in memory before each write to the archive file
+RAW_ARCHIVE_CHUNK_SIZE = 1 << 20  ## Records per vectorized chunk when reprocessing an archive
+
+ISB_DIFFERENTIAL = False 	## Read each ISB's WE - AE with one differential ADC conversion (WE/AE on pins (0,1) or (2,3))
+ISB_AE_REFRESH = 10 	## In differential mode, # of ISB readings between single-ended AE reads (for the nT term)
+
+SGP_SERVICE = True 	## Run the SGP30 at its expected 1 Hz on a background thread (readings become instant snapshots)
+SGP_BASELINE_FILE = os.path.join(os.environ['HOME'], "sgp30_baseline.json") 	## IAQ baselines checkpointed/restored across restarts
+
+PUBLISH_PM_HISTOGRAM = True 	## Also publish the OPC-N2's 16 bins & their mass concentrations (as one multi-field point)
+PM_PARTICLE_DENSITY = 1.65 	## Assumed particle density (g/cm^3) for histogram mass concentrations
+PM_KAPPA = 0.3 	## Particle hygroscopicity for the RH correction of mass concentrations (0 disables it)
+
 ##------------------------------------------------------------------------------
 
 ADC_I2C_ADDR0 = 0x48 	## ADDR pin -> GND (Default ADS1x15 I2C address, can be overridden using ADDR pin)
@@ -153,11 +171,45 @@ def map_voltage_to_percent(voltage, v_min=0, v_max=5, out_min=0, out_max=100):
 
 
 def best_fit_slope_and_intercept(xs, ys):
-	m = (float(((mean(xs)*mean(ys)) - mean(xs*ys))) / float(((mean(xs)*mean(xs)) - mean(xs*xs))))
-	b = mean(ys) - m*mean(xs)
+	""" Least-squares line through the points (xs, ys), returned as (slope, intercept).
+	Computed about the means of xs & ys (rather than from raw sums of squares) for accuracy.
+	"""
+	xs = [float(x) for x in xs]
+	ys = [float(y) for y in ys]
+	x_bar = sum(xs) / len(xs)
+	y_bar = sum(ys) / len(ys)
+	sxy = sum((x - x_bar) * (y - y_bar) for x, y in zip(xs, ys))
+	sxx = sum((x - x_bar) ** 2 for x in xs)
+	m = sxy / sxx
+	b = y_bar - m*x_bar
 	return m, b
 
 
+def piecewise_linear_segments(xs, ys):
+	""" Precompute the per-segment slopes & intercepts for linearly interpolating the
+	table (xs, ys), where xs is sorted ascending. Returns (xs, slopes, intercepts) as tuples
+	such that segment i covers [xs[i], xs[i+1]] and evaluates as slopes[i]*x + intercepts[i].
+	"""
+	xs = tuple(float(x) for x in xs)
+	ys = tuple(float(y) for y in ys)
+	slopes = tuple((ys[i+1] - ys[i]) / (xs[i+1] - xs[i]) for i in range(len(xs) - 1))
+	intercepts = tuple(ys[i] - slopes[i]*xs[i] for i in range(len(xs) - 1))
+	return xs, slopes, intercepts
+
+
+def interpolate_segments(x, segments):
+	""" Evaluate a table precomputed by `piecewise_linear_segments` at x.
+	Values of x outside the table are clamped to its end points. 
+	"""
+	xs, slopes, intercepts = segments
+	if x <= xs[0]:
+		x = xs[0]
+	elif x >= xs[-1]:
+		x = xs[-1]
+	i = min(bisect_right(xs, x), len(slopes)) - 1
+	return slopes[i]*x + intercepts[i]
+
+
 def get_datetime():
 	dt = datetime.now()
 	hr = dt.hour
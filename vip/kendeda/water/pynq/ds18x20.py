@@ -94,10 +94,15 @@ class DS18X20:
 	def rom_id(self):
 		return self._address.rom
 
+	@property
+	def needs_refresh(self):
+		"""True if the last temperature read is older than TEMP_REFRESH_TIMEOUT (or there is none)."""
+		return self._last_read_temp is None or (time.monotonic() - self._last_read_time) >= TEMP_REFRESH_TIMEOUT
+
 	@property
 	def temperature(self):
 		"""The temperature in degrees Celsius."""
-		if self._last_read_temp is None or (time.monotonic() - self._last_read_time) >= TEMP_REFRESH_TIMEOUT:
+		if self.needs_refresh:
 			assert(self._convert_temp())
 			self._last_read_temp = self._read_temp()
 			# self._last_read_time = time.monotonic()
@@ -174,13 +179,14 @@ class DS18X20:
 		return t / 16
 		"""
 
-		assert(self._read_scratch())
-		"""
-		t_lo = self._device.read(const.bram_registers['RD_DATA0'])
-		t_hi = self._device.read(const.bram_registers['RD_DATA1'])
-		raw_temp = (t_hi << 32) + t_lo 
-		"""
-		temp_raw = self._device.read(const.bram_registers['RD_DATA0'])
+		with self._device.lock:
+			assert(self._read_scratch())
+			"""
+			t_lo = self._device.read(const.bram_registers['RD_DATA0'])
+			t_hi = self._device.read(const.bram_registers['RD_DATA1'])
+			raw_temp = (t_hi << 32) + t_lo 
+			"""
+			temp_raw = self._device.read(const.bram_registers['RD_DATA0'])
 		self._last_read_time = time.monotonic()
 		return celsius_from_raw(temp_raw) 
 
@@ -196,14 +202,9 @@ class DS18X20:
 			dev.write_command(eeprom_commands['SCRATCH_RD'])
 			dev.write(const.bram_registers['RD_SIZE'], SCRATCH_RD_SIZE)
 			dev.write_control(const.bus_commands['RD_TIME_SLOTS'])
-			count = 0
-			while dev.status & const.bitmasks['STA_RDD'] == 0:
-				count += 1
-				if count > 20:
-					print('Scratchpad Read Error')
-					return False
-				# timeout()
-				time.sleep(RW_TIME)
+			if dev.wait_for_status(const.bitmasks['STA_RDD'], delay=SCRATCH_RD_SIZE * const.TIMESLOT) & const.bitmasks['STA_RDD'] == 0:
+				print('Scratchpad Read Error')
+				return False
 		return True
 
 
@@ -217,3 +218,30 @@ class DS18X20:
 		(assumes that the conversion has completed)."""
 		return self._read_temp()
 
+
+###################################################################################################
+
+def convert_all(bus, sensors):
+	"""
+	Temperatures (in degrees Celsius) of all `sensors` on `bus`, in order, for the cost of ONE conversion:
+	a single SKIP ROM [CCh] + CONVERT T [44h] starts every DS18X20 on the bus converting at once, then
+	(after the longest of the sensors' conversion delays) each sensor's scratchpad is read back.
+
+	Sensors read within TEMP_REFRESH_TIMEOUT are not converted again; if the broadcast fails, each
+	sensor falls back to its own (addressed) conversion.
+	"""
+	if not any(sensor.needs_refresh for sensor in sensors):
+		return [sensor.temperature for sensor in sensors]
+
+	with bus.lock:
+		if bus.skip_rom():
+			bus.write_command(eeprom_commands['CONVT_TEMP'])
+			bus.write_control(const.bus_commands['EXEC_W_PULLUP'])
+			time.sleep(max(sensor.conversion_delay for sensor in sensors))
+			if bus.read_status() == const.bitmasks['STA_CMD']:
+				for sensor in sensors:
+					sensor._last_read_temp = sensor._read_temp()
+				return [sensor._last_read_temp for sensor in sensors]
+
+	print('[convert_all] Broadcast CONVERT T failed; converting each sensor individually')
+	return [sensor.temperature for sensor in sensors]
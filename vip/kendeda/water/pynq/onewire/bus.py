@@ -1,16 +1,50 @@
 import os
+import json
 import time
+import threading
 from pynq import MMIO, Clocks
 from pynq.overlays.base import BaseOverlay
 from . import constants as const
 
 ###################################################################################################
 
-def timeout(ticks=256):		## timeout for 256 ticks == ~0.01 second delay
-	for c in range(1, ticks):
-		for d in range(1, ticks):
-			pass
-	return
+def wait_for(condition, timeout, delay=0.0):
+	"""
+	Poll `condition()` until it returns a truthy value or `timeout` seconds have passed (on the monotonic clock).
+	The first poll comes after `delay` seconds (e.g., the expected bus time of the operation being waited on);
+	between later polls, the sleep backs off from POLL_INTERVAL_MIN, doubling up to POLL_INTERVAL_MAX.
+	Returns the last value of `condition()`.
+	"""
+	deadline = time.monotonic() + timeout
+	if delay > 0:
+		time.sleep(delay)
+	interval = const.POLL_INTERVAL_MIN
+	while True:
+		result = condition()
+		remaining = deadline - time.monotonic()
+		if result or remaining <= 0:
+			return result
+		time.sleep(min(interval, remaining))
+		interval = min(interval * 2, const.POLL_INTERVAL_MAX)
+
+def _make_crc8_table():
+	table = []
+	for i in range(256):
+		crc = i
+		for _ in range(8):
+			crc = (crc >> 1) ^ 0x8C if crc & 1 else crc >> 1
+		table.append(crc)
+	return bytes(table)
+
+_CRC8_TABLE = _make_crc8_table()
+
+
+def crc8(data):
+	""" Dallas/Maxim 1-Wire CRC8 (x^8 + x^5 + x^4 + 1, LSB first, init 0) of `data`, as sent after ROM codes & scratchpads. """
+	crc = 0
+	for b in data:
+		crc = _CRC8_TABLE[crc ^ b]
+	return crc
 
 ###################################################################################################
 
@@ -94,7 +128,10 @@ class OneWireBus:
 			self.axi_addr = base_addr
 			self.axi_range = addr_range 
 			self.bram = MMIO(base_addr, addr_range)
-			self.device_addresses = [None]
+			self.devices = {} 		## ROM code -> OneWireAddress of every device discovered so far
+			self.lock = threading.RLock() 	## Held for each complete bus transaction (e.g., by a OneWireDevice's `with` block)
+			self._rescan_thread = None
+			self._rescan_stop = threading.Event()
 
 			OneWireBus.num_roms = 0
 			OneWireBus.set_clk()		## Set the PL function clock tied to the ow_master IP to 33 MHz
@@ -110,6 +147,11 @@ class OneWireBus:
 		return self.__bus_initialized
 
 
+	@property
+	def device_addresses(self):
+		return list(self.devices.values())
+
+
 	@staticmethod
 	def initialized():
 		return OneWire.__bus_initialized
@@ -147,6 +189,17 @@ class OneWireBus:
 		return self.read(const.bram_registers['STATUS'])
 
 
+	def wait_for_status(self, mask, timeout=const.STATUS_TIMEOUT, delay=0.0):
+		""" Wait (see `wait_for`) until any bit of `mask` is set in the status register. Returns the last status read. """
+		status = 0
+		def done():
+			nonlocal status
+			status = self.read_status()
+			return status & mask
+		wait_for(done, timeout, delay)
+		return status
+
+
 	def read_num_found_roms(self):
 		return self.read(const.bram_registers['FOUND'])
 
@@ -176,15 +229,9 @@ class OneWireBus:
 		"""
 
 		self.write_control(const.bus_commands['RESET_PULSE'])
-		r_status = self.read_status() & const.bitmasks['STA_RSD']
-		count = 0
-		while r_status == 0:
-			r_status = self.read_status() & const.bitmasks['STA_RSD']
-			count += 1
-			if count > 20:
-				print('No presence pulse detected thus no devices on the bus!')
-				return False
-			timeout()
+		if self.wait_for_status(const.bitmasks['STA_RSD'], delay=const.RESET_TIMESLOTS * const.TIMESLOT) & const.bitmasks['STA_RSD'] == 0:
+			print('No presence pulse detected thus no devices on the bus!')
+			return False
 		return True
 		
 ## ---------------------------------------------------------------------------------------------
@@ -197,50 +244,46 @@ class OneWireBus:
 		The master learns the ROM codes through a process of elimination that requires the master to perform
 		a Search ROM cycle as many times as necessary to identify all of the slave devices.
 
-		Returns the count of all device IDs discovered on the bus.
+		Returns the addresses (as OneWireAddress objects) of the devices found by this search, or None on error
+		(including a search that did not complete within SEARCH_TIMEOUT).
 
 		This function has been configured so that an ALARM SEARCH [ECh] command and an alarms_array may
 		be passed in to only collect ROMs of slaves with a set alarm flag.
 		"""
+		with self.lock:
+			return self._search(search_cmd)
 
-		while OneWireBus.search_complete == False:
-			print('.', end='')
-			timeout()
+
+	def _search(self, search_cmd):
+		if not wait_for(lambda: OneWireBus.search_complete, const.SEARCH_TIMEOUT):
+			print('[OneWireBus.search]\tTimed out waiting for the previous search to complete')
 		OneWireBus.search_complete = False		## Lock the bus while performing search
 
 		## Write search command to the command register, then serialize onto the bus to begin search
 		self.write_command(search_cmd)
 		self.serialize_command()
 
-		r_status = self.read_status()
+		r_status = self.wait_for_status(const.bitmasks['STA_SRD'], timeout=const.SEARCH_TIMEOUT)
 		# print(f"r_status = {hex(r_status)}")
-		x = r_status & const.bitmasks['STA_SRD']
-		miss_count = 0
-		while x != 1 and miss_count < 30:
-			r_status = self.read_status()
-			# print(f"r_status = {hex(r_status)}")
-			x = r_status & const.bitmasks['STA_SRD']
-			timeout()
-			miss_count += 1
-
-		if r_status & const.bitmasks['STA_SER']:
+
+		if not r_status & const.bitmasks['STA_SRD']:
+			## FOUND would be empty or left over from an earlier search, so report no result at all
+			print('SEARCH TIMEOUT : SEARCH DID NOT COMPLETE WITHIN {} s\n'.format(const.SEARCH_TIMEOUT))
+			OneWireBus.search_complete = True
+			return None
+		elif r_status & const.bitmasks['STA_SER']:
 			print('SEARCH PROTOCOL ERROR : SEARCH INCOMPLETE DUE TO ONE WIRE PROTOCOL ERROR\n')
+			OneWireBus.search_complete = True
 			return None
 		elif r_status & const.bitmasks['STA_SME']:
 			print('SEARCH MEMORY ERROR : NOT ENOUGH FPGA MEMORY ALLOCATED FOR # of OW DEVICES FOUND\n')
+			OneWireBus.search_complete = True
 			return None
 
 		self.num_roms = self.read_num_found_roms()
 		print(f'# ROMS FOUND = {self.num_roms}')
 
-		# new_size = self.num_roms * 2
-		# if new_size > self.ROMAD_SIZE:
-		# 	self.ROMAD_SIZE = new_size
-		# self.device_addresses = [0] * self.ROMAD_SIZE 
-		# self.device_addresses = [None] * self.num_roms
-		if self.num_roms > len(self.device_addresses):
-			self.device_addresses.extend([None] * (self.num_roms - len(self.device_addresses)))
-
+		found = []
 		for i in range(self.num_roms):
 			rom_lo = self.read((const.bram_registers['ROM_ID0'] + (i << 3)))
 			rom_hi = self.read((const.bram_registers['ROM_ID1'] + (i << 3)))
@@ -252,27 +295,18 @@ class OneWireBus:
 			# new_device = SensorClass(rom_hi, rom_lo, onewire_index=index)
 			# yield new_device
 
-			discovered_new_rom = True
-			# if self.device_addresses[i] is not None and self.device_addresses[i].rom == rom_long:
-			for device in self.device_addresses:
-				if device is not None and device.rom == rom_long:
-					## Device has already been discovered on bus
-					print(f"[OneWireBus.search]\tRe-discovered ROM:  {hex(rom_long)}")
-					discovered_new_rom = False
-					break 
-			
-			if discovered_new_rom:
-				new_device = OneWireAddress(rom_long)
-				print(f"[OneWireBus.search]\tDiscovered new device ROM on bus:  {new_device}")
-				j = i 
-				while j < len(self.device_addresses) and self.device_addresses[j] is not None:
-					j += 1
-				self.device_addresses[j%len(self.device_addresses)] = new_device 
+			device = self.devices.get(rom_long)
+			if device is not None:
+				## Device has already been discovered on bus
+				print(f"[OneWireBus.search]\tRe-discovered ROM:  {hex(rom_long)}")
+			else:
+				device = self.devices[rom_long] = OneWireAddress(rom_long)
+				print(f"[OneWireBus.search]\tDiscovered new device ROM on bus:  {device}")
+			found.append(device)
 
 		OneWireBus.search_complete = True 		## Unlock the 1-Wire bus after search is completed
 
-		# return list(self.device_addresses)
-		return [addr for addr in self.device_addresses if addr is not None]		
+		return found
 
 
 	def match_rom(self, address):
@@ -283,21 +317,148 @@ class OneWireBus:
 		issued by the master; all other slaves on the bus will wait for a reset pulse.
 		"""
 		assert(isinstance(address, OneWireAddress))
-		self.reset()
+		if not self.reset():
+			return False
 		self.write_command(const.bus_commands['MATCH_ROM'])
 		self.write(const.bram_registers['WR_SIZE'], const.TRANSMIT_BITS)
 		self.write(const.bram_registers['WR_DATA0'], address.rom_lo)
 		self.write(const.bram_registers['WR_DATA1'], address.rom_hi)
 		self.write_control(const.bus_commands['EXEC_WO_PULLUP'])
-		count = 0
-		while self.read_status() & const.bitmasks['STA_WRD'] == 0:
-			count += 1
-			if (count > 20):
-				print('[match_rom] Desired ROM address not matched')
-				return False
-			timeout()
+		## MATCH ROM command byte + the 64-bit ROM code
+		if self.wait_for_status(const.bitmasks['STA_WRD'], delay=(8 + const.TRANSMIT_BITS) * const.TIMESLOT) & const.bitmasks['STA_WRD'] == 0:
+			print('[match_rom] Desired ROM address not matched')
+			return False
+		return True 
+
+
+	def skip_rom(self):
+		"""
+		SKIP ROM [CCh]
+		The skip ROM command addresses all slave devices on the bus simultaneously, without sending
+		any ROM codes; the following function command (e.g., a CONVERT T) is then executed by all of them.
+		"""
+		if not self.reset():
+			return False
+		self.write_command(const.bus_commands['SKIP_ROM'])
+		self.write_control(const.bus_commands['EXEC_WO_PULLUP'])
+		if self.wait_for_status(const.bitmasks['STA_CMD'], delay=8 * const.TIMESLOT) & const.bitmasks['STA_CMD'] == 0:
+			print('[skip_rom] SKIP ROM command not completed')
+			return False
 		return True 
 
+## ---------------------------------------------------------------------------------------------
+
+	@staticmethod
+	def load_rom_cache(cache_file=const.ROM_CACHE_FILE):
+		""" The device addresses saved in `cache_file` by save_rom_cache() (empty if there are none). """
+		try:
+			with open(cache_file) as f:
+				return [OneWireAddress(int(rom, 16)) for rom in json.load(f)['roms']]
+		except (OSError, ValueError, KeyError, TypeError):
+			return []
+
+
+	def save_rom_cache(self, cache_file=const.ROM_CACHE_FILE, addresses=None):
+		""" Save the ROM codes of `addresses` (default: all discovered devices) to `cache_file` (atomically). """
+		if addresses is None:
+			addresses = self.device_addresses
+		tmp_file = cache_file + '.tmp'
+		try:
+			with open(tmp_file, 'w') as f:
+				json.dump({'roms': [hex(addr.rom) for addr in addresses], 'timestamp': time.time()}, f, indent=2)
+			os.replace(tmp_file, cache_file)
+		except OSError as e:
+			print(f"[OneWireBus.save_rom_cache]\tCould not write '{cache_file}': {e}")
+
+
+	def read_scratchpad(self, address):
+		"""
+		READ SCRATCHPAD [BEh] of the (DS18X20) device at `address`: its 9 scratchpad bytes, the last being
+		the CRC8 of the other 8, or None if the read did not complete.
+		"""
+		with self.lock:
+			if not self.match_rom(address):
+				return None
+			self.write_command(const.READ_SCRATCHPAD)
+			self.write(const.bram_registers['RD_SIZE'], const.SCRATCHPAD_BITS)
+			self.write_control(const.bus_commands['RD_TIME_SLOTS'])
+			if self.wait_for_status(const.bitmasks['STA_RDD'], delay=(8 + const.SCRATCHPAD_BITS) * const.TIMESLOT) & const.bitmasks['STA_RDD'] == 0:
+				return None
+			## Bits arrive LSB first, so byte 0 is the low byte of RD_DATA0
+			return (self.read(const.bram_registers['RD_DATA0']).to_bytes(4, 'little')
+					+ self.read(const.bram_registers['RD_DATA1']).to_bytes(4, 'little')
+					+ bytes([self.read(const.bram_registers['RD_DATA2']) & 0xFF]))
+
+
+	def verify(self, address):
+		"""
+		Presence check of one known device: its scratchpad (MATCH ROM + READ SCRATCHPAD) must pass its CRC8.
+		MATCH ROM alone can't tell, as it completes as long as ANY device answered the reset; a missing device
+		leaves the bus reading all ones (and a shorted bus all zeros, which would pass the CRC), so both are rejected.
+		"""
+		data = self.read_scratchpad(address)
+		if data is None or not any(data) or data.count(0xFF) == len(data):
+			return False
+		return crc8(data[:8]) == data[8]
+
+
+	def discover(self, cache_file=const.ROM_CACHE_FILE, verify=None):
+		"""
+		The addresses of the devices on the bus, preferably without a full SEARCH ROM: the ROM codes cached
+		by a previous discover() are verified with `verify(address)` (default: scratchpad CRC checks), and
+		only if there are none, or any of them fails, does a search() run (and its results get cached).
+		"""
+		verify = verify or self.verify
+		cached = self.load_rom_cache(cache_file) if cache_file else []
+		if cached and all(verify(addr) for addr in cached):
+			for addr in cached:
+				self.devices.setdefault(addr.rom, addr)
+			print(f"[OneWireBus.discover]\tVerified {len(cached)} cached ROM(s); skipping search")
+			return [self.devices[addr.rom] for addr in cached]
+
+		found = self.search()
+		if found is None:
+			return []
+		if cache_file:
+			self.save_rom_cache(cache_file, found)
+		return found
+
+
+	def start_rescan(self, interval=const.RESCAN_INTERVAL, cache_file=const.ROM_CACHE_FILE, on_change=None):
+		"""
+		Re-run a full search() every `interval` seconds on a background thread (holding the bus lock only
+		during the search itself), to pick up devices added to (or removed from) the bus after discover().
+		When the set of found ROMs changes (not just their discovery order), the cache is updated and
+		`on_change(addresses)` is called. Failed or timed-out searches are ignored.
+		"""
+		if self._rescan_thread is not None and self._rescan_thread.is_alive():
+			return
+		self._rescan_stop.clear()
+
+		def rescan():
+			known = {addr.rom for addr in self.device_addresses}
+			while not self._rescan_stop.wait(interval):
+				found = self.search()
+				if found is None:
+					continue
+				roms = {addr.rom for addr in found}
+				if roms == known:
+					continue
+				known = roms
+				if cache_file:
+					self.save_rom_cache(cache_file, found)
+				if on_change is not None:
+					on_change(found)
+
+		self._rescan_thread = threading.Thread(target=rescan, name="OneWireRescan", daemon=True)
+		self._rescan_thread.start()
+
+
+	def stop_rescan(self):
+		self._rescan_stop.set()
+		if self._rescan_thread is not None:
+			self._rescan_thread.join(timeout=const.SEARCH_TIMEOUT + 1)
+
 ## ---------------------------------------------------------------------------------------------
 
 # if __name__ == "__main__":
@@ -19,11 +19,23 @@ CLK_MHZ = 33.33333	## required CPU clock scaling for 1-Wire master
 TIMESLOT = 0.00006  	## 1 timeslot == 60 micro seconds
 ## ^ 1 bit of data is transmitted over the bus per each timeslot
 
+## Status register polling (waits run on the monotonic clock, sleeping between polls):
+POLL_INTERVAL_MIN = TIMESLOT 		## First re-poll after one timeslot ...
+POLL_INTERVAL_MAX = 64 * TIMESLOT 	## ... then backing off (doubling) up to ~4 ms between polls
+RESET_TIMESLOTS = 16 				## Reset pulse (8 timeslots) + presence pulse window (8 timeslots)
+STATUS_TIMEOUT = 0.2 	## Seconds for a reset / ROM command / scratchpad read to complete
+SEARCH_TIMEOUT = 0.3 	## Seconds for a full SEARCH ROM to complete
+
 TRANSMIT_BITS = 0x40  	## 64-bits to transmit over the bus
+READ_SCRATCHPAD = 0xBE 	## DS18X20 function command: read the 9-byte scratchpad (8 data bytes + CRC8)
+SCRATCHPAD_BITS = 0x48 	## 72 bits read back by READ SCRATCHPAD
 # SCRATCH_RD_SIZE = 0x48  ## read in 72 bits from scratch reg
 
 MAX_DEV = 10 	## Maximimum number of devices the bus will scan for. Valid range is 1 to 255.
 
+ROM_CACHE_FILE = os.path.join(os.path.expanduser('~'), 'onewire_roms.json') 	## ROM codes found by the last search
+RESCAN_INTERVAL = 3600 	## Seconds between background searches for devices added to / removed from the bus
+
 ###################################################################################################
 
 bus_commands = { 
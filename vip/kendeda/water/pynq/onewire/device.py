@@ -24,13 +24,21 @@ class OneWireDevice:
 		self.write_command = self._bus.write_command
 		self.write_control = self._bus.write_control
 		self.read = self._bus.read
+		self.wait_for_status = self._bus.wait_for_status
+		self.lock = self._bus.lock
 		
 
 	def __enter__(self):
-		self._select_rom()
+		self.lock.acquire() 	## The bus is held for the whole transaction (ROM select + function command)
+		try:
+			self._select_rom()
+		except BaseException:
+			self.lock.release()
+			raise
 		return self
 
 	def __exit__(self, *exc):
+		self.lock.release()
 		return False
 
 	@property
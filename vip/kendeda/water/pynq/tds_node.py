@@ -4,7 +4,7 @@ import signal
 import statistics
 
 from onewire.bus import OneWireBus
-from ds18x20 import DS18X20
+from ds18x20 import DS18X20, convert_all
 from tds_pynq import TDS
 
 
@@ -24,13 +24,13 @@ class TDS_Node:
 		## Get the TDS sensor
 		self.tds_sensor = TDS(tds_sensor_pin, overlay)
 
-		## Search the OneWire bus for all found temperature sensors (either DS18B20 or DS18S20 sensors)
-		## (bus.search() returns a list of device addresses, represented as OneWireAddress objects)
+		## Find all temperature sensors (either DS18B20 or DS18S20 sensors) on the OneWire bus
+		## (bus.discover() returns a list of device addresses, represented as OneWireAddress objects;
+		##  ROMs cached by the last start-up are only verified, with a full search only if that fails)
 		## (see: https://github.com/VicerExciser/PYNQ-OneWire/blob/master/onewire/bus.py#L22)
 		self.temp_sensors = []
-		for device_address in self.bus.search():
-			found_device = DS18X20(self.bus, device_address)
-			self.temp_sensors.append(found_device)
+		self.update_temp_sensors(self.bus.discover())
+		self.bus.start_rescan(on_change=self.update_temp_sensors) 	## Periodically search for added/removed sensors
 
 		if len(self.temp_sensors) == 0:
 			print("[TDS_Node]  ERROR: No temperature sensors found on the 1-Wire bus!")
@@ -41,13 +41,19 @@ class TDS_Node:
 		signal.signal(signal.SIGTERM, self.handle_signal)
 		
 
+	def update_temp_sensors(self, addresses):
+		""" Use the sensors at `addresses` (keeping the DS18X20 instances of sensors already known). """
+		known = {sensor.rom_id: sensor for sensor in self.temp_sensors}
+		self.temp_sensors = [known.get(address.rom) or DS18X20(self.bus, address) for address in addresses]
+
+
 	def get_temperature(self):
 		if len(self.temp_sensors) == 0:
 			## TODO: Handle case where no temperature sensors were found
 			EXAMPLE_DEFAULT_TEMP_FOR_TDS_COMPENSATION = 20.0
 			return EXAMPLE_DEFAULT_TEMP_FOR_TDS_COMPENSATION
 
-		temps = [sensor.temperature for sensor in self.temp_sensors]   ## List of all temperature readings
+		temps = convert_all(self.bus, self.temp_sensors)   ## List of all temperature readings (one conversion period for all sensors)
 		avg_temp = statistics.mean(temps)
 		return round(avg_temp, 4)   ## Return the average temperature read from all sensors, rounded to 4 decimals
 
@@ -74,6 +80,7 @@ class TDS_Node:
 		print(f"\n < signal received ({signum}) > \n")
 		## TODO: Take care of / clean up anything necessary here before exiting program
 		## ...
+		self.bus.stop_rescan()
 		sys.exit(0)
 
 